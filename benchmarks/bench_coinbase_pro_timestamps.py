@@ -0,0 +1,74 @@
+"""
+Benchmark parsing Coinbase Pro timestamps, strptime vs fixed-format parser
+
+Usage: python benchmarks/bench_coinbase_pro_timestamps.py [--rows 1000000]
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import datetime
+import random
+import time
+
+import carlcsaposs.calculate_eth_taxes.file_reader as file_reader
+
+
+def create_timestamps(rows: int, seed: int) -> list[str]:
+    """Timestamps of Coinbase Pro rows
+
+    Orders have two match rows and one fee row with the same timestamp
+    """
+    random_ = random.Random(seed)
+    timestamps = []
+    time_ = datetime.datetime(2019, 1, 1)
+    while len(timestamps) < rows:
+        time_ += datetime.timedelta(milliseconds=random_.randrange(1, 600000))
+        timestamp = time_.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        timestamps += [timestamp] * 3
+    return timestamps[:rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=8949)
+    args = parser.parse_args()
+
+    timestamps = create_timestamps(args.rows, args.seed)
+
+    start = time.perf_counter()
+    times = [
+        file_reader.convert_coinbase_pro_timestamp_to_datetime(timestamp)
+        for timestamp in timestamps
+    ]
+    strptime = time.perf_counter() - start
+
+    file_reader.parse_coinbase_pro_timestamp.cache_clear()
+    start = time.perf_counter()
+    fast_times = [
+        file_reader.parse_coinbase_pro_timestamp(timestamp) for timestamp in timestamps
+    ]
+    fast = time.perf_counter() - start
+
+    assert fast_times == times
+    print(f"rows:     {args.rows}")
+    print(f"strptime: {strptime:.2f} s")
+    print(f"fast:     {fast:.2f} s")
+    print(f"speedup:  {strptime / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Benchmark whole pipeline on synthetic inputs against stored baselines
+
+Usage: python benchmarks/bench_end_to_end.py [--events 100000 1000000]
+    [--modes batch streaming] [--update-baselines]
+
+Inputs are written by 'generate_inputs.py' (not timed). Each run is a
+'calculate-eth-taxes run' subprocess, so that its peak RSS is measured
+on its own. Exits with status 1 if throughput or peak RSS regressed
+more than the allowed fraction from the baseline of the same mode and
+scale. Baselines depend on the machine; update them (and commit) when
+switching machines or after an intended change
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+import generate_inputs
+
+BASELINES = pathlib.Path(__file__).parent / "baselines" / "end_to_end.json"
+
+
+def write_config(
+    directory: pathlib.Path,
+    manifest: generate_inputs.Manifest,
+    mode: str,
+    tax_mode: str,
+) -> pathlib.Path:
+    lines = [
+        f"input_directory = {json.dumps(str(directory))}",
+        f"etherscan_transaction_csvs = {json.dumps(manifest.etherscan_csvs)}",
+        f"coinbase_csv = {json.dumps(manifest.coinbase_csv)}",
+        f"coinbase_pro_account_csv = {json.dumps(manifest.coinbase_pro_csv)}",
+        f"output_csv = {json.dumps(str(directory / f'output-{mode}.csv'))}",
+        f"streaming = {json.dumps(mode == 'streaming')}",
+        "[tax_modes_by_year]",
+    ]
+    lines += [f'{year} = "{tax_mode}"' for year in manifest.tax_years]
+    file_path = directory / f"config-{mode}.toml"
+    file_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return file_path
+
+
+def run_pipeline(config: pathlib.Path, profile: pathlib.Path) -> tuple[float, float]:
+    """Run command in subprocess; returns seconds and peak RSS in MiB"""
+    environment = dict(os.environ)
+    # Etherscan timestamps are converted in local time, Coinbase in UTC
+    environment["TZ"] = "UTC"
+    start = time.perf_counter()
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            "-m",
+            "carlcsaposs.calculate_eth_taxes.cli",
+            "run",
+            str(config),
+            "--profile-json",
+            str(profile),
+        ],
+        env=environment,
+        stdout=subprocess.DEVNULL,
+    )
+    # Resource usage of this child only (Linux: 'ru_maxrss' in KiB)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"run failed with exit status {process.returncode}")
+    return seconds, usage.ru_maxrss / 1024
+
+
+def find_regressions(
+    result: dict, baseline: dict, max_slowdown: float, max_rss_increase: float
+) -> list[str]:
+    regressions = []
+    minimum = baseline["transactions_per_second"] * (1 - max_slowdown)
+    if result["transactions_per_second"] < minimum:
+        regressions.append(
+            f"{result['transactions_per_second']:.0f} transactions/s, "
+            f"baseline {baseline['transactions_per_second']:.0f}"
+        )
+    maximum = baseline["peak_rss_mib"] * (1 + max_rss_increase)
+    if result["peak_rss_mib"] > maximum:
+        regressions.append(
+            f"peak RSS {result['peak_rss_mib']:.0f} MiB, "
+            f"baseline {baseline['peak_rss_mib']:.0f} MiB"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--events", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["batch", "streaming"],
+        default=["batch", "streaming"],
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tax-mode", default="LowerTaxBracket")
+    parser.add_argument("--baselines", type=pathlib.Path, default=BASELINES)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=0.25,
+        help="allowed fraction of throughput lost (default: 0.25)",
+    )
+    parser.add_argument(
+        "--max-rss-increase",
+        type=float,
+        default=0.25,
+        help="allowed fraction of peak RSS added (default: 0.25)",
+    )
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.baselines.exists():
+        baselines = json.loads(args.baselines.read_text(encoding="utf-8"))
+    results = {}
+    failed = False
+    print(
+        f"{'benchmark':<20}{'transactions':>14}{'seconds':>10}"
+        f"{'per second':>12}{'peak MiB':>10}  result"
+    )
+    for events in args.events:
+        with tempfile.TemporaryDirectory() as directory_:
+            directory = pathlib.Path(directory_)
+            manifest = generate_inputs.generate_inputs(directory, events, args.seed)
+            transactions = manifest.acquires + manifest.spends
+            for mode in args.modes:
+                name = f"{mode}/{events}"
+                config = write_config(directory, manifest, mode, args.tax_mode)
+                profile = directory / f"profile-{mode}.json"
+                seconds, peak_rss_mib = run_pipeline(config, profile)
+                result = results[name] = {
+                    "transactions": transactions,
+                    "seconds": round(seconds, 3),
+                    "transactions_per_second": round(transactions / seconds),
+                    "peak_rss_mib": round(peak_rss_mib, 1),
+                    "stages": {
+                        stage: round(value["seconds"], 3)
+                        for stage, value in json.loads(
+                            profile.read_text(encoding="utf-8")
+                        )["stages"].items()
+                    },
+                }
+                if name not in baselines:
+                    status = "no baseline"
+                else:
+                    regressions = find_regressions(
+                        result,
+                        baselines[name],
+                        args.max_slowdown,
+                        args.max_rss_increase,
+                    )
+                    failed = failed or bool(regressions)
+                    status = "; ".join(regressions) or "ok"
+                print(
+                    f"{name:<20}{transactions:>14}{seconds:>10.2f}"
+                    f"{result['transactions_per_second']:>12}"
+                    f"{peak_rss_mib:>10.0f}  {status}"
+                )
+    if args.update_baselines:
+        baselines.update(results)
+        args.baselines.parent.mkdir(parents=True, exist_ok=True)
+        args.baselines.write_text(
+            json.dumps(baselines, indent=4, sort_keys=True) + "\n", encoding="utf-8"
+        )
+        print(f"updated {args.baselines}")
+    elif failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
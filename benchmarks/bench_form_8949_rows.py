@@ -0,0 +1,71 @@
+"""
+Benchmark converting 'SpentETH' to Form 8949 rows, one by one vs batch
+
+Usage: python benchmarks/bench_form_8949_rows.py [--rows 1000000]
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import datetime
+import random
+import time
+
+import carlcsaposs.calculate_eth_taxes.currency as currency
+
+
+def create_spent_eths(rows: int, seed: int) -> list[currency.SpentETH]:
+    random_ = random.Random(seed)
+    spent_eths = []
+    time_spent = datetime.datetime(2019, 1, 1)
+    for _ in range(rows):
+        time_spent += datetime.timedelta(seconds=random_.randrange(60))
+        spent_eths.append(
+            currency.SpentETH(
+                time_spent - datetime.timedelta(days=random_.randrange(1, 800)),
+                time_spent,
+                random_.randrange(10**13, 10**19),
+                random_.randrange(10**5),
+                random_.randrange(10**5),
+            )
+        )
+    return spent_eths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=8949)
+    args = parser.parse_args()
+
+    spent_eths = create_spent_eths(args.rows, args.seed)
+
+    start = time.perf_counter()
+    rows = [spent_eth.convert_to_form_8949_row() for spent_eth in spent_eths]
+    one_by_one = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_rows = list(currency.convert_spent_eths_to_form_8949_rows(spent_eths))
+    batch = time.perf_counter() - start
+
+    assert batch_rows == rows
+    print(f"rows:       {args.rows}")
+    print(f"one by one: {one_by_one:.2f} s")
+    print(f"batch:      {batch:.2f} s")
+    print(f"speedup:    {one_by_one / batch:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark writing Form 8949 CSV, DictWriter with asdict vs tuple writer
+
+Usage: python benchmarks/bench_form_8949_writer.py [--rows 5000000]
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import csv
+import dataclasses
+import pathlib
+import random
+import resource
+import tempfile
+import time
+import typing
+
+import carlcsaposs.calculate_eth_taxes.file_writer as file_writer
+
+
+def iterate_rows(rows: int, seed: int) -> typing.Iterator[file_writer.Form8949Row]:
+    random_ = random.Random(seed)
+    for _ in range(rows):
+        yield file_writer.Form8949Row(
+            2021,
+            random_.random() < 0.5,
+            f"{random_.randrange(10**18)} ETH",
+            "01/01/2020",
+            "12/31/2021",
+            random_.randrange(10**6),
+            random_.randrange(10**6),
+        )
+
+
+def write_with_dict_writer(
+    rows: typing.Iterable[file_writer.Form8949Row], file_path: pathlib.Path
+) -> None:
+    """Previous implementation of 'Form8949File.write_to_file'"""
+    with open(file_path, "w", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, file_writer.Form8949File.FIELDNAMES)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dataclasses.asdict(row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--seed", type=int, default=8949)
+    parser.add_argument("--compression", choices=["gzip", "lzma"])
+    args = parser.parse_args()
+
+    # Create rows up front so that only writing is timed
+    rows = list(iterate_rows(args.rows, args.seed))
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        write_with_dict_writer(rows, pathlib.Path(directory) / "dict.csv")
+        dict_writer = time.perf_counter() - start
+
+        start = time.perf_counter()
+        file_writer.Form8949File.write_rows_to_file(
+            rows,
+            pathlib.Path(directory) / "tuple.csv",
+            compression=args.compression,
+        )
+        tuple_writer = time.perf_counter() - start
+
+        if args.compression is None:
+            assert (pathlib.Path(directory) / "dict.csv").read_bytes() == (
+                pathlib.Path(directory) / "tuple.csv"
+            ).read_bytes()
+    print(f"rows:         {args.rows}")
+    print(f"dict writer:  {dict_writer:.2f} s")
+    print(f"tuple writer: {tuple_writer:.2f} s ({args.compression or 'uncompressed'})")
+    print(f"speedup:      {dict_writer / tuple_writer:.2f}x")
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS:     {peak_kib / 1024:.0f} MiB (includes rows created up front)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Fit growth exponents of lot selection and fail if they exceed bounds
+
+Usage: python benchmarks/bench_scaling.py [--max-lots 1000000]
+
+Times 'sort' of tax optimization methods and
+'_TransactionProcessor.remove_wei' (per spend) at inventory sizes from
+10 lots to '--max-lots', in powers of 10. The exponent k of time ~ N^k
+is fit by least squares on log-log points from '--fit-from' lots (small
+inventories are dominated by constant overhead). Exits with status 1 if
+any exponent exceeds its bound in 'baselines/scaling_bounds.json'; e.g.
+a sort should be about N log N (k slightly above 1) and 'remove_wei'
+should not grow with N (k near 0), so quadratic selection shows up as
+k near 2 or 1
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=protected-access
+import argparse
+import datetime
+import decimal
+import json
+import math
+import pathlib
+import random
+import sys
+import time
+import typing
+
+import carlcsaposs.calculate_eth_taxes.currency as currency
+import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
+import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
+import carlcsaposs.calculate_eth_taxes.transaction_processor as transaction_processor
+
+BOUNDS = pathlib.Path(__file__).parent / "baselines" / "scaling_bounds.json"
+TAX_MODES = [
+    tax_optimizer.FirstInFirstOut,
+    tax_optimizer.LowerTaxBracket,
+    tax_optimizer.HigherTaxBracket,
+]
+SPEND_TIME = datetime.datetime(2022, 1, 1)
+WEI_PER_LOT = 10**18
+
+
+def create_acquired_eths(lots: int, seed: int) -> list[currency.AcquiredETH]:
+    """Lots acquired in 3 years before 'SPEND_TIME', in chronological order
+
+    About a third are long-term at 'SPEND_TIME'
+    """
+    random_ = random.Random(seed)
+    seconds = sorted(random_.randrange(1, 3 * 365 * 86400) for _ in range(lots))
+    return [
+        currency.AcquiredETH(
+            SPEND_TIME - datetime.timedelta(seconds=second),
+            WEI_PER_LOT,
+            decimal.Decimal(random_.randrange(100000, 500000)),
+        )
+        for second in reversed(seconds)
+    ]
+
+
+def create_spend(amount_wei: int) -> exchange_transactions.Spend:
+    """Spend priced between cheapest and most expensive lot (gains and non-gains)"""
+    return exchange_transactions.Spend(SPEND_TIME, amount_wei, decimal.Decimal(300000))
+
+
+def time_call(function: typing.Callable[[], typing.Any], lots: int) -> float:
+    """Minimum seconds of 3 repeats, each of enough calls for about 1M lots"""
+    number = max(1, 10**6 // lots)
+    best = math.inf
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def time_sort(
+    tax_mode: type[tax_optimizer.OptimizationMethod],
+    acquired_eths: list[currency.AcquiredETH],
+) -> float:
+    """Seconds per sort of all lots for a spend"""
+    spend = create_spend(WEI_PER_LOT)
+    return time_call(lambda: tax_mode.sort(acquired_eths, spend), len(acquired_eths))
+
+
+def time_remove_wei(
+    tax_mode: type[tax_optimizer.OptimizationMethod],
+    acquired_eths: list[currency.AcquiredETH],
+) -> float:
+    """Seconds per spend of 1.5 lots, after index for tax mode is built"""
+    processor = transaction_processor._TransactionProcessor([], {})
+    processor.start()
+    # Copies, since 'remove_wei' splits lots in place
+    for acquired_eth in acquired_eths:
+        processor._acquired_eths.add(
+            currency.AcquiredETH(
+                acquired_eth.time_acquired,
+                acquired_eth.amount_wei,
+                acquired_eth.cost_us_cents_per_eth_including_fees,
+            )
+        )
+    processor._set_tax_mode(tax_mode)
+    # Not timed: first spend moves lots that are long-term to long-term
+    # index (once per lot)
+    list(processor.remove_wei(create_spend(1)))
+    spends = [
+        create_spend(3 * WEI_PER_LOT // 2)
+        for _ in range(min(1000, len(acquired_eths) // 3))
+    ]
+    start = time.perf_counter()
+    for spend in spends:
+        for _ in processor.remove_wei(spend):
+            pass
+    return (time.perf_counter() - start) / len(spends)
+
+
+def fit_exponent(points: list[tuple[int, float]]) -> float:
+    """Slope of least squares line through (log N, log seconds)"""
+    xs = [math.log(lots) for lots, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum(
+        (x - x_mean) ** 2 for x in xs
+    )
+
+
+def main():
+    """Time lot selection at each size, fit exponents and check bounds"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--max-lots", type=int, default=10**6)
+    parser.add_argument("--fit-from", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bounds", type=pathlib.Path, default=BOUNDS)
+    parser.add_argument("--json", type=pathlib.Path, help="save results as JSON")
+    args = parser.parse_args()
+
+    bounds = json.loads(args.bounds.read_text(encoding="utf-8"))
+    sizes = [10**power for power in range(1, int(math.log10(args.max_lots)) + 1)]
+    benchmarks = {}
+    for tax_mode in TAX_MODES:
+        benchmarks[f"{tax_mode.__name__}.sort"] = (time_sort, tax_mode)
+    for tax_mode in TAX_MODES:
+        benchmarks[f"{tax_mode.__name__}.remove_wei"] = (time_remove_wei, tax_mode)
+    seconds: dict[str, dict[int, float]] = {name: {} for name in benchmarks}
+    for lots in sizes:
+        acquired_eths = create_acquired_eths(lots, args.seed)
+        for name, (function, tax_mode) in benchmarks.items():
+            seconds[name][lots] = function(tax_mode, acquired_eths)
+        del acquired_eths
+
+    print(
+        f"{'benchmark':<30}"
+        + "".join(f"{f'N={lots:.0e}':>11}" for lots in sizes)
+        + f"{'exponent':>10}{'bound':>7}  result"
+    )
+    results = {}
+    failed = False
+    for name, seconds_by_lots in seconds.items():
+        exponent = fit_exponent(
+            [
+                (lots, value)
+                for lots, value in seconds_by_lots.items()
+                if lots >= args.fit_from
+            ]
+        )
+        bound = bounds[name]
+        failed = failed or exponent > bound
+        results[name] = {
+            "seconds": {str(lots): value for lots, value in seconds_by_lots.items()},
+            "exponent": round(exponent, 3),
+            "bound": bound,
+        }
+        print(
+            f"{name:<30}"
+            + "".join(f"{value * 1e6:>9.1f}us" for value in seconds_by_lots.values())
+            + f"{exponent:>10.2f}{bound:>7.2f}  {'FAIL' if exponent > bound else 'ok'}"
+        )
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=4) + "\n", encoding="utf-8")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
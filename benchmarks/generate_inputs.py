@@ -0,0 +1,501 @@
+"""
+Generate synthetic Etherscan, Coinbase and Coinbase Pro CSVs
+
+Usage: python benchmarks/generate_inputs.py DIRECTORY [--events 1000000]
+
+Output is deterministic for a seed. Every Coinbase and Coinbase Pro
+transfer has exactly one matching Etherscan wallet transaction, and ETH
+is never spent before it is acquired, so the output can be processed by
+'file_reader.read_files' and 'transaction_processor'. Etherscan
+timestamps are UTC; 'file_reader' converts them in local time, so read
+with TZ=UTC
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import contextlib
+import csv
+import dataclasses
+import datetime
+import json
+import pathlib
+import random
+import typing
+
+WEI_PER_ETH = 10**18
+# Transfers are matched within 0.001 ETH and 15 minutes (see
+# 'file_reader.TRANSFER_AMOUNT_TOLERANCE_WEI'). Transfer amounts are
+# multiples of 0.004 ETH (plus jitter); other wallet amounts are offset
+# by 0.002 ETH, so they never match a transfer. Consecutive transfers
+# use different multiples, so transfers in the same 15 minutes never
+# match the same wallet transaction
+_LATTICE_WEI = 4 * 10**15
+_OFFSET_WEI = 2 * 10**15
+_JITTER_WEI = 3 * 10**14
+_MAXIMUM_FEE_WEI = 3 * 10**14
+_TRANSFER_MULTIPLES = 250
+
+ETHERSCAN_HEADER = [
+    "Txhash",
+    "Blockno",
+    "UnixTimestamp",
+    "DateTime",
+    "From",
+    "To",
+    "ContractAddress",
+    "Value_IN(ETH)",
+    "Value_OUT(ETH)",
+    "CurrentValue @ $1000/Eth",
+    "TxnFee(ETH)",
+    "TxnFee(USD)",
+    "Historical $Price/Eth",
+    "Status",
+    "ErrCode",
+    "Method",
+]
+COINBASE_HEADER = [
+    "Timestamp",
+    "Transaction Type",
+    "Asset",
+    "Quantity Transacted",
+    "Spot Price Currency",
+    "Spot Price at Transaction",
+    "Subtotal",
+    "Total (inclusive of fees)",
+    "Fees",
+    "Notes",
+]
+COINBASE_PRO_HEADER = [
+    "portfolio",
+    "type",
+    "time",
+    "amount",
+    "balance",
+    "amount/balance unit",
+    "transfer id",
+    "trade id",
+    "order id",
+]
+
+# Relative frequency of each event
+EVENT_WEIGHTS = {
+    "coinbase_buy": 15,
+    "coinbase_pro_buy": 15,
+    "coinbase_pro_sell": 10,
+    "wallet_spend": 18,
+    "wallet_contract_call": 5,
+    "wallet_failed": 2,
+    "wallet_to_wallet": 8,
+    "coinbase_to_wallet": 8,
+    "coinbase_pro_to_wallet": 7,
+    "wallet_to_coinbase": 6,
+    "wallet_to_coinbase_pro": 6,
+}
+
+
+@dataclasses.dataclass
+class Manifest:
+    """What was generated; 'acquires' and 'spends' are expected
+    'exchange_transactions' read from the files"""
+
+    seed: int
+    events: int
+    wallets: list[str]
+    etherscan_csvs: list[str]
+    coinbase_csv: str = "coinbase.csv"
+    coinbase_pro_csv: str = "coinbase-pro.csv"
+    acquires: int = 0
+    spends: int = 0
+    event_counts: dict[str, int] = dataclasses.field(default_factory=dict)
+    tax_years: list[int] = dataclasses.field(default_factory=list)
+
+
+def format_eth(amount_wei: int) -> str:
+    """ETH amount as decimal string, like Etherscan and Coinbase"""
+    sign = "-" if amount_wei < 0 else ""
+    whole, fraction = divmod(abs(amount_wei), WEI_PER_ETH)
+    if fraction == 0:
+        return f"{sign}{whole}"
+    return f"{sign}{whole}.{fraction:018d}".rstrip("0")
+
+
+def format_usd(us_cents: int) -> str:
+    """USD amount in cents as decimal string with 2 decimal places"""
+    sign = "-" if us_cents < 0 else ""
+    return f"{sign}{abs(us_cents) // 100}.{abs(us_cents) % 100:02d}"
+
+
+def _create_address(random_: random.Random) -> str:
+    return f"0x{random_.getrandbits(160):040x}"
+
+
+class _Generator:
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        events: int,
+        seed: int,
+        wallet_count: int,
+        start: datetime.datetime,
+        years: float,
+    ):
+        self._random = random.Random(seed)
+        self._events = events
+        self._time = start
+        # Mean seconds between events; at least one so times are unique
+        self._mean_interval = max(1, int(years * 365 * 86400 / max(events, 1)))
+        self._us_cents_per_eth = 200000
+        self._holdings_wei = 0
+        self._transfer_count = 0
+        self._transaction_count = 0
+        self._coinbase_pro_balances = {"USD": 0, "ETH": 0}
+        self._wallets = [
+            _create_address(self._random).lower() for _ in range(wallet_count)
+        ]
+        self._coinbase_addresses = [_create_address(self._random) for _ in range(3)]
+        self._external_addresses = [_create_address(self._random) for _ in range(50)]
+        self.manifest = Manifest(
+            seed,
+            events,
+            self._wallets,
+            [f"export-{wallet}.csv" for wallet in self._wallets],
+        )
+        self._directory = directory
+        self._etherscan_writers: dict[str, typing.Any] = {}
+        self._coinbase_writer: typing.Any = None
+        self._coinbase_pro_writer: typing.Any = None
+
+    def _write_files(self, stack: contextlib.ExitStack) -> None:
+        def open_writer(file_name: str, header: list[str]):
+            file = stack.enter_context(
+                open(self._directory / file_name, "w", encoding="utf-8", newline="")
+            )
+            # Etherscan quotes every value; Coinbase does not
+            writer = csv.writer(
+                file,
+                quoting=csv.QUOTE_ALL
+                if file_name.startswith("export-")
+                else csv.QUOTE_MINIMAL,
+                lineterminator="\n",
+            )
+            writer.writerow(header)
+            return writer
+
+        for wallet, file_name in zip(self._wallets, self.manifest.etherscan_csvs):
+            self._etherscan_writers[wallet] = open_writer(file_name, ETHERSCAN_HEADER)
+        self._coinbase_writer = open_writer(self.manifest.coinbase_csv, COINBASE_HEADER)
+        self._coinbase_pro_writer = open_writer(
+            self.manifest.coinbase_pro_csv, COINBASE_PRO_HEADER
+        )
+        events = list(EVENT_WEIGHTS)
+        weights = list(EVENT_WEIGHTS.values())
+        tax_years = set()
+        for _ in range(self._events):
+            self._time += datetime.timedelta(
+                seconds=self._random.randint(1, 2 * self._mean_interval)
+            )
+            # Random walk, between $100 and $5000
+            self._us_cents_per_eth = min(
+                500000,
+                max(10000, self._us_cents_per_eth + self._random.randint(-300, 300)),
+            )
+            event = self._random.choices(events, weights)[0]
+            # Spends need ETH; buy instead until there is enough
+            if self._holdings_wei < 2 * WEI_PER_ETH and event not in [
+                "coinbase_buy",
+                "coinbase_pro_buy",
+            ]:
+                event = "coinbase_buy"
+            getattr(self, f"_{event}")()
+            self.manifest.event_counts[event] = (
+                self.manifest.event_counts.get(event, 0) + 1
+            )
+            tax_years.add(self._time.year)
+        self.manifest.tax_years = sorted(tax_years)
+
+    def generate(self) -> Manifest:
+        """Write all input files and return what was generated"""
+        with contextlib.ExitStack() as stack:
+            self._write_files(stack)
+        return self.manifest
+
+    # Amounts
+
+    def _random_amount_wei(self, minimum_eth: float, maximum_eth: float) -> int:
+        return self._random.randint(
+            int(minimum_eth * 1000), int(maximum_eth * 1000)
+        ) * (WEI_PER_ETH // 1000) + self._random.randrange(10**12)
+
+    def _transfer_amount_wei(self) -> int:
+        self._transfer_count += 1
+        multiple = 1 + self._transfer_count % _TRANSFER_MULTIPLES
+        return multiple * _LATTICE_WEI + self._random.randrange(_JITTER_WEI)
+
+    def _wallet_amount_wei(self) -> int:
+        multiple = self._random.randrange(_TRANSFER_MULTIPLES)
+        jitter_wei = self._random.randrange(_JITTER_WEI)
+        return multiple * _LATTICE_WEI + _OFFSET_WEI + jitter_wei
+
+    def _fee_wei(self) -> int:
+        return self._random.randrange(2 * 10**13, _MAXIMUM_FEE_WEI)
+
+    def _us_cents(self, amount_wei: int) -> int:
+        return amount_wei * self._us_cents_per_eth // WEI_PER_ETH
+
+    # Rows
+
+    def _coinbase_row(self, type_: str, amount_wei: int, total_us_cents=None):
+        subtotal = self._us_cents(amount_wei)
+        self._coinbase_writer.writerow(
+            [
+                self._time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                type_,
+                "ETH",
+                format_eth(amount_wei),
+                "USD",
+                format_usd(self._us_cents_per_eth),
+                "" if total_us_cents is None else format_usd(subtotal),
+                "" if total_us_cents is None else format_usd(total_us_cents),
+                "" if total_us_cents is None else format_usd(total_us_cents - subtotal),
+                "",
+            ]
+        )
+
+    def _coinbase_pro_row(
+        self, type_: str, amount: int, unit: str, transfer_id="", order_id=""
+    ):
+        """'amount' is wei or US cents"""
+        self._coinbase_pro_balances[unit] += amount
+        format_ = format_eth if unit == "ETH" else format_usd
+        self._coinbase_pro_writer.writerow(
+            [
+                "default",
+                type_,
+                self._time.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+                format_(amount),
+                format_(self._coinbase_pro_balances[unit]),
+                unit,
+                transfer_id,
+                order_id and order_id.split("-")[0],
+                order_id,
+            ]
+        )
+
+    def _etherscan_row(
+        self,
+        wallet: str,
+        wallet_from: str,
+        wallet_to: str,
+        amount_in_wei: int,
+        amount_out_wei: int,
+        fee_wei: int,
+        failed: bool = False,
+        method: str = "Transfer",
+    ):
+        self._transaction_count += 1
+        self._etherscan_writers[wallet].writerow(
+            [
+                f"0x{self._transaction_count:064x}",
+                str(10_000_000 + self._transaction_count),
+                str(int(self._time.replace(tzinfo=datetime.timezone.utc).timestamp())),
+                self._time.strftime("%Y-%m-%d %H:%M:%S"),
+                wallet_from,
+                wallet_to,
+                "",
+                format_eth(amount_in_wei),
+                format_eth(amount_out_wei),
+                format_usd((amount_in_wei or amount_out_wei) * 100000 // WEI_PER_ETH),
+                format_eth(fee_wei),
+                format_usd(self._us_cents(fee_wei)),
+                format_usd(self._us_cents_per_eth),
+                "Error(0)" if failed else "",
+                "Out of gas" if failed else "",
+                method,
+            ]
+        )
+
+    # Events
+
+    def _coinbase_buy(self):
+        amount_wei = self._random_amount_wei(0.01, 2)
+        subtotal = self._us_cents(amount_wei)
+        self._coinbase_row("Buy", amount_wei, subtotal + max(99, subtotal // 67))
+        self._holdings_wei += amount_wei
+        self.manifest.acquires += 1
+
+    def _coinbase_pro_order(self, buy: bool):
+        order_id = f"{self._random.getrandbits(32):08x}-{self._transaction_count}"
+        self._transaction_count += 1
+        if buy:
+            amount_wei = self._random_amount_wei(0.01, 2)
+        else:
+            amount_wei = self._random_amount_wei(0.01, self._holdings_wei / 4e18)
+        us_cents = max(1, self._us_cents(amount_wei))
+        fee_us_cents = max(1, us_cents // 200)
+        if buy:
+            self._coinbase_pro_row(
+                "deposit", us_cents + fee_us_cents, "USD", f"usd-{order_id}"
+            )
+            self._coinbase_pro_row("match", -us_cents, "USD", order_id=order_id)
+            self._coinbase_pro_row("match", amount_wei, "ETH", order_id=order_id)
+            self._holdings_wei += amount_wei
+            self.manifest.acquires += 1
+        else:
+            self._coinbase_pro_row("match", -amount_wei, "ETH", order_id=order_id)
+            self._coinbase_pro_row("match", us_cents, "USD", order_id=order_id)
+            self._holdings_wei -= amount_wei
+            self.manifest.spends += 1
+        self._coinbase_pro_row("fee", -fee_us_cents, "USD", order_id=order_id)
+
+    def _coinbase_pro_buy(self):
+        self._coinbase_pro_order(True)
+
+    def _coinbase_pro_sell(self):
+        self._coinbase_pro_order(False)
+
+    def _wallet_outgoing(
+        self, wallet_to: str, amount_wei: int, failed=False, method="Transfer"
+    ) -> None:
+        """Outgoing transaction from random wallet"""
+        wallet = self._random.choice(self._wallets)
+        fee_wei = self._fee_wei()
+        self._etherscan_row(
+            wallet, wallet, wallet_to, 0, amount_wei, fee_wei, failed, method
+        )
+        # Fee is always spent
+        self.manifest.spends += 1
+        self._holdings_wei -= fee_wei
+        if amount_wei and not failed:
+            self._holdings_wei -= amount_wei
+
+    def _wallet_spend(self):
+        self._wallet_outgoing(
+            self._random.choice(self._external_addresses), self._wallet_amount_wei()
+        )
+        self.manifest.spends += 1
+
+    def _wallet_contract_call(self):
+        self._wallet_outgoing(
+            self._random.choice(self._external_addresses), 0, method="Approve"
+        )
+
+    def _wallet_failed(self):
+        self._wallet_outgoing(
+            self._random.choice(self._external_addresses),
+            self._wallet_amount_wei(),
+            failed=True,
+        )
+
+    def _wallet_to_wallet(self):
+        if len(self._wallets) < 2:
+            self._wallet_spend()
+            return
+        wallet, wallet_to = self._random.sample(self._wallets, 2)
+        amount_wei = self._wallet_amount_wei()
+        fee_wei = self._fee_wei()
+        self._etherscan_row(wallet, wallet, wallet_to, 0, amount_wei, fee_wei)
+        self._etherscan_row(wallet_to, wallet, wallet_to, amount_wei, 0, fee_wei)
+        # Only fee is spent; receiving wallet is skipped
+        self._holdings_wei -= fee_wei
+        self.manifest.spends += 1
+
+    def _to_wallet(self) -> tuple[str, int, int]:
+        """Incoming transfer from Coinbase; returns wallet, amount and fee
+
+        Etherscan shows amount excluding fee; Coinbase shows amount
+        including fee
+        """
+        wallet = self._random.choice(self._wallets)
+        amount_wei = self._transfer_amount_wei()
+        fee_wei = self._fee_wei()
+        self._etherscan_row(
+            wallet,
+            self._random.choice(self._coinbase_addresses),
+            wallet,
+            amount_wei - fee_wei,
+            0,
+            fee_wei,
+        )
+        # Fee is spent; amount is not
+        self._holdings_wei -= fee_wei
+        self.manifest.spends += 1
+        return wallet, amount_wei, fee_wei
+
+    def _coinbase_to_wallet(self):
+        _, amount_wei, _ = self._to_wallet()
+        self._coinbase_row("Send", amount_wei)
+
+    def _coinbase_pro_to_wallet(self):
+        _, amount_wei, _ = self._to_wallet()
+        self._coinbase_pro_row(
+            "withdrawal", -amount_wei, "ETH", f"withdrawal-{self._transfer_count}"
+        )
+
+    def _from_wallet(self) -> int:
+        amount_wei = self._transfer_amount_wei()
+        self._wallet_outgoing(self._random.choice(self._coinbase_addresses), amount_wei)
+        # Not spent
+        self._holdings_wei += amount_wei
+        return amount_wei
+
+    def _wallet_to_coinbase(self):
+        self._coinbase_row("Receive", self._from_wallet())
+
+    def _wallet_to_coinbase_pro(self):
+        self._coinbase_pro_row(
+            "deposit", self._from_wallet(), "ETH", f"deposit-{self._transfer_count}"
+        )
+
+
+def generate_inputs(
+    directory: pathlib.Path,
+    events: int,
+    seed: int = 0,
+    wallets: int = 4,
+    start: datetime.datetime = datetime.datetime(2019, 1, 1),
+    years: float = 4,
+) -> Manifest:
+    """Write input CSVs for about 'events' events to directory
+
+    Events are spread over 'years'; a Coinbase Pro order is one event
+    (of 3 or 4 rows)
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = _Generator(directory, events, seed, wallets, start, years).generate()
+    (directory / "manifest.json").write_text(
+        json.dumps(dataclasses.asdict(manifest), indent=4) + "\n", encoding="utf-8"
+    )
+    return manifest
+
+
+def main():
+    """Generate inputs in directory and print manifest"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("directory", type=pathlib.Path)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--wallets", type=int, default=4)
+    args = parser.parse_args()
+    manifest = generate_inputs(args.directory, args.events, args.seed, args.wallets)
+    print(
+        f"{manifest.events} events: {manifest.acquires} acquires, "
+        f"{manifest.spends} spends in {args.directory}"
+    )
+
+
+if __name__ == "__main__":
+    main()
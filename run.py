@@ -1,2 +1,6 @@
 # pylint: disable=missing-docstring
-import carlcsaposs.calculate_eth_taxes.main
+import sys
+
+from carlcsaposs.calculate_eth_taxes import cli
+
+sys.exit(cli.main())
@@ -0,0 +1,128 @@
+"""
+assignment: Match transfers to wallet transactions with minimum cost
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import typing
+
+
+def calculate_minimum_cost_assignment(costs: list[list[int]]) -> list[int]:
+    """Assign each row to a different column with minimum total cost
+
+    Hungarian algorithm; 'costs' must have at least as many columns as
+    rows. Returns column index for each row
+    """
+    row_count = len(costs)
+    column_count = len(costs[0])
+    # 1-indexed; row and column 0 are sentinels
+    row_potentials: list[float] = [0.0] * (row_count + 1)
+    column_potentials: list[float] = [0.0] * (column_count + 1)
+    row_by_column = [0] * (column_count + 1)
+    previous_columns = [0] * (column_count + 1)
+    for row in range(1, row_count + 1):
+        row_by_column[0] = row
+        column = 0
+        minimums = [float("inf")] * (column_count + 1)
+        used = [False] * (column_count + 1)
+        while row_by_column[column] != 0:
+            used[column] = True
+            current_row = row_by_column[column]
+            delta = float("inf")
+            next_column = 0
+            for other_column in range(1, column_count + 1):
+                if used[other_column]:
+                    continue
+                reduced_cost = (
+                    costs[current_row - 1][other_column - 1]
+                    - row_potentials[current_row]
+                    - column_potentials[other_column]
+                )
+                if reduced_cost < minimums[other_column]:
+                    minimums[other_column] = reduced_cost
+                    previous_columns[other_column] = column
+                if minimums[other_column] < delta:
+                    delta = minimums[other_column]
+                    next_column = other_column
+            for other_column in range(column_count + 1):
+                if used[other_column]:
+                    row_potentials[row_by_column[other_column]] += delta
+                    column_potentials[other_column] -= delta
+                else:
+                    minimums[other_column] -= delta
+            column = next_column
+        while column != 0:
+            previous_column = previous_columns[column]
+            row_by_column[column] = row_by_column[previous_column]
+            column = previous_column
+    columns = [0] * row_count
+    for column in range(1, column_count + 1):
+        if row_by_column[column] != 0:
+            columns[row_by_column[column] - 1] = column - 1
+    return columns
+
+
+def assign_optimally(
+    match_indexes: list[list[int]], time_differences: list[list[int]]
+) -> list[typing.Optional[int]]:
+    """Match each transfer to a different wallet transaction
+
+    Maximize number of matched transfers, then minimize total time
+    difference. Returns matched wallet transaction (or None) for each
+    transfer
+    """
+    # Group transfers that share candidate wallet transactions
+    transfers_by_index: dict[int, list[int]] = {}
+    for transfer, indexes in enumerate(match_indexes):
+        for index in indexes:
+            transfers_by_index.setdefault(index, []).append(transfer)
+    assignment: list[typing.Optional[int]] = [None] * len(match_indexes)
+    visited = [False] * len(match_indexes)
+    for first_transfer, indexes in enumerate(match_indexes):
+        if visited[first_transfer] or not indexes:
+            continue
+        visited[first_transfer] = True
+        transfers = [first_transfer]
+        component_indexes: dict[int, None] = {}
+        for transfer in transfers:
+            for index in match_indexes[transfer]:
+                if index in component_indexes:
+                    continue
+                component_indexes[index] = None
+                for other_transfer in transfers_by_index[index]:
+                    if not visited[other_transfer]:
+                        visited[other_transfer] = True
+                        transfers.append(other_transfer)
+        columns = list(component_indexes)
+        # Leaving a transfer unmatched costs more than all matches combined
+        unmatched_cost = 1 + sum(
+            sum(time_differences[transfer]) for transfer in transfers
+        )
+        costs = []
+        for transfer in transfers:
+            cost_by_index = dict(
+                zip(match_indexes[transfer], time_differences[transfer])
+            )
+            costs.append(
+                [cost_by_index.get(index, 2 * unmatched_cost) for index in columns]
+                # One unmatched column for each transfer
+                + [unmatched_cost] * len(transfers)
+            )
+        for transfer, column in zip(
+            transfers, calculate_minimum_cost_assignment(costs)
+        ):
+            if column < len(columns):
+                assignment[transfer] = columns[column]
+    return assignment
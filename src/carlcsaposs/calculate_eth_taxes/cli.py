@@ -0,0 +1,186 @@
+"""
+cli: Command line interface
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Engine modules are imported by the subcommands that need them, so that
+# '--help' and 'check-config' do not pay for importing them
+import argparse
+import sys
+import typing
+
+from . import config as config_
+
+DEFAULT_CONFIG = "calculate-eth-taxes.toml"
+
+
+def _check_config(  # pylint: disable=unused-argument
+    arguments: argparse.Namespace, config: config_.Config
+) -> int:
+    for year, tax_mode in sorted(config.tax_modes_by_year.items()):
+        print(f"{year}: {tax_mode}")
+    return 0
+
+
+def _run(arguments: argparse.Namespace, config: config_.Config) -> int:
+    # pylint: disable=import-outside-toplevel
+    from . import instrumentation
+    from . import main as main_
+
+    profile = None
+    if arguments.profile or arguments.profile_json is not None:
+        profile = instrumentation.enable()
+    try:
+        summary = main_.run(config)
+    finally:
+        instrumentation.disable()
+    if profile is not None:
+        if arguments.profile:
+            print(profile.format_report(), file=sys.stderr)
+        if arguments.profile_json is not None:
+            profile.write_to_file(arguments.profile_json)
+    for (tax_year, is_long_term), totals in sorted(summary.totals.items()):
+        print(
+            f"{tax_year} {'long' if is_long_term else 'short'}-term: "
+            f"{totals.row_count} rows, proceeds ${totals.proceeds_usd}, "
+            f"cost ${totals.cost_usd}, gain ${totals.gain_usd}"
+        )
+    return 0
+
+
+def _what_if(arguments: argparse.Namespace, config: config_.Config) -> int:
+    # pylint: disable=import-outside-toplevel
+    from . import main as main_
+    from . import what_if
+
+    transactions = main_.read_transactions(config)
+    spend_years = what_if.get_spend_years(transactions)
+    years = sorted(arguments.years or spend_years)
+    missing_years = [
+        year
+        for year in spend_years
+        if year not in years and year not in config.tax_modes_by_year
+    ]
+    if missing_years:
+        print(
+            f"error: no tax mode for {', '.join(map(str, missing_years))} in "
+            f"{arguments.config} or '--years'",
+            file=sys.stderr,
+        )
+        return 2
+    results = what_if.rank_results(
+        what_if.evaluate_scenarios(
+            transactions,
+            what_if.enumerate_scenarios(
+                config.tax_modes_by_year, years, arguments.tax_modes
+            ),
+            config.exact_arithmetic,
+            arguments.max_workers,
+        ),
+        arguments.rank_by,
+    )
+    print(what_if.format_table(results[: arguments.top], years))
+    if arguments.output_csv is not None:
+        what_if.write_results_to_file(results, years, arguments.output_csv)
+    return 0
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Parser of command line arguments"""
+    parser = argparse.ArgumentParser(
+        prog="calculate-eth-taxes",
+        description="Generate Form 8949 data for US taxes on ETH",
+    )
+    subparsers = parser.add_subparsers(title="commands", required=True)
+    subparsers_by_name = {}
+    for name, function, help_ in [
+        ("run", _run, "write Form 8949 CSV for inputs in configuration"),
+        ("check-config", _check_config, "validate configuration and exit"),
+        (
+            "what-if",
+            _what_if,
+            "rank realized gains of each combination of tax modes by year",
+        ),
+    ]:
+        subparser = subparsers.add_parser(name, help=help_, description=help_)
+        subparser.add_argument(
+            "config",
+            nargs="?",
+            default=DEFAULT_CONFIG,
+            help=f"TOML configuration file (default: {DEFAULT_CONFIG})",
+        )
+        subparser.set_defaults(function=function)
+        subparsers_by_name[name] = subparser
+    subparsers_by_name["run"].add_argument(
+        "--profile",
+        action="store_true",
+        help="print time of each stage and hot path counters to stderr",
+    )
+    subparsers_by_name["run"].add_argument(
+        "--profile-json",
+        metavar="FILE",
+        help="save time of each stage and hot path counters as JSON",
+    )
+    what_if_parser = subparsers_by_name["what-if"]
+    what_if_parser.add_argument(
+        "--tax-modes",
+        nargs="+",
+        choices=config_.TAX_MODE_NAMES,
+        default=["FirstInFirstOut", "LowerTaxBracket", "HigherTaxBracket"],
+        metavar="TAX_MODE",
+        help="tax modes to combine (default: %(default)s)",
+    )
+    what_if_parser.add_argument(
+        "--years",
+        nargs="+",
+        type=int,
+        help="years to vary (default: every year with spends); other years "
+        "use tax mode in configuration",
+    )
+    what_if_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=0,
+        help="processes evaluating scenarios (default: number of CPUs)",
+    )
+    what_if_parser.add_argument(
+        "--rank-by",
+        choices=["short-term", "total"],
+        default="short-term",
+        help="lowest gain first (default: %(default)s)",
+    )
+    what_if_parser.add_argument(
+        "--top", type=int, default=20, help="rows to print (default: %(default)s)"
+    )
+    what_if_parser.add_argument(
+        "--output-csv", metavar="FILE", help="save all ranked scenarios as CSV"
+    )
+    return parser
+
+
+def main(argv: typing.Optional[list[str]] = None) -> int:
+    """Entry point of 'calculate-eth-taxes' command; returns exit status"""
+    parser = create_parser()
+    arguments = parser.parse_args(argv)
+    try:
+        config = config_.read_config(arguments.config)
+    except (OSError, ValueError) as exception:
+        parser.error(str(exception))
+    return arguments.function(arguments, config)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+config: Read and validate TOML configuration of a run
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Only standard library imports, so that configuration is validated
+# without importing the engine
+import dataclasses
+import os
+import typing
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib  # type: ignore[no-redef]
+
+# Names of 'tax_optimizer.OptimizationMethod' subclasses
+TAX_MODE_NAMES = (
+    "FirstInFirstOut",
+    "LastInFirstOut",
+    "HighestInFirstOut",
+    "LowestInFirstOut",
+    "LowerTaxBracket",
+    "HigherTaxBracket",
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    """Input files, tax modes and options of a run
+
+    File names of inputs are relative to 'input_directory' (default
+    'file_reader.INPUT_DIRECTORY')
+    """
+
+    etherscan_transaction_csvs: list[str]
+    coinbase_csv: str
+    coinbase_pro_account_csv: str
+    tax_modes_by_year: dict[int, str]
+    blocklisted_coinbase_pro_transfer_ids: list[str] = dataclasses.field(
+        default_factory=list
+    )
+    input_directory: typing.Optional[str] = None
+    output_csv: str = "output.csv"
+    # If set, a Form 8949 CSV for each tax year and term instead of
+    # 'output_csv'; see 'file_writer.ShardedForm8949Sink'
+    sharded_output_directory: typing.Optional[str] = None
+    summary_csv: typing.Optional[str] = None
+    # Spend, convert and write transactions as they are merged
+    streaming: bool = False
+    # Cache of parsed transactions; see 'event_log.read_files'
+    event_log_directory: typing.Optional[str] = None
+    optimal_assignment: bool = False
+    max_workers: typing.Optional[int] = None
+    exact_arithmetic: bool = False
+    columnar: bool = False
+
+    def __post_init__(self):
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            if field.default is None and value is None:
+                continue
+            expected_type = _TYPES[field.name]
+            if not _is_instance(value, expected_type):
+                raise ValueError(
+                    f"expected '{field.name}' of type {_TYPE_NAMES[expected_type]}, "
+                    f"got {value!r} instead"
+                )
+        for year, tax_mode in self.tax_modes_by_year.items():
+            if tax_mode not in TAX_MODE_NAMES:
+                raise ValueError(
+                    f"expected tax mode for {year} in {TAX_MODE_NAMES}, "
+                    f"got {tax_mode!r} instead"
+                )
+        if self.max_workers is not None and self.max_workers < 0:
+            raise ValueError(
+                f"expected 'max_workers' greater than or equal to zero, "
+                f"got {self.max_workers} instead"
+            )
+
+
+_TYPES = {
+    "etherscan_transaction_csvs": list[str],
+    "coinbase_csv": str,
+    "coinbase_pro_account_csv": str,
+    "tax_modes_by_year": dict[int, str],
+    "blocklisted_coinbase_pro_transfer_ids": list[str],
+    "input_directory": str,
+    "output_csv": str,
+    "sharded_output_directory": str,
+    "summary_csv": str,
+    "streaming": bool,
+    "event_log_directory": str,
+    "optimal_assignment": bool,
+    "max_workers": int,
+    "exact_arithmetic": bool,
+    "columnar": bool,
+}
+_TYPE_NAMES = {
+    str: "string",
+    bool: "boolean",
+    int: "integer",
+    list[str]: "array of strings",
+    dict[int, str]: "table of strings by year",
+}
+
+
+def _is_instance(value: typing.Any, expected_type: typing.Any) -> bool:
+    if expected_type == list[str]:
+        return isinstance(value, list) and all(isinstance(item, str) for item in value)
+    if expected_type == dict[int, str]:
+        return isinstance(value, dict) and all(
+            isinstance(key, int) and isinstance(item, str)
+            for key, item in value.items()
+        )
+    if expected_type is int:
+        # 'bool' is subclass of 'int'
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, expected_type)
+
+
+def convert_dict_to_config(config_dict: dict[str, typing.Any]) -> Config:
+    """Validate parsed TOML and convert to 'Config'
+
+    Years in '[tax_modes_by_year]' are TOML keys (strings)
+    """
+    names = {field.name for field in dataclasses.fields(Config)}
+    unknown_names = sorted(set(config_dict) - names)
+    if unknown_names:
+        raise ValueError(f"unknown configuration keys: {', '.join(unknown_names)}")
+    missing_names = sorted(
+        field.name
+        for field in dataclasses.fields(Config)
+        if field.default is dataclasses.MISSING
+        and field.default_factory is dataclasses.MISSING
+        and field.name not in config_dict
+    )
+    if missing_names:
+        raise ValueError(f"missing configuration keys: {', '.join(missing_names)}")
+    config_dict = dict(config_dict)
+    tax_modes_by_year = config_dict["tax_modes_by_year"]
+    if isinstance(tax_modes_by_year, dict):
+        try:
+            config_dict["tax_modes_by_year"] = {
+                int(year): tax_mode for year, tax_mode in tax_modes_by_year.items()
+            }
+        except ValueError:
+            raise ValueError(
+                f"expected years as keys of 'tax_modes_by_year', "
+                f"got {list(tax_modes_by_year)} instead"
+            ) from None
+    return Config(**config_dict)
+
+
+def read_config(file_path: typing.Union[str, os.PathLike]) -> Config:
+    """Read configuration from TOML file
+
+    Raises ValueError if file is not valid TOML or configuration is
+    invalid
+    """
+    with open(file_path, "rb") as file:
+        try:
+            config_dict = tomllib.load(file)
+        except tomllib.TOMLDecodeError as exception:
+            raise ValueError(f"invalid TOML in {file_path}: {exception}") from None
+    return convert_dict_to_config(config_dict)
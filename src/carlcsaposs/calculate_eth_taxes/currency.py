@@ -19,6 +19,9 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import dataclasses
 import datetime
 import decimal
+import functools
+import operator
+import typing
 
 from . import file_writer
 from . import utils
@@ -38,15 +41,52 @@ class SpentETH:
     amount_wei: int  # Wei: 10^-18 ETH
     cost_usd_including_fees: int
     proceeds_usd_excluding_fees: int
+    # First day spending is long term; see 'utils.calculate_long_term_ordinal'
+    # Calculated from 'time_acquired'
+    long_term_ordinal: int = dataclasses.field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
-        for attribute in ["cost_usd_including_fees", "proceeds_usd_excluding_fees"]:
-            utils.NumberDomain.NON_NEGATIVE.validate_number(
-                attribute, getattr(self, attribute)
+        self.long_term_ordinal = utils.calculate_long_term_ordinal(self.time_acquired)
+        _validate_spent_eth(self)
+
+    @classmethod
+    def create_trusted(
+        cls,
+        time_acquired: datetime.datetime,
+        time_spent: datetime.datetime,
+        amount_wei: int,
+        cost_usd_including_fees: int,
+        proceeds_usd_excluding_fees: int,
+        long_term_ordinal: int,
+    ) -> "SpentETH":
+        """Create instance without validation
+
+        For 'SpentETH' derived by this program; validate with
+        'validate_spent_eths' (unless 'utils.EAGER_VALIDATION')
+        """
+        if utils.EAGER_VALIDATION:
+            return cls(
+                time_acquired,
+                time_spent,
+                amount_wei,
+                cost_usd_including_fees,
+                proceeds_usd_excluding_fees,
             )
-        utils.NumberDomain.POSITIVE.validate_number("amount_wei", self.amount_wei)
-        if self.time_spent <= self.time_acquired:
-            raise ValueError("'time_spent' must be after 'time_acquired'")
+        spent_eth = object.__new__(cls)
+        spent_eth.__dict__.update(
+            time_acquired=time_acquired,
+            time_spent=time_spent,
+            amount_wei=amount_wei,
+            cost_usd_including_fees=cost_usd_including_fees,
+            proceeds_usd_excluding_fees=proceeds_usd_excluding_fees,
+            long_term_ordinal=long_term_ordinal,
+        )
+        return spent_eth
+
+    @property
+    def is_long_term(self) -> bool:
+        """Whether capital gain or loss is long term"""
+        return self.time_spent.toordinal() >= self.long_term_ordinal
 
     def convert_to_form_8949_row(self) -> file_writer.Form8949Row:
         """Convert to Form 8949 row"""
@@ -55,7 +95,7 @@ class SpentETH:
         )
         return file_writer.Form8949Row(
             self.time_spent.year,
-            utils.is_long_term(self.time_acquired, self.time_spent),
+            self.is_long_term,
             f"{amount_eth} ETH",
             self.time_acquired.strftime("%m/%d/%Y"),
             self.time_spent.strftime("%m/%d/%Y"),
@@ -64,6 +104,81 @@ class SpentETH:
         )
 
 
+def _validate_spent_eth(spent_eth: SpentETH) -> None:
+    """Raise ValueError if 'SpentETH' is invalid"""
+    for attribute in ["cost_usd_including_fees", "proceeds_usd_excluding_fees"]:
+        utils.NumberDomain.NON_NEGATIVE.validate_number(
+            attribute, getattr(spent_eth, attribute)
+        )
+    utils.NumberDomain.POSITIVE.validate_number("amount_wei", spent_eth.amount_wei)
+    if spent_eth.time_spent <= spent_eth.time_acquired:
+        raise ValueError("'time_spent' must be after 'time_acquired'")
+
+
+def validate_spent_eths(spent_eths: typing.Sequence[SpentETH]) -> None:
+    """Raise same ValueError as 'SpentETH' for first invalid 'SpentETH'
+
+    Each attribute is checked for all 'SpentETH' at once; 'SpentETH' are
+    only checked one at a time if any is invalid.
+    """
+    is_valid = (
+        all(
+            utils.NumberDomain.NON_NEGATIVE.includes_numbers(
+                map(operator.attrgetter(attribute), spent_eths)
+            )
+            for attribute in ["cost_usd_including_fees", "proceeds_usd_excluding_fees"]
+        )
+        and utils.NumberDomain.POSITIVE.includes_numbers(
+            map(operator.attrgetter("amount_wei"), spent_eths)
+        )
+        and not any(
+            map(
+                operator.le,
+                map(operator.attrgetter("time_spent"), spent_eths),
+                map(operator.attrgetter("time_acquired"), spent_eths),
+            )
+        )
+    )
+    if not is_valid:
+        for spent_eth in spent_eths:
+            _validate_spent_eth(spent_eth)
+
+
+def convert_spent_eths_to_form_8949_rows(
+    spent_eths: typing.Iterable[SpentETH],
+) -> typing.Iterator[file_writer.Form8949Row]:
+    """Convert 'SpentETH' to Form 8949 rows
+
+    Same as 'SpentETH.convert_to_form_8949_row' for each item, except
+    that dates are formatted once for each day and ETH amounts are
+    formatted with integer arithmetic
+
+    Rows are created with 'Form8949Row.create_trusted'; they are valid
+    if 'spent_eths' are valid
+    """
+    dates: dict[int, str] = {}
+    for spent_eth in spent_eths:
+        acquired_ordinal = spent_eth.time_acquired.toordinal()
+        spent_ordinal = spent_eth.time_spent.toordinal()
+        date_acquired = dates.get(acquired_ordinal)
+        if date_acquired is None:
+            date_acquired = dates[acquired_ordinal] = spent_eth.time_acquired.strftime(
+                "%m/%d/%Y"
+            )
+        date_sold = dates.get(spent_ordinal)
+        if date_sold is None:
+            date_sold = dates[spent_ordinal] = spent_eth.time_spent.strftime("%m/%d/%Y")
+        yield file_writer.Form8949Row.create_trusted(
+            spent_eth.time_spent.year,
+            spent_ordinal >= spent_eth.long_term_ordinal,
+            f"{utils.convert_wei_to_eth_string(spent_eth.amount_wei)} ETH",
+            date_acquired,
+            date_sold,
+            spent_eth.proceeds_usd_excluding_fees,
+            spent_eth.cost_usd_including_fees,
+        )
+
+
 @dataclasses.dataclass
 class AcquiredETH:
     """ETH that has been acquired by taxpayer for USD
@@ -76,20 +191,55 @@ class AcquiredETH:
     time_acquired: datetime.datetime
     amount_wei: int  # Wei: 10^-18 ETH
     cost_us_cents_per_eth_including_fees: decimal.Decimal
+    # First day spending is long term; see 'utils.calculate_long_term_ordinal'
+    # Calculated from 'time_acquired'
+    long_term_ordinal: int = dataclasses.field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
+        self.long_term_ordinal = utils.calculate_long_term_ordinal(self.time_acquired)
         for attribute in ["amount_wei", "cost_us_cents_per_eth_including_fees"]:
             utils.NumberDomain.POSITIVE.validate_number(
                 attribute, getattr(self, attribute)
             )
 
+    @classmethod
+    def create_trusted(
+        cls,
+        time_acquired: datetime.datetime,
+        amount_wei: int,
+        cost_us_cents_per_eth_including_fees: decimal.Decimal,
+        long_term_ordinal: int,
+    ) -> "AcquiredETH":
+        """Create instance without validation
+
+        For 'AcquiredETH' derived from a valid 'AcquiredETH' by this
+        program (unless 'utils.EAGER_VALIDATION')
+        """
+        if utils.EAGER_VALIDATION:
+            return cls(
+                time_acquired,
+                amount_wei,
+                cost_us_cents_per_eth_including_fees,
+            )
+        acquired_eth = object.__new__(cls)
+        acquired_eth.__dict__.update(
+            time_acquired=time_acquired,
+            amount_wei=amount_wei,
+            cost_us_cents_per_eth_including_fees=cost_us_cents_per_eth_including_fees,
+            long_term_ordinal=long_term_ordinal,
+        )
+        return acquired_eth
+
     def convert_to_spent_eth(
         self,
         time_spent: datetime.datetime,
         proceeds_us_cents_per_eth_excluding_fees: decimal.Decimal,
     ) -> SpentETH:
-        """Convert to 'SpentETH'"""
-        return SpentETH(
+        """Convert to 'SpentETH'
+
+        Created with 'SpentETH.create_trusted'
+        """
+        return SpentETH.create_trusted(
             self.time_acquired,
             time_spent,
             self.amount_wei,
@@ -101,15 +251,75 @@ class AcquiredETH:
                 (self.amount_wei * proceeds_us_cents_per_eth_excluding_fees)
                 / decimal.Decimal(100 * 10**18)
             ),  # 100 is cents to dollars, 10**18 is Wei to ETH
+            self.long_term_ordinal,
         )
 
-    def remove_wei(self, amount_wei: int) -> "AcquiredETH":
-        """Move ETH into new instance"""
+    @functools.cached_property
+    def cost_usd_per_wei_including_fees(self) -> tuple[int, int]:
+        """Exact cost as (numerator, denominator)"""
+        return utils.convert_us_cents_per_eth_to_usd_per_wei(
+            self.cost_us_cents_per_eth_including_fees
+        )
+
+    def convert_to_spent_eth_exact(
+        self,
+        time_spent: datetime.datetime,
+        proceeds_usd_per_wei_excluding_fees: tuple[int, int],
+    ) -> SpentETH:
+        """Convert to 'SpentETH' with integer arithmetic
+
+        Same as 'convert_to_spent_eth', except that intermediate results
+        are not rounded to the decimal context precision
+        """
+        cost_numerator, cost_denominator = self.cost_usd_per_wei_including_fees
+        proceeds_numerator, proceeds_denominator = proceeds_usd_per_wei_excluding_fees
+        return SpentETH.create_trusted(
+            self.time_acquired,
+            time_spent,
+            self.amount_wei,
+            utils.round_fraction_to_int(
+                self.amount_wei * cost_numerator, cost_denominator
+            ),
+            utils.round_fraction_to_int(
+                self.amount_wei * proceeds_numerator, proceeds_denominator
+            ),
+            self.long_term_ordinal,
+        )
+
+    def _check_part(self, amount_wei: int) -> None:
         if not 0 < amount_wei < self.amount_wei:
             raise ValueError(
                 f"expected value between 0 and {self.amount_wei}, got {amount_wei} instead"
             )
+
+    def _copy_part(self, amount_wei: int) -> "AcquiredETH":
+        """New instance with 'amount_wei' of this one"""
+        acquired_eth = AcquiredETH.create_trusted(
+            self.time_acquired,
+            amount_wei,
+            self.cost_us_cents_per_eth_including_fees,
+            self.long_term_ordinal,
+        )
+        # Copy cached property instead of converting cost again
+        if "cost_usd_per_wei_including_fees" in self.__dict__:
+            acquired_eth.cost_usd_per_wei_including_fees = (
+                self.cost_usd_per_wei_including_fees
+            )
+        return acquired_eth
+
+    def remove_wei(self, amount_wei: int) -> "AcquiredETH":
+        """Move ETH into new instance"""
+        self._check_part(amount_wei)
         self.amount_wei -= amount_wei
-        return AcquiredETH(
-            self.time_acquired, amount_wei, self.cost_us_cents_per_eth_including_fees
+        return self._copy_part(amount_wei)
+
+    def split_wei(self, amount_wei: int) -> tuple["AcquiredETH", "AcquiredETH"]:
+        """Split into new instances: ETH removed and rest
+
+        Same as 'remove_wei', except that this instance is not modified
+        (e.g. if it is shared by a 'persistent_inventory.PersistentLotIndex')
+        """
+        self._check_part(amount_wei)
+        return self._copy_part(amount_wei), self._copy_part(
+            self.amount_wei - amount_wei
         )
@@ -0,0 +1,208 @@
+"""
+event_log: Cache of currency exchange transactions read from input files
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import decimal
+import functools
+import hashlib
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+import typing
+
+from . import assignment
+from . import exchange_transactions
+from . import file_reader
+from . import utils
+
+# Increment if file format changes
+FORMAT_VERSION = 1
+
+_MAGIC = b"ETHEVLOG"
+# Magic, format version, input key, number of records
+_HEADER = struct.Struct("<8sI32sQ")
+# Type, time (microseconds since 'datetime.datetime.min'), amount (wei),
+# length of price string
+_RECORD = struct.Struct("<Bq16sH")
+_TYPES: list[type[exchange_transactions.CurrencyExchange]] = [
+    exchange_transactions.Acquire,
+    exchange_transactions.Spend,
+]
+# Modules used by 'file_reader.read_files'
+_PARSING_MODULES = (assignment, exchange_transactions, file_reader, utils)
+
+
+def calculate_input_key(
+    input_directory: typing.Union[str, os.PathLike],
+    file_names: typing.Iterable[str],
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+    optimal_assignment: bool = False,
+) -> bytes:
+    """SHA-256 of everything that 'file_reader.read_files' output depends on
+
+    Includes name (relative to 'input_directory') and content of each
+    input file, blocklist, options and source code of each module in
+    '_PARSING_MODULES' (which contains overrides for specific
+    transactions)
+    """
+    hash_ = hashlib.sha256()
+
+    def update(data: bytes) -> None:
+        # Length prefix so that concatenations are unambiguous
+        hash_.update(len(data).to_bytes(8, "little"))
+        hash_.update(data)
+
+    update(str(FORMAT_VERSION).encode())
+    for module in _PARSING_MODULES:
+        update(module.__name__.encode())
+        update(pathlib.Path(typing.cast(str, module.__file__)).read_bytes())
+    update(b"\0")
+    for file_name in file_names:
+        # Etherscan file name contains wallet address
+        update(file_name.encode())
+        file_hash = hashlib.sha256()
+        with open(pathlib.Path(input_directory) / file_name, "rb") as file:
+            for chunk in iter(functools.partial(file.read, 2**20), b""):
+                file_hash.update(chunk)
+        update(file_hash.digest())
+    update(b"\0")
+    for transfer_id in blocklisted_coinbase_pro_transfer_ids:
+        update(transfer_id.encode())
+    update(b"\0")
+    update(str(optimal_assignment).encode())
+    return hash_.digest()
+
+
+def _get_price(transaction: exchange_transactions.CurrencyExchange) -> decimal.Decimal:
+    if isinstance(transaction, exchange_transactions.Acquire):
+        return transaction.cost_us_cents_per_eth_including_fees
+    if isinstance(transaction, exchange_transactions.Spend):
+        return transaction.proceeds_us_cents_per_eth_excluding_fees
+    raise TypeError
+
+
+def write_event_log(
+    file_path: typing.Union[str, os.PathLike],
+    key: bytes,
+    transactions: typing.Sequence[exchange_transactions.CurrencyExchange],
+) -> None:
+    """Save transactions, in order, to event log file
+
+    Decimals are stored as strings, so they are read back exactly
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=pathlib.Path(file_path).parent, suffix=".tmp", delete=False
+    ) as file:
+        try:
+            file.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, key, len(transactions)))
+            for transaction in transactions:
+                price = str(_get_price(transaction)).encode()
+                file.write(
+                    _RECORD.pack(
+                        _TYPES.index(type(transaction)),
+                        utils.convert_datetime_to_microseconds(transaction.time),
+                        transaction.amount_wei.to_bytes(16, "little", signed=True),
+                        len(price),
+                    )
+                )
+                file.write(price)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    # Readers never see partially written file
+    os.replace(file.name, file_path)
+
+
+def read_event_log(
+    file_path: typing.Union[str, os.PathLike], key: bytes
+) -> typing.Optional[list[exchange_transactions.CurrencyExchange]]:
+    """Read transactions from event log file
+
+    Returns None if file does not exist or was written for another key
+    or format version
+    """
+    try:
+        file = open(file_path, "rb")  # pylint: disable=consider-using-with
+    except FileNotFoundError:
+        return None
+    with file:
+        if os.fstat(file.fileno()).st_size < _HEADER.size:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, format_version, file_key, count = _HEADER.unpack_from(buffer)
+            if magic != _MAGIC or format_version != FORMAT_VERSION or file_key != key:
+                return None
+            transactions: list[exchange_transactions.CurrencyExchange] = []
+            offset = _HEADER.size
+            for _ in range(count):
+                type_index, microseconds, amount, price_length = _RECORD.unpack_from(
+                    buffer, offset
+                )
+                offset += _RECORD.size
+                price = decimal.Decimal(buffer[offset : offset + price_length].decode())
+                offset += price_length
+                transactions.append(
+                    _TYPES[type_index](
+                        utils.convert_microseconds_to_datetime(microseconds),
+                        int.from_bytes(amount, "little", signed=True),
+                        price,
+                    )
+                )
+    return transactions
+
+
+def read_files(
+    event_log_directory: typing.Union[str, os.PathLike],
+    etherscan_csvs: list[str],
+    coinbase_csv: str,
+    coinbase_pro_csv: str,
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+    optimal_assignment: bool = False,
+    max_workers: typing.Optional[int] = None,
+    input_directory: typing.Optional[str] = None,
+) -> file_reader.ExchangeTransactions:
+    """Same as 'file_reader.read_files', cached in event log
+
+    If inputs have not changed since event log was written, transactions
+    are replayed from event log without reading CSV files
+    """
+    if input_directory is None:
+        input_directory = file_reader.INPUT_DIRECTORY
+    key = calculate_input_key(
+        input_directory,
+        [*etherscan_csvs, coinbase_csv, coinbase_pro_csv],
+        blocklisted_coinbase_pro_transfer_ids,
+        optimal_assignment,
+    )
+    file_path = pathlib.Path(event_log_directory) / f"{key.hex()}.eventlog"
+    transactions = read_event_log(file_path, key)
+    if transactions is None:
+        transactions = file_reader.read_files(
+            etherscan_csvs,
+            coinbase_csv,
+            coinbase_pro_csv,
+            blocklisted_coinbase_pro_transfer_ids,
+            optimal_assignment,
+            max_workers,
+            input_directory,
+        )
+        pathlib.Path(event_log_directory).mkdir(parents=True, exist_ok=True)
+        write_event_log(file_path, key, transactions)
+    return transactions
@@ -19,8 +19,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import dataclasses
 import datetime
 import decimal
+import functools
+import heapq
+import operator
+import typing
 
 from . import currency
+from . import utils
 
 
 @dataclasses.dataclass
@@ -49,3 +54,20 @@ class Spend(CurrencyExchange):
     """ETH to USD (including as fee)"""
 
     proceeds_us_cents_per_eth_excluding_fees: decimal.Decimal
+
+    @functools.cached_property
+    def proceeds_usd_per_wei_excluding_fees(self) -> tuple[int, int]:
+        """Exact proceeds as (numerator, denominator)"""
+        return utils.convert_us_cents_per_eth_to_usd_per_wei(
+            self.proceeds_us_cents_per_eth_excluding_fees
+        )
+
+
+def merge_in_chronological_order(
+    streams: typing.Iterable[typing.Iterable[CurrencyExchange]],
+) -> typing.Iterator[CurrencyExchange]:
+    """Merge streams of transactions, each in chronological order
+
+    Stable; same order as sorting concatenated streams by time
+    """
+    return heapq.merge(*streams, key=operator.attrgetter("time"))
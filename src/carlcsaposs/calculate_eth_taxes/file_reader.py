@@ -17,14 +17,22 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 # TODO: Add dataclasses for CSV files
+import bisect
+import concurrent.futures
 import csv
 import dataclasses
 import datetime
 import decimal
 import enum
+import functools
+import heapq
+import itertools
+import operator
 import typing
 
+from . import assignment
 from . import exchange_transactions
+from . import instrumentation
 from . import utils
 
 
@@ -55,56 +63,123 @@ class WalletTransaction:
         )
 
 
+INPUT_DIRECTORY = "/home/user/QubesIncoming/files/calculate-eth-taxes/input"
+
+
+def get_input_path(file_name: str, input_directory: typing.Optional[str]) -> str:
+    """Path of input file in 'input_directory' (default 'INPUT_DIRECTORY')"""
+    if input_directory is None:
+        input_directory = INPUT_DIRECTORY
+    return f"{input_directory}/{file_name}"
+
+
+# Columns used from Etherscan CSV, in order of
+# 'convert_etherscan_row_to_wallet_transaction' arguments
+ETHERSCAN_COLUMNS = (
+    "Txhash",
+    "UnixTimestamp",
+    "From",
+    "To",
+    "Value_IN(ETH)",
+    "Value_OUT(ETH)",
+    "TxnFee(ETH)",
+    "Historical $Price/Eth",
+    "Status",
+    "ErrCode",
+)
+
+
+def convert_etherscan_row_to_wallet_transaction(
+    transaction_hash: str,
+    unix_timestamp: str,
+    wallet_from: str,
+    wallet_to: str,
+    amount_in_eth: str,
+    amount_out_eth: str,
+    fee_eth: str,
+    usd_per_eth: str,
+    status: str,
+    error_code: str,
+) -> WalletTransaction:
+    """Convert Etherscan CSV row to 'WalletTransaction'"""
+    amount_in = utils.convert_eth_string_to_wei(amount_in_eth)
+    amount_out = utils.convert_eth_string_to_wei(amount_out_eth)
+    assert amount_in == 0 or amount_out == 0
+    amount_wei = amount_in or amount_out
+    # Check for error
+    if status == "Error(0)" and error_code == "Out of gas":
+        # If there is an error, no ETH will be transferred but the fee will
+        # still be lost
+        amount_wei = 0
+    # HACK: Override for internal transaction
+    elif (
+        transaction_hash
+        == "0x6f0b139844b33d88d6ee6acedfb8cf4ba1f5d6e8b9d85d91d14ab238a9f8a443"
+    ):
+        amount_wei -= 2837798149744091
+        assert amount_wei == 56755962994881820
+    else:
+        assert status == "" and error_code == ""
+    return WalletTransaction(
+        datetime.datetime.fromtimestamp(int(unix_timestamp)),
+        wallet_from,
+        wallet_to,
+        amount_wei,
+        utils.convert_eth_string_to_wei(fee_eth),
+        utils.convert_usd_per_eth_string_to_us_cents_per_eth(usd_per_eth),
+    )
+
+
+def convert_etherscan_file_name_to_wallet_address(file_name: str) -> str:
+    """Get wallet address from Etherscan CSV file name"""
+    wallet_address = file_name.split("-")[1].split(".")[0].lower()
+    assert len(wallet_address) == 42
+    return wallet_address
+
+
+def iterate_etherscan_csv(
+    file: typing.Iterable[str], header: typing.Optional[list[str]] = None
+) -> typing.Iterator[WalletTransaction]:
+    """Yield transactions from lines of Etherscan CSV, one at a time
+
+    If 'header', lines do not include header row
+    """
+    reader = csv.reader(file)
+    if header is None:
+        header = next(reader, None)
+        if header is None:
+            return
+    # Look up columns once instead of building a dict for each row
+    get_columns = operator.itemgetter(*map(header.index, ETHERSCAN_COLUMNS))
+    for row in reader:
+        yield convert_etherscan_row_to_wallet_transaction(*get_columns(row))
+
+
+def iterate_etherscan_wallets(
+    wallet_csvs: list[str], input_directory: typing.Optional[str] = None
+) -> typing.Iterator[tuple[str, WalletTransaction]]:
+    """Yield (wallet address, transaction) from each Etherscan wallet CSV
+
+    Files are read one row at a time
+    """
+    for file_name in wallet_csvs:
+        wallet_address = convert_etherscan_file_name_to_wallet_address(file_name)
+        file_path = get_input_path(file_name, input_directory)
+        with open(file_path, "r", encoding="utf-8") as file:
+            for transaction in iterate_etherscan_csv(file):
+                yield (wallet_address, transaction)
+
+
 def read_etherscan_wallets(
-    wallet_csvs: list[str],
+    wallet_csvs: list[str], input_directory: typing.Optional[str] = None
 ) -> dict[str, list[WalletTransaction]]:
     """Read list of transactions from each Etherscan wallet CSV"""
     transactions_by_wallet: dict[str, list[WalletTransaction]] = {}
     for file_name in wallet_csvs:
-        with open(
-            f"/home/user/QubesIncoming/files/calculate-eth-taxes/input/{file_name}",
-            "r",
-            encoding="utf-8",
-        ) as file:
-            wallet_address = file_name.split("-")[1].split(".")[0].lower()
-            assert len(wallet_address) == 42
-            transactions_by_wallet[wallet_address] = []
-            for row in csv.DictReader(file):
-
-                def convert_eth_to_wei(amount_eth: str) -> int:
-                    return utils.round_decimal_to_int(
-                        decimal.Decimal(amount_eth) * 10**18
-                    )
-
-                amount_in = convert_eth_to_wei(row["Value_IN(ETH)"])
-                amount_out = convert_eth_to_wei(row["Value_OUT(ETH)"])
-                assert amount_in == 0 or amount_out == 0
-                amount_wei = amount_in or amount_out
-                # Check for error
-                if row["Status"] == "Error(0)" and row["ErrCode"] == "Out of gas":
-                    # If there is an error, no ETH will be transferred but the fee will still be lost
-                    amount_wei = 0
-                # HACK: Override for internal transaction
-                elif (
-                    row["Txhash"]
-                    == "0x6f0b139844b33d88d6ee6acedfb8cf4ba1f5d6e8b9d85d91d14ab238a9f8a443"
-                ):
-                    amount_wei -= 2837798149744091
-                    assert amount_wei == 56755962994881820
-                else:
-                    assert row["Status"] == "" and row["ErrCode"] == ""
-                transactions_by_wallet[wallet_address].append(
-                    WalletTransaction(
-                        datetime.datetime.fromtimestamp(int(row["UnixTimestamp"])),
-                        row["From"],
-                        row["To"],
-                        amount_wei,
-                        utils.round_decimal_to_int(
-                            decimal.Decimal(row["TxnFee(ETH)"]) * 10**18
-                        ),
-                        decimal.Decimal(row["Historical $Price/Eth"]) * 100,
-                    )
-                )
+        wallet_address = convert_etherscan_file_name_to_wallet_address(file_name)
+        file_path = get_input_path(file_name, input_directory)
+        with open(file_path, "r", encoding="utf-8") as file:
+            transactions_by_wallet[wallet_address] = list(iterate_etherscan_csv(file))
     return transactions_by_wallet
 
 
@@ -137,12 +212,85 @@ def convert_coinbase_pro_timestamp_to_datetime(
     return datetime.datetime.strptime(coinbase_pro_timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
 
 
+def _parse_timestamp_seconds(timestamp: str) -> typing.Optional[datetime.datetime]:
+    """Parse 'YYYY-MM-DDTHH:MM:SS' prefix of timestamp by position
+
+    Returns None if prefix does not match format
+    """
+    digits = (
+        timestamp[0:4]
+        + timestamp[5:7]
+        + timestamp[8:10]
+        + timestamp[11:13]
+        + timestamp[14:16]
+        + timestamp[17:19]
+    )
+    if (
+        len(digits) != 14
+        or not digits.isascii()
+        or not digits.isdecimal()
+        or timestamp[4] != "-"
+        or timestamp[7] != "-"
+        or timestamp[10] != "T"
+        or timestamp[13] != ":"
+        or timestamp[16] != ":"
+    ):
+        return None
+    try:
+        return datetime.datetime(
+            int(digits[0:4]),
+            int(digits[4:6]),
+            int(digits[6:8]),
+            int(digits[8:10]),
+            int(digits[10:12]),
+            int(digits[12:14]),
+        )
+    except ValueError:
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_coinbase_timestamp(coinbase_timestamp: str) -> datetime.datetime:
+    """Convert Coinbase CSV timestamp string to datetime
+
+    Same as 'convert_coinbase_timestamp_to_datetime', which is used as
+    fallback for malformed timestamps. Cached for repeated timestamps
+    """
+    if len(coinbase_timestamp) == 20 and coinbase_timestamp[19] == "Z":
+        time = _parse_timestamp_seconds(coinbase_timestamp)
+        if time is not None:
+            return time
+    return convert_coinbase_timestamp_to_datetime(coinbase_timestamp)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_coinbase_pro_timestamp(coinbase_pro_timestamp: str) -> datetime.datetime:
+    """Convert Coinbase Pro CSV timestamp string to datetime
+
+    Same as 'convert_coinbase_pro_timestamp_to_datetime', which is used
+    as fallback for malformed timestamps. Cached for repeated timestamps
+    (e.g. fills in the same order)
+    """
+    fraction = coinbase_pro_timestamp[20:-1]
+    if (
+        22 <= len(coinbase_pro_timestamp) <= 27
+        and coinbase_pro_timestamp[19] == "."
+        and coinbase_pro_timestamp[-1] == "Z"
+        and fraction.isascii()
+        and fraction.isdecimal()
+    ):
+        time = _parse_timestamp_seconds(coinbase_pro_timestamp)
+        if time is not None:
+            return time.replace(microsecond=int(fraction.ljust(6, "0")))
+    return convert_coinbase_pro_timestamp_to_datetime(coinbase_pro_timestamp)
+
+
 CoinbaseTransferTransactions = list[CoinbaseTransferTransaction]
 ExchangeTransactions = list[exchange_transactions.CurrencyExchange]
 
 
 def read_coinbase_transactions(
-    coinbase_csv: str,
+    coinbase_csv: str, input_directory: typing.Optional[str] = None
 ) -> tuple[CoinbaseTransferTransactions, ExchangeTransactions]:
     """Read transactions from Coinbase CSV
 
@@ -151,16 +299,13 @@ def read_coinbase_transactions(
     """
     coinbase_transfer_transactions: CoinbaseTransferTransactions = []
     exchange_transactions_: ExchangeTransactions = []
-    with open(
-        f"/home/user/QubesIncoming/files/calculate-eth-taxes/input/{coinbase_csv}",
-        "r",
-        encoding="utf-8",
-    ) as file:
+    file_path = get_input_path(coinbase_csv, input_directory)
+    with open(file_path, "r", encoding="utf-8") as file:
         for row in csv.DictReader(file):
             assert row["Asset"] == "ETH"
-            time = convert_coinbase_timestamp_to_datetime(row["Timestamp"])
+            time = parse_coinbase_timestamp(row["Timestamp"])
             amount_eth = decimal.Decimal(row["Quantity Transacted"])
-            amount_wei = utils.round_decimal_to_int(amount_eth * 10**18)
+            amount_wei = utils.convert_eth_string_to_wei(row["Quantity Transacted"])
             if row["Transaction Type"] == "Buy":
                 exchange_transactions_.append(
                     exchange_transactions.Acquire(
@@ -195,26 +340,37 @@ def read_coinbase_transactions(
 
 
 def read_coinbase_pro_transactions(
-    coinbase_pro_csv: str, blocklisted_coinbase_pro_transfer_ids: list[str]
+    coinbase_pro_csv: str,
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+    input_directory: typing.Optional[str] = None,
 ) -> tuple[CoinbaseTransferTransactions, ExchangeTransactions]:
     """Read transactions from Coinbase Pro CSV
 
     Read Coinbase transfer transactions and currency exchange
     transactions
     """
+    file_path = get_input_path(coinbase_pro_csv, input_directory)
+    with open(file_path, "r", encoding="utf-8") as file:
+        return convert_coinbase_pro_rows(
+            csv.DictReader(file), blocklisted_coinbase_pro_transfer_ids
+        )
+
+
+def convert_coinbase_pro_rows(
+    rows: typing.Iterable[dict[str, str]],
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+) -> tuple[CoinbaseTransferTransactions, ExchangeTransactions]:
+    """Convert Coinbase Pro CSV rows, except blocklisted transfers
+
+    Rows must not start or end in the middle of an order
+    """
     coinbase_transfer_transactions: CoinbaseTransferTransactions = []
     exchange_transactions_: ExchangeTransactions = []
-
-    coinbase_pro_rows: list[dict[str, str]] = []
-    with open(
-        f"/home/user/QubesIncoming/files/calculate-eth-taxes/input/{coinbase_pro_csv}",
-        "r",
-        encoding="utf-8",
-    ) as file:
-        for row in csv.DictReader(file):
-            if row["transfer id"] in blocklisted_coinbase_pro_transfer_ids:
-                continue
-            coinbase_pro_rows.append(row)
+    coinbase_pro_rows = [
+        row
+        for row in rows
+        if row["transfer id"] not in blocklisted_coinbase_pro_transfer_ids
+    ]
 
     class CoinbaseProOrderMatchRow:
         """ETH or USD acquired/sold in Coinbase Pro ETH/USD trade"""
@@ -232,7 +388,7 @@ def read_coinbase_pro_transactions(
 
         def __init__(self, row: dict[str, str]):
             self.order_id = row["order id"]
-            self.time = convert_coinbase_pro_timestamp_to_datetime(row["time"])
+            self.time = parse_coinbase_pro_timestamp(row["time"])
             self.amount = decimal.Decimal(row["amount"])
             self.unit = self.Unit[row["amount/balance unit"]]
 
@@ -259,8 +415,8 @@ def read_coinbase_pro_transactions(
             # USD for ETH
             if first_match_order.unit == CoinbaseProOrderMatchRow.Unit.USD:
                 assert second_match_order.unit == CoinbaseProOrderMatchRow.Unit.ETH
-                amount_wei = utils.round_decimal_to_int(
-                    second_match_order.amount * 10**18
+                amount_wei = utils.convert_eth_string_to_wei(
+                    coinbase_pro_rows[index - 1]["amount"]
                 )
                 cost_us_cents_per_eth_including_fees = (
                     -first_match_order.amount * 100 / second_match_order.amount
@@ -276,8 +432,8 @@ def read_coinbase_pro_transactions(
             # ETH for USD
             elif first_match_order.unit == CoinbaseProOrderMatchRow.Unit.ETH:
                 assert second_match_order.unit == CoinbaseProOrderMatchRow.Unit.USD
-                amount_wei = utils.round_decimal_to_int(
-                    -first_match_order.amount * 10**18
+                amount_wei = -utils.convert_eth_string_to_wei(
+                    coinbase_pro_rows[index - 2]["amount"]
                 )
                 fee = decimal.Decimal(row["amount"])
                 assert fee < 0
@@ -300,10 +456,8 @@ def read_coinbase_pro_transactions(
         if row["amount/balance unit"] == "USD":
             continue
         assert row["amount/balance unit"] == "ETH"
-        time = convert_coinbase_pro_timestamp_to_datetime(row["time"])
-        amount_wei = utils.round_decimal_to_int(
-            decimal.Decimal(row["amount"]) * 10**18
-        )
+        time = parse_coinbase_pro_timestamp(row["time"])
+        amount_wei = utils.convert_eth_string_to_wei(row["amount"])
         if row["type"] == "withdrawal":
             amount_wei = -amount_wei
             type_ = CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
@@ -316,105 +470,511 @@ def read_coinbase_pro_transactions(
     return (coinbase_transfer_transactions, exchange_transactions_)
 
 
+# 1000000000000000 wei = .001 ETH
+TRANSFER_AMOUNT_TOLERANCE_WEI = 1000000000000000
+TRANSFER_TIME_TOLERANCE = datetime.timedelta(minutes=15)
+
+
+class _WalletTransferIndex:
+    """Etherscan wallet transactions sorted by time
+
+    Amounts are indexed for each Coinbase transfer direction; ETH sent
+    from Coinbase is compared to wallet transaction amount plus fee
+    """
+
+    def __init__(
+        self, wallet_transactions_by_wallet: dict[str, list[WalletTransaction]]
+    ):
+        self.transactions = sorted(
+            (
+                transaction
+                for transactions in wallet_transactions_by_wallet.values()
+                for transaction in transactions
+            ),
+            key=lambda transaction: transaction.time,
+        )
+        self.times = [transaction.time for transaction in self.transactions]
+        self._amounts_wei = {
+            CoinbaseTransferTransaction.TransactionType.FROM_COINBASE: [
+                transaction.amount_wei + transaction.fee_wei
+                for transaction in self.transactions
+            ],
+            CoinbaseTransferTransaction.TransactionType.TO_COINBASE: [
+                transaction.amount_wei for transaction in self.transactions
+            ],
+        }
+
+    def find_matches(
+        self, coinbase_transaction: CoinbaseTransferTransaction
+    ) -> list[int]:
+        """Indexes of wallet transactions within tolerances of transfer"""
+        amounts_wei = self._amounts_wei[coinbase_transaction.type_]
+        start = bisect.bisect_right(
+            self.times, coinbase_transaction.time - TRANSFER_TIME_TOLERANCE
+        )
+        stop = bisect.bisect_left(
+            self.times, coinbase_transaction.time + TRANSFER_TIME_TOLERANCE
+        )
+        if instrumentation.ENABLED:
+            instrumentation.count("correlation_candidates", stop - start)
+        return [
+            index
+            for index in range(start, stop)
+            if abs(amounts_wei[index] - coinbase_transaction.amount_wei)
+            < TRANSFER_AMOUNT_TOLERANCE_WEI
+        ]
+
+
+class CoinbaseTransferIndex:
+    """Coinbase transfers sorted by time, for each direction
+
+    Wallet transactions are matched one at a time, in order of wallet,
+    then row; each transfer is matched to the first matching wallet
+    transaction
+    """
+
+    def __init__(self, coinbase_transfer_transactions: CoinbaseTransferTransactions):
+        self._transactions = sorted(
+            coinbase_transfer_transactions, key=lambda transaction: transaction.time
+        )
+        self._matched = [False] * len(self._transactions)
+        self._times: dict[
+            CoinbaseTransferTransaction.TransactionType, list[datetime.datetime]
+        ] = {type_: [] for type_ in CoinbaseTransferTransaction.TransactionType}
+        self._indexes: dict[CoinbaseTransferTransaction.TransactionType, list[int]] = {
+            type_: [] for type_ in CoinbaseTransferTransaction.TransactionType
+        }
+        for index, transaction in enumerate(self._transactions):
+            self._times[transaction.type_].append(transaction.time)
+            self._indexes[transaction.type_].append(index)
+
+    def _match_direction(
+        self,
+        type_: CoinbaseTransferTransaction.TransactionType,
+        time: datetime.datetime,
+        amount_wei: int,
+    ) -> bool:
+        """Mark unmatched transfers within tolerances as matched"""
+        times = self._times[type_]
+        start = bisect.bisect_right(times, time - TRANSFER_TIME_TOLERANCE)
+        stop = bisect.bisect_left(times, time + TRANSFER_TIME_TOLERANCE)
+        if instrumentation.ENABLED:
+            instrumentation.count("correlation_candidates", stop - start)
+        matched = False
+        for index in self._indexes[type_][start:stop]:
+            if (
+                not self._matched[index]
+                and abs(amount_wei - self._transactions[index].amount_wei)
+                < TRANSFER_AMOUNT_TOLERANCE_WEI
+            ):
+                self._matched[index] = True
+                matched = True
+        return matched
+
+    def match(self, transaction: WalletTransaction) -> WalletTransaction:
+        """Mark wallet transaction to or from Coinbase, if matched
+
+        Returns 'transaction'
+        """
+        if self._match_direction(
+            CoinbaseTransferTransaction.TransactionType.FROM_COINBASE,
+            transaction.time,
+            transaction.amount_wei + transaction.fee_wei,
+        ):
+            transaction.wallet_from = "coinbase"
+        if self._match_direction(
+            CoinbaseTransferTransaction.TransactionType.TO_COINBASE,
+            transaction.time,
+            transaction.amount_wei,
+        ):
+            transaction.wallet_to = "coinbase"
+        return transaction
+
+    @property
+    def unmatched_transactions(self) -> CoinbaseTransferTransactions:
+        """Transfers not matched yet, in chronological order"""
+        return [
+            transaction
+            for transaction, matched in zip(self._transactions, self._matched)
+            if not matched
+        ]
+
+
+def correlate_coinbase_transfers(
+    coinbase_transfer_transactions: CoinbaseTransferTransactions,
+    wallet_transactions_by_wallet: dict[str, list[WalletTransaction]],
+    optimal_assignment: bool = False,
+) -> CoinbaseTransferTransactions:
+    """Mark Etherscan wallet transactions to or from Coinbase
+
+    A wallet transaction matches a Coinbase transfer if the amounts
+    differ by less than 'TRANSFER_AMOUNT_TOLERANCE_WEI' and the times
+    differ by less than 'TRANSFER_TIME_TOLERANCE'
+
+    By default, each transfer (in chronological order) is matched to
+    the first matching wallet transaction (in order of wallet, then
+    row). If 'optimal_assignment', each transfer is matched to a
+    different wallet transaction, maximizing the number of matches and
+    then minimizing the total time difference
+
+    Returns transfers without a matching wallet transaction, in
+    chronological order
+    """
+    if not optimal_assignment:
+        transfer_index = CoinbaseTransferIndex(coinbase_transfer_transactions)
+        for transactions in wallet_transactions_by_wallet.values():
+            for transaction in transactions:
+                transfer_index.match(transaction)
+        return transfer_index.unmatched_transactions
+    coinbase_transfer_transactions = sorted(
+        coinbase_transfer_transactions, key=lambda transaction: transaction.time
+    )
+    wallet_index = _WalletTransferIndex(wallet_transactions_by_wallet)
+    match_indexes = [
+        wallet_index.find_matches(coinbase_transaction)
+        for coinbase_transaction in coinbase_transfer_transactions
+    ]
+    assigned_indexes = assignment.assign_optimally(
+        match_indexes,
+        [
+            [
+                abs(
+                    utils.convert_datetime_to_microseconds(time)
+                    - utils.convert_datetime_to_microseconds(coinbase_transaction.time)
+                )
+                for time in map(wallet_index.times.__getitem__, indexes)
+            ]
+            for coinbase_transaction, indexes in zip(
+                coinbase_transfer_transactions, match_indexes
+            )
+        ],
+    )
+    unmatched_transactions: CoinbaseTransferTransactions = []
+    for coinbase_transaction, match_index in zip(
+        coinbase_transfer_transactions, assigned_indexes
+    ):
+        if match_index is None:
+            unmatched_transactions.append(coinbase_transaction)
+            continue
+        transaction = wallet_index.transactions[match_index]
+        if (
+            coinbase_transaction.type_
+            == CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
+        ):
+            transaction.wallet_from = "coinbase"
+        elif (
+            coinbase_transaction.type_
+            == CoinbaseTransferTransaction.TransactionType.TO_COINBASE
+        ):
+            transaction.wallet_to = "coinbase"
+        else:
+            raise ValueError
+    return unmatched_transactions
+
+
+# Minimum bytes in each chunk (except last) of a file read in parallel
+PARALLEL_CHUNK_BYTES = 2**23
+
+# 'WalletTransaction' fields, in order; smaller to pickle than instance
+_WalletTransactionRecord = tuple[datetime.datetime, str, str, int, int, decimal.Decimal]
+
+
+def _read_etherscan_csv_chunk(
+    file_path: str, header: list[str], start: int, stop: int
+) -> list[_WalletTransactionRecord]:
+    """Read Etherscan CSV rows from byte 'start' to 'stop' in worker process"""
+    return [
+        (
+            transaction.time,
+            transaction.wallet_from,
+            transaction.wallet_to,
+            transaction.amount_wei,
+            transaction.fee_wei,
+            transaction.us_cents_per_eth,
+        )
+        for transaction in iterate_etherscan_csv(
+            utils.read_csv_chunk(file_path, start, stop), header
+        )
+    ]
+
+
+def _can_split_coinbase_pro_rows_after(row: dict[str, str]) -> bool:
+    """Whether row is not followed by row of same order"""
+    return row["type"] != "match"
+
+
+def _read_coinbase_pro_csv_chunk(
+    file_path: str,
+    header: list[str],
+    start: int,
+    stop: int,
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+) -> tuple[CoinbaseTransferTransactions, ExchangeTransactions]:
+    """Read Coinbase Pro CSV rows from byte 'start' to 'stop' in worker process"""
+    return convert_coinbase_pro_rows(
+        csv.DictReader(utils.read_csv_chunk(file_path, start, stop), header),
+        blocklisted_coinbase_pro_transfer_ids,
+    )
+
+
+def _read_files_in_parallel(
+    executor: concurrent.futures.Executor,
+    etherscan_csvs: list[str],
+    coinbase_csv: str,
+    coinbase_pro_csv: str,
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+    input_directory: typing.Optional[str],
+) -> tuple[
+    list[tuple[CoinbaseTransferTransactions, ExchangeTransactions]],
+    typing.Iterator[tuple[str, WalletTransaction]],
+]:
+    """Submit each file, in chunks of rows, to 'executor'
+
+    Returns same results as serial readers, in same order
+    """
+    etherscan_futures = []
+    for file_name in etherscan_csvs:
+        wallet_address = convert_etherscan_file_name_to_wallet_address(file_name)
+        file_path = get_input_path(file_name, input_directory)
+        header, offsets = utils.split_csv_file(file_path, PARALLEL_CHUNK_BYTES)
+        for start, stop in zip(offsets, offsets[1:]):
+            etherscan_futures.append(
+                (
+                    wallet_address,
+                    executor.submit(
+                        _read_etherscan_csv_chunk, file_path, header, start, stop
+                    ),
+                )
+            )
+    coinbase_future = executor.submit(
+        read_coinbase_transactions, coinbase_csv, input_directory
+    )
+    file_path = get_input_path(coinbase_pro_csv, input_directory)
+    header, offsets = utils.split_csv_file(
+        file_path, PARALLEL_CHUNK_BYTES, _can_split_coinbase_pro_rows_after
+    )
+    coinbase_pro_futures = [
+        executor.submit(
+            _read_coinbase_pro_csv_chunk,
+            file_path,
+            header,
+            start,
+            stop,
+            blocklisted_coinbase_pro_transfer_ids,
+        )
+        for start, stop in zip(offsets, offsets[1:])
+    ]
+    coinbase_results = [coinbase_future.result()]
+    coinbase_results += [future.result() for future in coinbase_pro_futures]
+
+    def iterate_wallet_transactions() -> typing.Iterator[tuple[str, WalletTransaction]]:
+        for wallet_address, future in etherscan_futures:
+            for record in future.result():
+                yield (wallet_address, WalletTransaction(*record))
+
+    return (coinbase_results, iterate_wallet_transactions())
+
+
 def read_files(
     etherscan_csvs: list[str],
     coinbase_csv: str,
     coinbase_pro_csv: str,
     blocklisted_coinbase_pro_transfer_ids: list[str],
+    optimal_assignment: bool = False,
+    max_workers: typing.Optional[int] = None,
+    input_directory: typing.Optional[str] = None,
 ) -> ExchangeTransactions:
-    """Process CSV file data to currency exchange transactions"""
-    wallet_transactions_by_wallet = read_etherscan_wallets(etherscan_csvs)
-    coinbase_transfer_transactions: CoinbaseTransferTransactions = []
-    exchange_transactions_: ExchangeTransactions = []
+    """Process CSV file data to currency exchange transactions
 
-    for list_, items in zip(
-        [coinbase_transfer_transactions, exchange_transactions_],
-        read_coinbase_transactions(coinbase_csv),
-    ):
-        list_ += items
-    for list_, items in zip(
-        [coinbase_transfer_transactions, exchange_transactions_],
-        read_coinbase_pro_transactions(
+    Etherscan wallet CSVs are streamed unless 'optimal_assignment' (see
+    'correlate_coinbase_transfers'), which needs all wallet transactions
+
+    If 'max_workers', files are parsed in chunks in a process pool with
+    that many processes (0 for number of CPUs); result is the same
+
+    File names are relative to 'input_directory' (default
+    'INPUT_DIRECTORY')
+    """
+    return list(
+        itertools.chain.from_iterable(
+            _read_sources(
+                etherscan_csvs,
+                coinbase_csv,
+                coinbase_pro_csv,
+                blocklisted_coinbase_pro_transfer_ids,
+                optimal_assignment,
+                max_workers,
+                input_directory,
+            )
+        )
+    )
+
+
+def read_files_by_source(
+    etherscan_csvs: list[str],
+    coinbase_csv: str,
+    coinbase_pro_csv: str,
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+    optimal_assignment: bool = False,
+    max_workers: typing.Optional[int] = None,
+    input_directory: typing.Optional[str] = None,
+) -> list[ExchangeTransactions]:
+    """Same as 'read_files', but transactions of each source separately
+
+    Each source is in chronological order (for
+    'exchange_transactions.merge_in_chronological_order'); merging them
+    gives the same order as sorting 'read_files' output by time
+    """
+    sources = _read_sources(
+        etherscan_csvs,
+        coinbase_csv,
+        coinbase_pro_csv,
+        blocklisted_coinbase_pro_transfer_ids,
+        optimal_assignment,
+        max_workers,
+        input_directory,
+    )
+    for source in sources:
+        # Stable; linear time if already in order
+        source.sort(key=lambda transaction: transaction.time)
+    return sources
+
+
+def _read_sources(
+    etherscan_csvs: list[str],
+    coinbase_csv: str,
+    coinbase_pro_csv: str,
+    blocklisted_coinbase_pro_transfer_ids: list[str],
+    optimal_assignment: bool = False,
+    max_workers: typing.Optional[int] = None,
+    input_directory: typing.Optional[str] = None,
+) -> list[ExchangeTransactions]:
+    """Process CSV file data to currency exchange transactions of each source"""
+    if max_workers is None:
+        return _convert_files(
+            etherscan_csvs,
+            [
+                read_coinbase_transactions(coinbase_csv, input_directory),
+                read_coinbase_pro_transactions(
+                    coinbase_pro_csv,
+                    blocklisted_coinbase_pro_transfer_ids,
+                    input_directory,
+                ),
+            ],
+            iterate_etherscan_wallets(etherscan_csvs, input_directory),
+            optimal_assignment,
+        )
+    with concurrent.futures.ProcessPoolExecutor(max_workers or None) as executor:
+        coinbase_results, wallet_transactions = _read_files_in_parallel(
+            executor,
+            etherscan_csvs,
+            coinbase_csv,
             coinbase_pro_csv,
             blocklisted_coinbase_pro_transfer_ids,
-        ),
-    ):
-        list_ += items
-    # Correlate Coinbase transfer transactions with Etherscan wallet transactions
-    coinbase_transfer_transactions = sorted(
-        coinbase_transfer_transactions, key=lambda transaction: transaction.time
+            input_directory,
+        )
+        return _convert_files(
+            etherscan_csvs, coinbase_results, wallet_transactions, optimal_assignment
+        )
+
+
+def _convert_files(
+    etherscan_csvs: list[str],
+    coinbase_results: list[tuple[CoinbaseTransferTransactions, ExchangeTransactions]],
+    wallet_transactions: typing.Iterable[tuple[str, WalletTransaction]],
+    optimal_assignment: bool,
+) -> list[ExchangeTransactions]:
+    """Correlate and convert transactions read from files
+
+    Returns transactions from each source
+    """
+    # Each source is already (nearly) in chronological order
+    coinbase_transfer_transactions: CoinbaseTransferTransactions = list(
+        heapq.merge(
+            *(
+                sorted(transfers, key=lambda transaction: transaction.time)
+                for transfers, _ in coinbase_results
+            ),
+            key=lambda transaction: transaction.time,
+        )
     )
-    for coinbase_transaction in coinbase_transfer_transactions:
-        for wallet_address, transactions in wallet_transactions_by_wallet.items():
-            for transaction in transactions:
-                amount_wei = transaction.amount_wei
-                if (
-                    coinbase_transaction.type_
-                    == CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
-                ):
-                    amount_wei += transaction.fee_wei
-                if abs(
-                    amount_wei
-                    - coinbase_transaction.amount_wei
-                    # 1000000000000000 wei = .001 ETH
-                ) < 1000000000000000 and abs(
-                    transaction.time - coinbase_transaction.time
-                ) < datetime.timedelta(
-                    minutes=15
-                ):
-                    if (
-                        coinbase_transaction.type_
-                        == CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
-                    ):
-                        transaction.wallet_from = "coinbase"
-                    elif (
-                        coinbase_transaction.type_
-                        == CoinbaseTransferTransaction.TransactionType.TO_COINBASE
-                    ):
-                        transaction.wallet_to = "coinbase"
-                    else:
-                        raise ValueError
-                    break
-            else:
-                continue
-            break
-        else:
-            # HACK: Transaction of ETH spent directly from Coinbase
-            if (
-                coinbase_transaction.time == datetime.datetime(2021, 1, 2, 19, 37, 5)
-                and coinbase_transaction.amount_wei == 76506000000000000
-                and coinbase_transaction.type_
-                == CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
-            ):
-                exchange_transactions_.append(
-                    exchange_transactions.Spend(
-                        coinbase_transaction.time,
-                        coinbase_transaction.amount_wei,
-                        5992 / decimal.Decimal("0.076506"),
-                    )
-                )
-            else:
-                raise ValueError
-    wallet_addresses = list(wallet_transactions_by_wallet.keys())
+    sources = [exchanges for _, exchanges in coinbase_results]
+    wallet_addresses = [
+        convert_etherscan_file_name_to_wallet_address(file_name)
+        for file_name in etherscan_csvs
+    ]
     wallet_addresses.append("coinbase")
 
-    # Process Etherscan wallet transactions into exchange transactions
-    for wallet_address, transactions in wallet_transactions_by_wallet.items():
-        for transaction in transactions:
-            if transaction.wallet_to == wallet_address:
-                if transaction.wallet_from not in wallet_addresses:
-                    raise NotImplementedError(
-                        "ETH acquistion outside of Coinbase not supported"
-                    )
-                elif transaction.wallet_from != "coinbase":
-                    continue
-            assert wallet_address in wallet_addresses
-            if transaction.wallet_to not in wallet_addresses:
-                if transaction.amount_wei != 0:
-                    exchange_transactions_.append(
-                        transaction.convert_amount_to_spend_transaction()
-                    )
-            exchange_transactions_.append(
-                transaction.convert_fee_to_spend_transaction()
+    # Correlate Coinbase transfer transactions with Etherscan wallet transactions
+    if optimal_assignment:
+        transactions_by_wallet: dict[str, list[WalletTransaction]] = {}
+        for wallet_address, transaction in wallet_transactions:
+            transactions_by_wallet.setdefault(wallet_address, []).append(transaction)
+        with instrumentation.stage("correlate_transfers"):
+            unmatched_transactions = correlate_coinbase_transfers(
+                coinbase_transfer_transactions, transactions_by_wallet, True
+            )
+        wallet_spends = _convert_wallet_transactions(
+            (
+                (wallet_address, transaction)
+                for wallet_address, transactions in transactions_by_wallet.items()
+                for transaction in transactions
+            ),
+            wallet_addresses,
+        )
+    else:
+        # Stream wallet transactions; match each one as it is read
+        transfer_index = CoinbaseTransferIndex(coinbase_transfer_transactions)
+        wallet_spends = _convert_wallet_transactions(
+            (
+                (wallet_address, transfer_index.match(transaction))
+                for wallet_address, transaction in wallet_transactions
+            ),
+            wallet_addresses,
+        )
+        unmatched_transactions = transfer_index.unmatched_transactions
+
+    coinbase_spends: ExchangeTransactions = []
+    for coinbase_transaction in unmatched_transactions:
+        # HACK: Transaction of ETH spent directly from Coinbase
+        if (
+            coinbase_transaction.time == datetime.datetime(2021, 1, 2, 19, 37, 5)
+            and coinbase_transaction.amount_wei == 76506000000000000
+            and coinbase_transaction.type_
+            == CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
+        ):
+            coinbase_spends.append(
+                exchange_transactions.Spend(
+                    coinbase_transaction.time,
+                    coinbase_transaction.amount_wei,
+                    5992 / decimal.Decimal("0.076506"),
+                )
             )
-    return exchange_transactions_
+        else:
+            raise ValueError
+    return sources + [coinbase_spends, wallet_spends]
+
+
+def _convert_wallet_transactions(
+    wallet_transactions: typing.Iterable[tuple[str, WalletTransaction]],
+    wallet_addresses: list[str],
+) -> ExchangeTransactions:
+    """Process Etherscan wallet transactions into exchange transactions
+
+    Transactions must already be correlated with Coinbase transfers
+    """
+    wallet_spends: ExchangeTransactions = []
+    for wallet_address, transaction in wallet_transactions:
+        if transaction.wallet_to == wallet_address:
+            if transaction.wallet_from not in wallet_addresses:
+                raise NotImplementedError(
+                    "ETH acquistion outside of Coinbase not supported"
+                )
+            elif transaction.wallet_from != "coinbase":
+                continue
+        assert wallet_address in wallet_addresses
+        if transaction.wallet_to not in wallet_addresses:
+            if transaction.amount_wei != 0:
+                wallet_spends.append(transaction.convert_amount_to_spend_transaction())
+        wallet_spends.append(transaction.convert_fee_to_spend_transaction())
+    return wallet_spends
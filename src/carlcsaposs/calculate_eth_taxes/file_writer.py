@@ -18,7 +18,16 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import csv
 import dataclasses
+import gzip
+import io
+import itertools
+import lzma
+import operator
+import os
 import pathlib
+import queue
+import threading
+import typing
 
 from . import utils
 
@@ -40,24 +49,417 @@ class Form8949Row:
     cost_usd: int
 
     def __post_init__(self):
-        for attribute in ["proceeds_usd", "cost_usd"]:
-            utils.NumberDomain.NON_NEGATIVE.validate_number(
-                attribute, getattr(self, attribute)
+        _validate_form_8949_row(self)
+
+    @classmethod
+    def create_trusted(
+        cls,
+        tax_year: int,
+        is_long_term: bool,
+        description: str,
+        date_acquired: str,
+        date_sold: str,
+        proceeds_usd: int,
+        cost_usd: int,
+    ) -> "Form8949Row":
+        """Create instance without validation
+
+        For rows derived by this program; validate with
+        'validate_form_8949_rows' (unless 'utils.EAGER_VALIDATION')
+        """
+        if utils.EAGER_VALIDATION:
+            return cls(
+                tax_year,
+                is_long_term,
+                description,
+                date_acquired,
+                date_sold,
+                proceeds_usd,
+                cost_usd,
             )
+        row = object.__new__(cls)
+        # Frozen dataclass; bypass '__setattr__'
+        row.__dict__.update(
+            tax_year=tax_year,
+            is_long_term=is_long_term,
+            description=description,
+            date_acquired=date_acquired,
+            date_sold=date_sold,
+            proceeds_usd=proceeds_usd,
+            cost_usd=cost_usd,
+        )
+        return row
+
+
+def _validate_form_8949_row(row: Form8949Row) -> None:
+    """Raise ValueError if row is invalid"""
+    for attribute in ["proceeds_usd", "cost_usd"]:
+        utils.NumberDomain.NON_NEGATIVE.validate_number(
+            attribute, getattr(row, attribute)
+        )
+
+
+def validate_form_8949_rows(rows: typing.Sequence[Form8949Row]) -> None:
+    """Raise same ValueError as 'Form8949Row' for first invalid row
+
+    Each attribute is checked for all rows at once; rows are only
+    checked one at a time if any is invalid.
+    """
+    if not all(
+        utils.NumberDomain.NON_NEGATIVE.includes_numbers(
+            map(operator.attrgetter(attribute), rows)
+        )
+        for attribute in ["proceeds_usd", "cost_usd"]
+    ):
+        for row in rows:
+            _validate_form_8949_row(row)
+
+
+# Compression of output file; inferred from file suffix if not specified
+COMPRESSION_BY_SUFFIX = {".gz": "gzip", ".xz": "lzma"}
+_COMPRESSED_FILES: dict[str, typing.Callable[..., io.BufferedIOBase]] = {
+    "gzip": gzip.GzipFile,
+    "lzma": lzma.LZMAFile,
+}
+_BUFFER_SIZE = 2**20
+
+
+def _open_for_writing(
+    file_path: pathlib.Path, compression: typing.Optional[str] = None
+) -> typing.TextIO:
+    """Open text file with large write buffer, optionally compressed
+
+    'compression' is "gzip", "lzma" or None (inferred from suffix)
+    """
+    if compression is None:
+        compression = COMPRESSION_BY_SUFFIX.get(pathlib.Path(file_path).suffix)
+    if compression is None:
+        return open(file_path, "w", encoding="utf-8", buffering=_BUFFER_SIZE)
+    compressed_file = _COMPRESSED_FILES[compression](file_path, "wb")
+    return io.TextIOWrapper(
+        io.BufferedWriter(compressed_file, _BUFFER_SIZE),
+        encoding="utf-8",
+    )
+
+
+# Term (Part I or II of Form 8949) by 'Form8949Row.is_long_term'
+TERMS = {False: "short-term", True: "long-term"}
+
+
+@dataclasses.dataclass
+class SummaryTotals:
+    """Totals of Form 8949 rows for one tax year and term"""
+
+    row_count: int = 0
+    proceeds_usd: int = 0
+    cost_usd: int = 0
+
+    @property
+    def gain_usd(self) -> int:
+        """Capital gain (negative for loss)"""
+        return self.proceeds_usd - self.cost_usd
+
+
+class Summary:
+    """Schedule D totals for each tax year and term
+
+    Accumulated as rows are written, so totals never need another pass
+    over the rows
+    """
+
+    FIELDNAMES = [
+        "tax_year",
+        "term",
+        "row_count",
+        "proceeds_usd",
+        "cost_usd",
+        "gain_usd",
+    ]
+
+    def __init__(self):
+        self.totals: dict[tuple[int, bool], SummaryTotals] = {}
+
+    def add(self, row: Form8949Row) -> None:
+        """Add row to totals for its tax year and term"""
+        key = (row.tax_year, row.is_long_term)
+        totals = self.totals.get(key)
+        if totals is None:
+            totals = self.totals[key] = SummaryTotals()
+        totals.row_count += 1
+        totals.proceeds_usd += row.proceeds_usd
+        totals.cost_usd += row.cost_usd
+
+    def add_rows(self, rows: typing.Iterable[Form8949Row]) -> None:
+        """Add each row to totals for its tax year and term"""
+        for row in rows:
+            self.add(row)
+
+    def update(self, other: "Summary") -> None:
+        """Add totals of other summary"""
+        for key, other_totals in other.totals.items():
+            totals = self.totals.get(key)
+            if totals is None:
+                totals = self.totals[key] = SummaryTotals()
+            totals.row_count += other_totals.row_count
+            totals.proceeds_usd += other_totals.proceeds_usd
+            totals.cost_usd += other_totals.cost_usd
+
+    def write_to_file(self, file_path: pathlib.Path) -> None:
+        """Save totals to CSV file, by tax year and term"""
+        with open(file_path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.FIELDNAMES)
+            for (tax_year, is_long_term), totals in sorted(self.totals.items()):
+                writer.writerow(
+                    [
+                        tax_year,
+                        TERMS[is_long_term],
+                        totals.row_count,
+                        totals.proceeds_usd,
+                        totals.cost_usd,
+                        totals.gain_usd,
+                    ]
+                )
 
 
 class Form8949File:
     """CSV file with format of IRS Form 8949"""
 
     FIELDNAMES = [field.name for field in dataclasses.fields(Form8949Row)]
+    # Values of row in order of 'FIELDNAMES'
+    _get_values = operator.attrgetter(*FIELDNAMES)
 
     def __init__(self, rows: list[Form8949Row]):
         self.rows = rows
 
-    def write_to_file(self, file_path: pathlib.Path) -> None:
-        """Save instance to CSV file"""
-        with open(file_path, "w", encoding="utf-8") as file:
-            writer = csv.DictWriter(file, self.FIELDNAMES)
-            writer.writeheader()
-            for row in self.rows:
-                writer.writerow(dataclasses.asdict(row))
+    @classmethod
+    def _write_rows(
+        cls, file: typing.TextIO, batches: typing.Iterable[list[Form8949Row]]
+    ) -> int:
+        """Write header and rows as tuples; returns number of rows"""
+        writer = csv.writer(file)
+        writer.writerow(cls.FIELDNAMES)
+        row_count = 0
+        for batch in batches:
+            writer.writerows(map(cls._get_values, batch))
+            row_count += len(batch)
+        return row_count
+
+    def write_to_file(
+        self,
+        file_path: pathlib.Path,
+        compression: typing.Optional[str] = None,
+        summary: typing.Optional[Summary] = None,
+    ) -> None:
+        """Save instance to CSV file
+
+        See '_open_for_writing' for 'compression'. Rows are added to
+        'summary', if specified
+        """
+        validate_form_8949_rows(self.rows)
+        if summary is not None:
+            summary.add_rows(self.rows)
+        with _open_for_writing(file_path, compression) as file:
+            self._write_rows(file, [self.rows])
+
+    @classmethod
+    def write_rows_to_file(
+        cls,
+        rows: typing.Iterable[Form8949Row],
+        file_path: pathlib.Path,
+        batch_size: int = 10000,
+        compression: typing.Optional[str] = None,
+        summary: typing.Optional[Summary] = None,
+    ) -> int:
+        """Save rows to CSV file as they are produced
+
+        Rows are not held in memory; each batch is validated before it is
+        written (and added to 'summary', if specified). File is only
+        created if all rows are valid. Returns number of rows written.
+        See '_open_for_writing' for 'compression'
+        """
+        if compression is None:
+            compression = COMPRESSION_BY_SUFFIX.get(pathlib.Path(file_path).suffix)
+        temporary_path = pathlib.Path(f"{file_path}.tmp")
+
+        def iterate_batches() -> typing.Iterator[list[Form8949Row]]:
+            rows_ = iter(rows)
+            while batch := list(itertools.islice(rows_, batch_size)):
+                validate_form_8949_rows(batch)
+                if summary is not None:
+                    summary.add_rows(batch)
+                yield batch
+
+        try:
+            with _open_for_writing(temporary_path, compression) as file:
+                row_count = cls._write_rows(file, iterate_batches())
+        except BaseException:
+            temporary_path.unlink(missing_ok=True)
+            raise
+        os.replace(temporary_path, file_path)
+        return row_count
+
+
+# Queue items that end a shard
+_FINISH = object()
+_ABORT = object()
+
+
+class _Aborted(Exception):
+    """Writing shard was aborted; output file is not created"""
+
+
+class _ShardWriter:
+    """Write rows put in queue to one file, in own thread"""
+
+    def __init__(
+        self,
+        file_path: pathlib.Path,
+        batch_size: int,
+        compression: typing.Optional[str],
+        max_queued_batches: int,
+    ):
+        self.file_path = file_path
+        self.row_count = 0
+        self.exception: typing.Optional[BaseException] = None
+        self._batch_size = batch_size
+        self._compression = compression
+        self._queue: queue.Queue = queue.Queue(max_queued_batches)
+        self._ended = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _iterate_rows(self) -> typing.Iterator[Form8949Row]:
+        while True:
+            item = self._queue.get()
+            if item is _FINISH or item is _ABORT:
+                self._ended = True
+                if item is _ABORT:
+                    raise _Aborted
+                return
+            yield from item
+
+    def _run(self) -> None:
+        try:
+            self.row_count = Form8949File.write_rows_to_file(
+                self._iterate_rows(),
+                self.file_path,
+                self._batch_size,
+                self._compression,
+            )
+        except BaseException as exception:  # pylint: disable=broad-except
+            self.exception = exception
+            # Discard remaining batches so that producer does not block
+            while not self._ended:
+                item = self._queue.get()
+                self._ended = item is _FINISH or item is _ABORT
+
+    def put(self, batch: list[Form8949Row]) -> None:
+        """Queue batch of rows to be written"""
+        self._queue.put(batch)
+
+    def end(self, abort: bool = False) -> None:
+        """Wait until all queued rows are written"""
+        self._queue.put(_ABORT if abort else _FINISH)
+        self._thread.join()
+
+
+class ShardedForm8949Sink:
+    """Form 8949 CSV file for each tax year and term (Part I or II)
+
+    Each file is written by its own thread, so formatting and writing
+    overlap with computing rows. Use as context manager; a file is only
+    created if all of its rows are valid and no exception was raised
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        file_name_format: str = "form-8949-{tax_year}-{term}.csv",
+        batch_size: int = 10000,
+        compression: typing.Optional[str] = None,
+        max_queued_batches: int = 8,
+        summary: typing.Optional[Summary] = None,
+    ):
+        self.directory = pathlib.Path(directory)
+        self._file_name_format = file_name_format
+        self._batch_size = batch_size
+        self._compression = compression
+        self._max_queued_batches = max_queued_batches
+        self._summary = summary
+        self._writers: dict[tuple[int, bool], _ShardWriter] = {}
+        self._batches: dict[tuple[int, bool], list[Form8949Row]] = {}
+        self._closed = False
+
+    def write(self, row: Form8949Row) -> None:
+        """Add row to file for its tax year and term (and to summary)"""
+        if self._summary is not None:
+            self._summary.add(row)
+        key = (row.tax_year, row.is_long_term)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._writers[key] = _ShardWriter(
+                self.directory
+                / self._file_name_format.format(
+                    tax_year=row.tax_year, term=TERMS[row.is_long_term]
+                ),
+                self._batch_size,
+                self._compression,
+                self._max_queued_batches,
+            )
+        batch.append(row)
+        if len(batch) >= self._batch_size:
+            self._writers[key].put(batch)
+            self._batches[key] = []
+
+    def write_rows(self, rows: typing.Iterable[Form8949Row]) -> None:
+        """Add each row to file for its tax year and term"""
+        for row in rows:
+            self.write(row)
+
+    def close(self, abort: bool = False) -> dict[tuple[int, bool], pathlib.Path]:
+        """Finish writing all files
+
+        Returns path of file for each (tax year, is long term). Raises
+        first exception from any writer
+        """
+        if not self._closed:
+            self._end_writers(abort)
+        for writer in self._writers.values():
+            if writer.exception is not None and not isinstance(
+                writer.exception, _Aborted
+            ):
+                raise writer.exception
+        return {key: writer.file_path for key, writer in sorted(self._writers.items())}
+
+    def _end_writers(self, abort: bool) -> None:
+        self._closed = True
+        for key, writer in self._writers.items():
+            if self._batches[key] and not abort:
+                writer.put(self._batches[key])
+            self._batches[key] = []
+        for writer in self._writers.values():
+            writer.end(abort)
+
+    def __enter__(self) -> "ShardedForm8949Sink":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        if exception_type is None:
+            self.close()
+        elif not self._closed:
+            self._end_writers(abort=True)
+
+
+def write_rows_to_shards(
+    rows: typing.Iterable[Form8949Row], directory: pathlib.Path, **kwargs
+) -> dict[tuple[int, bool], pathlib.Path]:
+    """Write rows to file for each tax year and term
+
+    See 'ShardedForm8949Sink' for keyword arguments
+    """
+    with ShardedForm8949Sink(directory, **kwargs) as sink:
+        sink.write_rows(rows)
+    return sink.close()
@@ -0,0 +1,113 @@
+"""
+instrumentation: Stage timers and hot path counters
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import collections
+import contextlib
+import dataclasses
+import json
+import os
+import time
+import typing
+
+# Hot paths check 'ENABLED' before calling 'count' or 'stage', so that
+# instrumentation costs one attribute lookup when disabled
+ENABLED = False
+
+
+@dataclasses.dataclass
+class Profile:
+    """Time spent in each stage and value of each counter"""
+
+    stage_seconds: dict[str, float] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(float)
+    )
+    stage_calls: dict[str, int] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(int)
+    )
+    counters: dict[str, int] = dataclasses.field(
+        default_factory=lambda: collections.defaultdict(int)
+    )
+
+    def convert_to_dict(self) -> dict[str, typing.Any]:
+        """JSON-serializable representation"""
+        return {
+            "stages": {
+                name: {"seconds": seconds, "calls": self.stage_calls[name]}
+                for name, seconds in self.stage_seconds.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def write_to_file(self, file_path: typing.Union[str, os.PathLike]) -> None:
+        """Save as JSON"""
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(self.convert_to_dict(), file, indent=4)
+            file.write("\n")
+
+    def format_report(self) -> str:
+        """Table of stages (in order first entered) and counters"""
+        lines = [f"{'stage':<24}{'calls':>12}{'seconds':>12}"]
+        for name, seconds in self.stage_seconds.items():
+            lines.append(f"{name:<24}{self.stage_calls[name]:>12}{seconds:>12.3f}")
+        lines.append("")
+        lines.append(f"{'counter':<24}{'value':>24}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<24}{value:>24}")
+        return "\n".join(lines)
+
+
+_profile = Profile()
+
+
+def enable() -> Profile:
+    """Start recording to a new 'Profile'; returns it"""
+    global ENABLED, _profile  # pylint: disable=global-statement
+    _profile = Profile()
+    ENABLED = True
+    return _profile
+
+
+def disable() -> None:
+    """Stop recording"""
+    global ENABLED  # pylint: disable=global-statement
+    ENABLED = False
+
+
+@contextlib.contextmanager
+def stage(name: str) -> typing.Iterator[None]:
+    """Add time spent in block to stage, if enabled
+
+    Stages can be nested; time of inner stage is also counted in outer
+    stage
+    """
+    if not ENABLED:
+        yield
+        return
+    # Stages are reported in order first entered
+    _profile.stage_seconds.setdefault(name, 0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _profile.stage_seconds[name] += time.perf_counter() - start
+        _profile.stage_calls[name] += 1
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add amount to counter; callers check 'ENABLED' first"""
+    _profile.counters[name] += amount
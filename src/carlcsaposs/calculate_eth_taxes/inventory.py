@@ -0,0 +1,738 @@
+"""
+inventory: Index of 'AcquiredETH' held by taxpayer
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import abc
+import array
+import datetime
+import decimal
+import heapq
+import itertools
+import typing
+
+from . import currency
+from . import exchange_transactions
+from . import instrumentation
+from . import utils
+
+
+class LotIndex(abc.ABC):
+    """'AcquiredETH' held by taxpayer, from most to least tax optimal
+
+    If multiple 'AcquiredETH' are equally tax optimal, they are in the
+    order of the list that was sorted for every spend before indexes
+    (like a stable sort): the one that was more tax optimal for the last
+    spend is more tax optimal, and 'AcquiredETH' added since are more
+    tax optimal, the last one added most. If order does not depend on
+    the transaction, the last one added is the most tax optimal.
+    """
+
+    @abc.abstractmethod
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        """Iterate over 'AcquiredETH' held at last spend, then added since
+
+        'AcquiredETH' added since the last spend are in order added.
+        Equally tax optimal 'AcquiredETH' are from least to most tax
+        optimal, so a stable sort for the last spend is in the order of
+        the list that was sorted for every spend
+        """
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    @abc.abstractmethod
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        """Add 'AcquiredETH'"""
+
+    @abc.abstractmethod
+    def peek(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        """Most tax optimal 'AcquiredETH' for transaction
+
+        The 'AcquiredETH' stays in the index
+        """
+
+    @abc.abstractmethod
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        """Remove and return most tax optimal 'AcquiredETH' for transaction"""
+
+    def remove_wei(
+        self, transaction: exchange_transactions.Spend
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        """Remove ETH spent by transaction, most tax optimal first
+
+        Yield removed 'AcquiredETH'. If only part of an 'AcquiredETH' is
+        spent, it is split and the rest stays in the index.
+        """
+        amount_wei = transaction.amount_wei
+        while amount_wei > 0:
+            acquired_eth = self.peek(transaction)
+            if acquired_eth.amount_wei > amount_wei:
+                if instrumentation.ENABLED:
+                    instrumentation.count("lot_splits")
+                acquired_eth = acquired_eth.remove_wei(amount_wei)
+            else:
+                acquired_eth = self.pop(transaction)
+            amount_wei -= acquired_eth.amount_wei
+            yield acquired_eth
+
+
+class SelectionLotIndex(LotIndex):
+    """Select 'AcquiredETH' for each transaction, only as many as spent
+
+    Supports any tax optimization method. Iterates in order added, so
+    for ties, the last one added is the most tax optimal, even if order
+    depends on the transaction
+    """
+
+    def __init__(
+        self,
+        select: typing.Callable[
+            [list[currency.AcquiredETH], exchange_transactions.Spend],
+            typing.Iterator[currency.AcquiredETH],
+        ],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._select = select
+        # Key is 'id()' of value; dictionary is in order added
+        self._acquired_eths: dict[int, currency.AcquiredETH] = {
+            id(acquired_eth): acquired_eth for acquired_eth in acquired_eths
+        }
+        self._transaction: typing.Optional[exchange_transactions.Spend] = None
+        self._selection: typing.Iterator[currency.AcquiredETH] = iter([])
+        self._selected: typing.Optional[currency.AcquiredETH] = None
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        return iter(self._acquired_eths.values())
+
+    def __len__(self) -> int:
+        return len(self._acquired_eths)
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        self._acquired_eths[id(acquired_eth)] = acquired_eth
+        self._transaction = None
+
+    def peek(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        if transaction is not self._transaction:
+            if instrumentation.ENABLED:
+                instrumentation.count("lot_selections")
+                instrumentation.count("lots_sorted", len(self._acquired_eths))
+            self._selection = self._select(
+                list(self._acquired_eths.values()), transaction
+            )
+            self._selected = None
+            self._transaction = transaction
+        if self._selected is None:
+            try:
+                self._selected = next(self._selection)
+            except StopIteration:
+                raise IndexError("index is empty") from None
+        return self._selected
+
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        acquired_eth = self.peek(transaction)
+        self._selected = None
+        del self._acquired_eths[id(acquired_eth)]
+        return acquired_eth
+
+
+class PriorityLotIndex(LotIndex):
+    """Heap of 'AcquiredETH' ordered by a priority independent of transaction
+
+    Lowest priority is most tax optimal. Peek is O(1); add and pop are
+    O(log N).
+    """
+
+    def __init__(
+        self,
+        priority: typing.Callable[[currency.AcquiredETH], typing.Any],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._priority = priority
+        self._counter = itertools.count()
+        # Negative count: last one added is most tax optimal for ties
+        self._heap: list[tuple[typing.Any, int, currency.AcquiredETH]] = [
+            (priority(acquired_eth), -next(self._counter), acquired_eth)
+            for acquired_eth in acquired_eths
+        ]
+        heapq.heapify(self._heap)
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        for _, _, acquired_eth in sorted(self._heap, key=lambda item: -item[1]):
+            yield acquired_eth
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        heapq.heappush(
+            self._heap,
+            (self._priority(acquired_eth), -next(self._counter), acquired_eth),
+        )
+
+    def peek(self, _: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return self._heap[0][2]
+
+    def pop(self, _: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return heapq.heappop(self._heap)[2]
+
+
+_REMOVED = float("-inf")
+
+
+class _MaxTree:
+    """Maximum of values by position, to find rightmost match in O(log N)"""
+
+    def __init__(self):
+        self._size = 1
+        self._length = 0
+        self._tree: list[typing.Any] = [_REMOVED, _REMOVED]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, value: typing.Any) -> None:
+        """Add value at next position, doubling tree if full"""
+        if self._length == self._size:
+            values = self._tree[self._size :]
+            self._size *= 2
+            self._tree = [_REMOVED] * (2 * self._size)
+            self._tree[self._size : self._size + self._length] = values
+            for node in range(self._size - 1, 0, -1):
+                self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+        self._length += 1
+        self[self._length - 1] = value
+
+    def __setitem__(self, position: int, value: typing.Any) -> None:
+        node = position + self._size
+        self._tree[node] = value
+        node //= 2
+        while node > 0:
+            self._tree[node] = max(self._tree[2 * node], self._tree[2 * node + 1])
+            node //= 2
+
+    def rightmost(
+        self, is_match: typing.Callable[[typing.Any], bool]
+    ) -> typing.Optional[int]:
+        """Rightmost position with matching value
+
+        'is_match' must be true for a maximum if it is true for any value
+        the maximum includes
+        """
+        if not is_match(self._tree[1]):
+            return None
+        node = 1
+        while node < self._size:
+            node = 2 * node + 1 if is_match(self._tree[2 * node + 1]) else 2 * node
+        return node - self._size
+
+
+class BracketLotIndex(LotIndex):
+    """Index for 'LowerTaxBracket' and 'HigherTaxBracket'
+
+    Most to least tax optimal:
+    1. Short-term non-gains, latest first
+    2. Long-term, by 'long_term_priority' (lowest first)
+    3. Short-term gains, latest first
+
+    Short-term 'AcquiredETH' are kept in chronological order with a
+    segment tree of their cost, so the latest non-gain or gain for a
+    transaction is found in O(log N). Each 'AcquiredETH' moves to a
+    heap of long-term 'AcquiredETH' once, when a transaction is one
+    year after it was acquired.
+
+    Ties are in the order of the list that was sorted for every spend
+    before indexes, which depends on earlier spends:
+    - Short-term 'AcquiredETH' with equal times are reordered like that
+      list, gains before non-gains, at each spend whose proceeds are
+      between their costs. Equal times not in order of cost are rare,
+      so this is O(K) for each spend, for K such 'AcquiredETH'
+    - 'AcquiredETH' that become long-term are less tax optimal than
+      long-term 'AcquiredETH' with equal priority if they were a gain
+      for the last spend, and more tax optimal otherwise
+
+    Transactions must be in chronological order and 'AcquiredETH' must
+    be added in chronological order. Otherwise, the index is rebuilt.
+
+    Each 'AcquiredETH' is held as a lot; subclasses can hold lots
+    another way (see 'ColumnarBracketLotIndex').
+    """
+
+    def __init__(
+        self,
+        long_term_priority: typing.Callable[[currency.AcquiredETH], typing.Any],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._long_term_priority = long_term_priority
+        self._build(acquired_eths)
+
+    def _store(self, acquired_eth: currency.AcquiredETH) -> typing.Any:
+        """Lot held for 'AcquiredETH'"""
+        return acquired_eth
+
+    def _load(self, lot: typing.Any) -> currency.AcquiredETH:
+        """'AcquiredETH' of lot"""
+        return lot
+
+    def _time_acquired(self, lot: typing.Any) -> datetime.datetime:
+        return lot.time_acquired
+
+    def _cost(self, lot: typing.Any) -> decimal.Decimal:
+        return lot.cost_us_cents_per_eth_including_fees
+
+    def _long_term_ordinal(self, lot: typing.Any) -> int:
+        return lot.long_term_ordinal
+
+    def _build(self, acquired_eths: typing.Iterable[currency.AcquiredETH]) -> None:
+        self._transaction: typing.Optional[exchange_transactions.Spend] = None
+        # Proceeds of last spend and number of 'AcquiredETH' added before it
+        self._last_spend: typing.Optional[tuple[decimal.Decimal, int]] = None
+        # Key is priority and rank; ranks of 'AcquiredETH' that become
+        # long-term are lower (more tax optimal) or higher than all others
+        self._long_term: list[tuple[typing.Any, int, typing.Any]] = []
+        self._lower_ranks = itertools.count(-1, -1)
+        self._higher_ranks = itertools.count()
+        self._peeked: typing.Optional[
+            tuple[exchange_transactions.Spend, typing.Optional[int]]
+        ] = None
+        # Short-term lots in chronological order, with ties in order of
+        # last spend; removed are 'None'
+        self._short_term: list[tuple[int, typing.Any, datetime.datetime]] = []
+        self._short_term_costs = _MaxTree()
+        self._short_term_start = 0  # Earlier positions are long-term
+        # First position, lowest and highest cost of equal times not in
+        # order of cost, by time
+        self._ties: dict[
+            datetime.datetime, tuple[int, decimal.Decimal, decimal.Decimal]
+        ] = {}
+        self._tie_start = 0
+        self._tie_costs = (decimal.Decimal(0), decimal.Decimal(0))
+        sequenced = list(enumerate(acquired_eths))
+        if instrumentation.ENABLED:
+            instrumentation.count("lots_reindexed", len(sequenced))
+        for sequence, acquired_eth in sorted(
+            sequenced, key=lambda item: item[1].time_acquired
+        ):
+            self._append(sequence, self._store(acquired_eth))
+        # Number of 'AcquiredETH' added; sequence of next one added
+        self._count = len(sequenced)
+        self._length = len(sequenced)
+
+    def _append(self, sequence: int, lot: typing.Any) -> None:
+        time_acquired = self._time_acquired(lot)
+        cost = self._cost(lot)
+        if self._short_term and self._short_term[-1][2] == time_acquired:
+            lowest, highest = self._tie_costs
+            self._tie_costs = (min(lowest, cost), max(highest, cost))
+            if cost < highest or time_acquired in self._ties:
+                self._ties[time_acquired] = (self._tie_start, *self._tie_costs)
+        else:
+            self._tie_start = len(self._short_term)
+            self._tie_costs = (cost, cost)
+        self._short_term.append((sequence, lot, time_acquired))
+        self._short_term_costs.append(cost)
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        # If no last spend, no 'AcquiredETH' were held at it
+        proceeds, held = self._last_spend or (decimal.Decimal(0), 0)
+        gains = []
+        non_gains = []
+        added = []
+        for sequence, lot, _ in self._short_term[self._short_term_start :]:
+            if lot is None:
+                continue
+            if sequence >= held:
+                added.append((sequence, lot))
+            elif proceeds > self._cost(lot):
+                gains.append(lot)
+            else:
+                non_gains.append(lot)
+        yield from map(self._load, gains)
+        for _, _, lot in sorted(self._long_term, reverse=True):
+            yield self._load(lot)
+        yield from map(self._load, non_gains)
+        for _, lot in sorted(added, key=lambda item: item[0]):
+            yield self._load(lot)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        self._peeked = None
+        if self._short_term and acquired_eth.time_acquired < self._short_term[-1][2]:
+            self._build([*self, acquired_eth])
+        else:
+            self._append(self._count, self._store(acquired_eth))
+            self._count += 1
+            self._length += 1
+
+    def _start(self, transaction: exchange_transactions.Spend) -> None:
+        """Update ties for last spend and move 'AcquiredETH' to long-term"""
+        if self._transaction is not None and transaction.time < self._transaction.time:
+            self._build(list(self))
+        if self._last_spend is not None:
+            self._sort_ties(*self._last_spend)
+        self._move_to_long_term(transaction.time.toordinal())
+        self._transaction = transaction
+        self._last_spend = (
+            transaction.proceeds_us_cents_per_eth_excluding_fees,
+            self._count,
+        )
+
+    def _sort_ties(self, proceeds: decimal.Decimal, held: int) -> None:
+        """Move gains for spend before non-gains with equal times
+
+        Only 'AcquiredETH' held at spend ('sequence' lower than 'held')
+        """
+        in_order = []
+        for time_acquired, (start, lowest, highest) in self._ties.items():
+            # Order only changes if some costs are gains and some are not
+            if not lowest < proceeds <= highest:
+                continue
+            positions = []
+            gains = []
+            non_gains = []
+            costs = []
+            position = start
+            while (
+                position < len(self._short_term)
+                and self._short_term[position][2] == time_acquired
+            ):
+                item = self._short_term[position]
+                if item[1] is not None:
+                    cost = self._cost(item[1])
+                    if item[0] >= held:
+                        costs.append(cost)
+                    else:
+                        positions.append(position)
+                        if proceeds > cost:
+                            gains.append((item, cost))
+                        else:
+                            non_gains.append((item, cost))
+                position += 1
+            for position, (item, cost) in zip(positions, gains + non_gains):
+                if self._short_term[position] is not item:
+                    self._short_term[position] = item
+                    self._short_term_costs[position] = cost
+            # 'AcquiredETH' held at spend are before those added since
+            costs[:0] = [cost for _, cost in gains + non_gains]
+            if costs == sorted(costs):
+                in_order.append(time_acquired)
+        # In order of cost, so no spend changes order (unless more added)
+        for time_acquired in in_order:
+            del self._ties[time_acquired]
+
+    def _move_to_long_term(self, spent_ordinal: int) -> None:
+        """Move 'AcquiredETH' that are long-term at spend to heap"""
+        # If no last spend, no 'AcquiredETH' were held at it
+        proceeds, held = self._last_spend or (decimal.Decimal(0), 0)
+        gains = []
+        non_gains = []
+        added = []
+        while self._short_term_start < len(self._short_term):
+            sequence, lot, time_acquired = self._short_term[self._short_term_start]
+            if lot is not None:
+                # Chronological order, so no later 'AcquiredETH' is long term
+                if spent_ordinal < self._long_term_ordinal(lot):
+                    break
+                if sequence >= held:
+                    added.append((sequence, lot))
+                elif proceeds > self._cost(lot):
+                    gains.append(lot)
+                else:
+                    non_gains.append(lot)
+                self._short_term[self._short_term_start] = (
+                    sequence,
+                    None,
+                    time_acquired,
+                )
+                self._short_term_costs[self._short_term_start] = _REMOVED
+                self._ties.pop(time_acquired, None)
+            self._short_term_start += 1
+        # Same order as list sorted for last spend: gains, then long-term,
+        # then non-gains, then 'AcquiredETH' added since
+        for lot in reversed(gains):
+            self._push_long_term(next(self._higher_ranks), lot)
+        added.sort(key=lambda item: item[0])
+        for lot in non_gains + [item[1] for item in added]:
+            self._push_long_term(next(self._lower_ranks), lot)
+
+    def _push_long_term(self, rank: int, lot: typing.Any) -> None:
+        heapq.heappush(
+            self._long_term,
+            (self._long_term_priority(self._load(lot)), rank, lot),
+        )
+
+    def _find(self, transaction: exchange_transactions.Spend) -> typing.Optional[int]:
+        """Position of most tax optimal short-term 'AcquiredETH'
+
+        'None' if most tax optimal is long-term
+        """
+        if self._peeked is not None and self._peeked[0] is transaction:
+            return self._peeked[1]
+        if transaction is not self._transaction:
+            self._start(transaction)
+        proceeds = transaction.proceeds_us_cents_per_eth_excluding_fees
+        position = self._short_term_costs.rightmost(lambda cost: cost >= proceeds)
+        if position is None and not self._long_term:
+            position = self._short_term_costs.rightmost(
+                lambda cost: cost is not _REMOVED
+            )
+        if position is None and not self._long_term:
+            raise IndexError("index is empty")
+        self._peeked = (transaction, position)
+        return position
+
+    def _peek_lot(self, transaction: exchange_transactions.Spend) -> typing.Any:
+        position = self._find(transaction)
+        if position is None:
+            return self._long_term[0][2]
+        lot = self._short_term[position][1]
+        assert lot is not None
+        return lot
+
+    def peek(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return self._load(self._peek_lot(transaction))
+
+    def _pop_lot(self, transaction: exchange_transactions.Spend) -> typing.Any:
+        position = self._find(transaction)
+        self._peeked = None
+        self._length -= 1
+        if position is None:
+            return heapq.heappop(self._long_term)[2]
+        sequence, lot, time_acquired = self._short_term[position]
+        assert lot is not None
+        self._short_term[position] = (sequence, None, time_acquired)
+        self._short_term_costs[position] = _REMOVED
+        # Discard removed 'AcquiredETH'; amortized O(1)
+        if len(self._short_term) > 2 * self._length + 64:
+            self._discard_removed()
+        return lot
+
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return self._load(self._pop_lot(transaction))
+
+    def _discard_removed(self) -> None:
+        """Index short-term 'AcquiredETH' again without removed positions"""
+        short_term = self._short_term[self._short_term_start :]
+        if instrumentation.ENABLED:
+            instrumentation.count("lots_reindexed", len(short_term))
+        self._short_term = []
+        self._short_term_costs = _MaxTree()
+        self._short_term_start = 0
+        self._ties = {}
+        for sequence, lot, _ in short_term:
+            if lot is not None:
+                self._append(sequence, lot)
+
+
+class AcquiredETHColumns(typing.Sequence[currency.AcquiredETH]):
+    """'AcquiredETH' stored as parallel arrays instead of instances
+
+    Uses a fraction of the memory of a list of 'AcquiredETH'. Items are
+    created when accessed, so any tax optimization method can sort or
+    select from an instance of this class like a list.
+    """
+
+    def __init__(self, acquired_eths: typing.Iterable[currency.AcquiredETH] = ()):
+        # Microseconds; see 'utils.convert_datetime_to_microseconds'
+        self.times_acquired = array.array("q")
+        # Wei can exceed 64 bits; 0 if removed
+        self.amounts_wei: list[int] = []
+        # 'None' if removed
+        self.costs_us_cents_per_eth_including_fees: list[
+            typing.Optional[decimal.Decimal]
+        ] = []
+        self.long_term_ordinals = array.array("i")
+        for acquired_eth in acquired_eths:
+            self.append(acquired_eth)
+
+    def __len__(self) -> int:
+        return len(self.amounts_wei)
+
+    @typing.overload
+    def __getitem__(self, index: int) -> currency.AcquiredETH:
+        ...
+
+    @typing.overload
+    def __getitem__(self, index: slice) -> list[currency.AcquiredETH]:
+        ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[index_] for index_ in range(*index.indices(len(self)))]
+        return self.create_acquired_eth(index, self.amounts_wei[index])
+
+    def append(self, acquired_eth: currency.AcquiredETH) -> int:
+        """Append 'AcquiredETH' and return its index"""
+        self.times_acquired.append(
+            utils.convert_datetime_to_microseconds(acquired_eth.time_acquired)
+        )
+        self.amounts_wei.append(acquired_eth.amount_wei)
+        self.costs_us_cents_per_eth_including_fees.append(
+            acquired_eth.cost_us_cents_per_eth_including_fees
+        )
+        self.long_term_ordinals.append(acquired_eth.long_term_ordinal)
+        return len(self.amounts_wei) - 1
+
+    def create_acquired_eth(self, index: int, amount_wei: int) -> currency.AcquiredETH:
+        """Create 'AcquiredETH' for part of item at index"""
+        cost = self.costs_us_cents_per_eth_including_fees[index]
+        if cost is None:
+            raise IndexError("item was removed")
+        return currency.AcquiredETH.create_trusted(
+            utils.convert_microseconds_to_datetime(self.times_acquired[index]),
+            amount_wei,
+            cost,
+            self.long_term_ordinals[index],
+        )
+
+    def remove(self, index: int) -> None:
+        """Mark item at index as removed"""
+        self.amounts_wei[index] = 0
+        self.costs_us_cents_per_eth_including_fees[index] = None
+
+
+class ColumnarLotIndex(LotIndex):
+    """Heap of positions in 'AcquiredETHColumns'
+
+    Like 'PriorityLotIndex', except that 'AcquiredETH' are only created
+    when removed. 'peek' returns a copy.
+    """
+
+    def __init__(
+        self,
+        column_priority: typing.Callable[[int, decimal.Decimal], typing.Any],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._column_priority = column_priority
+        self._build(acquired_eths)
+
+    def _build(self, acquired_eths: typing.Iterable[currency.AcquiredETH]) -> None:
+        self._columns = AcquiredETHColumns(acquired_eths)
+        # Negative position: last one added is most tax optimal for ties
+        self._heap: list[tuple[typing.Any, int]] = [
+            (self._priority(index), -index) for index in range(len(self._columns))
+        ]
+        heapq.heapify(self._heap)
+
+    def _priority(self, index: int) -> typing.Any:
+        cost = self._columns.costs_us_cents_per_eth_including_fees[index]
+        assert cost is not None
+        return self._column_priority(self._columns.times_acquired[index], cost)
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        for _, index in sorted(self._heap, key=lambda item: -item[1]):
+            yield self._columns[-index]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        index = self._columns.append(acquired_eth)
+        heapq.heappush(self._heap, (self._priority(index), -index))
+
+    def peek(self, _: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return self._columns[-self._heap[0][1]]
+
+    def _pop_index(self) -> int:
+        index = -heapq.heappop(self._heap)[1]
+        self._columns.remove(index)
+        # Discard removed items; amortized O(1)
+        if len(self._columns) > 2 * len(self._heap) + 64:
+            self._build(list(self))
+        return index
+
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        acquired_eth = self.peek(transaction)
+        self._pop_index()
+        return acquired_eth
+
+    def remove_wei(
+        self, transaction: exchange_transactions.Spend
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        amount_wei = transaction.amount_wei
+        while amount_wei > 0:
+            index = -self._heap[0][1]
+            # Not a local variable; '_pop_index' can replace columns
+            amounts_wei = self._columns.amounts_wei
+            if amounts_wei[index] > amount_wei:
+                if instrumentation.ENABLED:
+                    instrumentation.count("lot_splits")
+                amounts_wei[index] -= amount_wei
+                acquired_eth = self._columns.create_acquired_eth(index, amount_wei)
+            else:
+                acquired_eth = self._columns[index]
+                self._pop_index()
+            amount_wei -= acquired_eth.amount_wei
+            yield acquired_eth
+
+
+class ColumnarBracketLotIndex(BracketLotIndex):
+    """'BracketLotIndex' of positions in 'AcquiredETHColumns'
+
+    Like 'ColumnarLotIndex', 'AcquiredETH' are only created when
+    removed or when they become long-term. 'peek' returns a copy.
+    """
+
+    def _build(self, acquired_eths: typing.Iterable[currency.AcquiredETH]) -> None:
+        self._columns = AcquiredETHColumns()
+        super()._build(acquired_eths)
+
+    def _store(self, acquired_eth: currency.AcquiredETH) -> int:
+        return self._columns.append(acquired_eth)
+
+    def _load(self, lot: int) -> currency.AcquiredETH:
+        return self._columns[lot]
+
+    def _time_acquired(self, lot: int) -> datetime.datetime:
+        return utils.convert_microseconds_to_datetime(self._columns.times_acquired[lot])
+
+    def _cost(self, lot: int) -> decimal.Decimal:
+        cost = self._columns.costs_us_cents_per_eth_including_fees[lot]
+        assert cost is not None
+        return cost
+
+    def _long_term_ordinal(self, lot: int) -> int:
+        return self._columns.long_term_ordinals[lot]
+
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        index = self._pop_lot(transaction)
+        acquired_eth = self._columns[index]
+        self._columns.remove(index)
+        # Discard removed items; amortized O(1)
+        if len(self._columns) > 2 * len(self) + 64:
+            self._build(list(self))
+        return acquired_eth
+
+    def remove_wei(
+        self, transaction: exchange_transactions.Spend
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        amount_wei = transaction.amount_wei
+        while amount_wei > 0:
+            index = self._peek_lot(transaction)
+            # Not a local variable; 'pop' can replace columns
+            amounts_wei = self._columns.amounts_wei
+            if amounts_wei[index] > amount_wei:
+                if instrumentation.ENABLED:
+                    instrumentation.count("lot_splits")
+                amounts_wei[index] -= amount_wei
+                acquired_eth = self._columns.create_acquired_eth(index, amount_wei)
+            else:
+                acquired_eth = self.pop(transaction)
+            amount_wei -= acquired_eth.amount_wei
+            yield acquired_eth
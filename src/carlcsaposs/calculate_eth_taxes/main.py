@@ -16,23 +16,135 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import pathlib
+import typing
+
+from . import config as config_
+from . import currency
+from . import event_log
+from . import exchange_transactions
 from . import file_reader
 from . import file_writer
+from . import instrumentation
+from . import tax_optimizer
 from . import transaction_processor
-from . import user_input
 
 
-EXCHANGE_TRANSACTIONS = file_reader.read_files(
-    user_input.ETHERSCAN_TRANSACTION_CSVS,
-    user_input.COINBASE_CSV,
-    user_input.COINBASE_PRO_ACCOUNT_CSV,
-    user_input.BLOCKLISTED_COINBASE_PRO_TRANSFER_IDS,
-)
+def resolve_tax_modes(
+    tax_modes_by_year: dict[int, str]
+) -> dict[int, type[tax_optimizer.OptimizationMethod]]:
+    """Convert names in 'config.TAX_MODE_NAMES' to 'OptimizationMethod'"""
+    return {
+        year: getattr(tax_optimizer, tax_mode)
+        for year, tax_mode in tax_modes_by_year.items()
+    }
+
+
+def _write_rows(
+    rows: typing.Iterable[file_writer.Form8949Row],
+    config: config_.Config,
+    summary: file_writer.Summary,
+) -> None:
+    if config.sharded_output_directory is not None:
+        # File for each tax year and term, written concurrently
+        file_writer.write_rows_to_shards(
+            rows, pathlib.Path(config.sharded_output_directory), summary=summary
+        )
+    else:
+        file_writer.Form8949File.write_rows_to_file(
+            rows, pathlib.Path(config.output_csv), summary=summary
+        )
+
+
+def _get_read_arguments(config: config_.Config) -> tuple:
+    """Arguments of 'file_reader.read_files' for 'config'"""
+    return (
+        config.etherscan_transaction_csvs,
+        config.coinbase_csv,
+        config.coinbase_pro_account_csv,
+        config.blocklisted_coinbase_pro_transfer_ids,
+        config.optimal_assignment,
+        config.max_workers,
+        config.input_directory,
+    )
+
+
+def read_transactions(
+    config: config_.Config,
+) -> list[exchange_transactions.CurrencyExchange]:
+    """Read transactions from input files in 'config'
+
+    Uses event log, if configured
+    """
+    read_arguments = _get_read_arguments(config)
+    with instrumentation.stage("read_files"):
+        if config.event_log_directory is not None:
+            return event_log.read_files(config.event_log_directory, *read_arguments)
+        return file_reader.read_files(*read_arguments)
+
+
+def read_transactions_by_source(
+    config: config_.Config,
+) -> list[file_reader.ExchangeTransactions]:
+    """Read transactions of each source, in chronological order
+
+    Uses event log, if configured
+    """
+    if config.event_log_directory is None:
+        with instrumentation.stage("read_files"):
+            return file_reader.read_files_by_source(*_get_read_arguments(config))
+    # Event log does not keep sources apart; sorting transactions (stable)
+    # gives the same order as merging sources
+    transactions = read_transactions(config)
+    transactions.sort(key=lambda transaction: transaction.time)
+    return [transactions]
 
-SPENT_ETHS = transaction_processor.convert_transactions_to_spent_eth(
-    EXCHANGE_TRANSACTIONS, user_input.TAX_MODES_BY_YEAR
-)
 
-ROWS = [spent_eth.convert_to_form_8949_row() for spent_eth in SPENT_ETHS]
+def run(config: config_.Config) -> file_writer.Summary:
+    """Generate Form 8949 data for inputs in 'config'
 
-file_writer.Form8949File(ROWS).write_to_file("output.csv")
+    Returns totals by tax year and term
+    """
+    tax_modes_by_year = resolve_tax_modes(config.tax_modes_by_year)
+    # Totals by tax year and term, accumulated as rows are written
+    summary = file_writer.Summary()
+    spent_eths: typing.Iterable[currency.SpentETH]
+    if config.streaming:
+        sources = read_transactions_by_source(config)
+        # Spend, convert and write as transactions are merged; peak memory
+        # tracks the open lots instead of every 'SpentETH' and row. Stages
+        # are interleaved, so they are timed together
+        with instrumentation.stage("process_and_write"):
+            spent_eths = transaction_processor.iterate_spent_eths(
+                exchange_transactions.merge_in_chronological_order(sources),
+                tax_modes_by_year,
+                config.exact_arithmetic,
+                config.columnar,
+                in_chronological_order=True,
+            )
+            _write_rows(
+                currency.convert_spent_eths_to_form_8949_rows(spent_eths),
+                config,
+                summary,
+            )
+    else:
+        transactions = read_transactions(config)
+        with instrumentation.stage("process"):
+            spent_eths = transaction_processor.convert_transactions_to_spent_eth(
+                transactions,
+                tax_modes_by_year,
+                config.exact_arithmetic,
+                config.columnar,
+            )
+        with instrumentation.stage("convert_to_rows"):
+            rows = list(currency.convert_spent_eths_to_form_8949_rows(spent_eths))
+        with instrumentation.stage("write"):
+            if config.sharded_output_directory is not None:
+                _write_rows(rows, config, summary)
+            else:
+                file_writer.Form8949File(rows).write_to_file(
+                    pathlib.Path(config.output_csv), summary=summary
+                )
+    if config.summary_csv is not None:
+        summary.write_to_file(pathlib.Path(config.summary_csv))
+    return summary
@@ -0,0 +1,708 @@
+"""
+persistent_inventory: Persistent index of 'AcquiredETH' held by taxpayer
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import abc
+import copy
+import datetime
+import decimal
+import itertools
+import math
+import random
+import typing
+
+from . import currency
+from . import exchange_transactions
+from . import instrumentation
+from . import inventory
+
+
+class _Node(typing.NamedTuple):
+    """Node of a persistent treap; never modified, so it can be shared"""
+
+    key: typing.Any
+    # Parent has higher weight than children; random weights keep tree
+    # balanced (expected depth O(log N))
+    weight: float
+    acquired_eth: currency.AcquiredETH
+    left: typing.Optional["_Node"]
+    right: typing.Optional["_Node"]
+    # Highest cost in subtree, to find latest match in O(log N)
+    max_cost: decimal.Decimal
+
+
+def _create_node(
+    key: typing.Any,
+    weight: float,
+    acquired_eth: currency.AcquiredETH,
+    left: typing.Optional[_Node],
+    right: typing.Optional[_Node],
+) -> _Node:
+    max_cost = acquired_eth.cost_us_cents_per_eth_including_fees
+    if left is not None and left.max_cost > max_cost:
+        max_cost = left.max_cost
+    if right is not None and right.max_cost > max_cost:
+        max_cost = right.max_cost
+    return _Node(key, weight, acquired_eth, left, right, max_cost)
+
+
+def _build_tree(
+    items: typing.Sequence[tuple[typing.Any, currency.AcquiredETH]]
+) -> typing.Optional[_Node]:
+    """Balanced treap of (key, 'AcquiredETH') sorted by key, in O(N)
+
+    Weights decrease with depth, so that the balanced tree is a treap
+    """
+    height = len(items).bit_length()
+
+    def build(start: int, stop: int, depth: int) -> typing.Optional[_Node]:
+        """Subtree of items from 'start' to 'stop' at 'depth'"""
+        if start >= stop:
+            return None
+        middle = (start + stop) // 2
+        key, acquired_eth = items[middle]
+        return _create_node(
+            key,
+            (height - depth + random.random()) / (height + 1),
+            acquired_eth,
+            build(start, middle, depth + 1),
+            build(middle + 1, stop, depth + 1),
+        )
+
+    return build(0, len(items), 0)
+
+
+def _split(
+    node: typing.Optional[_Node], key: typing.Any
+) -> tuple[typing.Optional[_Node], typing.Optional[_Node]]:
+    """Trees of nodes with keys lower than key and of the rest"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        left, right = _split(node.right, key)
+        return (
+            _create_node(node.key, node.weight, node.acquired_eth, node.left, left),
+            right,
+        )
+    left, right = _split(node.left, key)
+    return left, _create_node(
+        node.key, node.weight, node.acquired_eth, right, node.right
+    )
+
+
+def _merge(
+    left: typing.Optional[_Node], right: typing.Optional[_Node]
+) -> typing.Optional[_Node]:
+    """Join trees; keys in left tree must be lower than keys in right tree"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.weight > right.weight:
+        return _create_node(
+            left.key,
+            left.weight,
+            left.acquired_eth,
+            left.left,
+            _merge(left.right, right),
+        )
+    return _create_node(
+        right.key,
+        right.weight,
+        right.acquired_eth,
+        _merge(left, right.left),
+        right.right,
+    )
+
+
+def _insert(
+    node: typing.Optional[_Node],
+    key: typing.Any,
+    acquired_eth: currency.AcquiredETH,
+    weight: float,
+) -> _Node:
+    if node is None or weight > node.weight:
+        left, right = _split(node, key)
+        return _create_node(key, weight, acquired_eth, left, right)
+    if key < node.key:
+        return _create_node(
+            node.key,
+            node.weight,
+            node.acquired_eth,
+            _insert(node.left, key, acquired_eth, weight),
+            node.right,
+        )
+    return _create_node(
+        node.key,
+        node.weight,
+        node.acquired_eth,
+        node.left,
+        _insert(node.right, key, acquired_eth, weight),
+    )
+
+
+def _delete(node: typing.Optional[_Node], key: typing.Any) -> typing.Optional[_Node]:
+    """Tree without node with key; key must be in tree"""
+    assert node is not None
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        return _create_node(
+            node.key,
+            node.weight,
+            node.acquired_eth,
+            _delete(node.left, key),
+            node.right,
+        )
+    return _create_node(
+        node.key,
+        node.weight,
+        node.acquired_eth,
+        node.left,
+        _delete(node.right, key),
+    )
+
+
+def _replace(
+    node: typing.Optional[_Node], key: typing.Any, acquired_eth: currency.AcquiredETH
+) -> _Node:
+    """Tree with 'AcquiredETH' of node with key replaced; key must be in tree
+
+    'acquired_eth' must have the same cost
+    """
+    assert node is not None
+    if key == node.key:
+        return node._replace(acquired_eth=acquired_eth)
+    if key < node.key:
+        return node._replace(left=_replace(node.left, key, acquired_eth))
+    return node._replace(right=_replace(node.right, key, acquired_eth))
+
+
+def _first(node: typing.Optional[_Node]) -> typing.Optional[_Node]:
+    """Node with lowest key"""
+    if node is None:
+        return None
+    while node.left is not None:
+        node = node.left
+    return node
+
+
+def _last_before(
+    node: typing.Optional[_Node], key: typing.Any
+) -> typing.Optional[_Node]:
+    """Node with highest key lower than key"""
+    last = None
+    while node is not None:
+        if node.key < key:
+            last = node
+            node = node.right
+        else:
+            node = node.left
+    return last
+
+
+def _last_matching(
+    node: typing.Optional[_Node], is_match: typing.Callable[[typing.Any], bool]
+) -> typing.Optional[_Node]:
+    """Node with highest key and matching cost
+
+    'is_match' must be true for a maximum if it is true for any cost the
+    maximum includes
+    """
+    while node is not None:
+        if node.right is not None and is_match(node.right.max_cost):
+            node = node.right
+        elif is_match(node.acquired_eth.cost_us_cents_per_eth_including_fees):
+            return node
+        elif node.left is not None and is_match(node.left.max_cost):
+            node = node.left
+        else:
+            return None
+    return None
+
+
+def _iterate(node: typing.Optional[_Node]) -> typing.Iterator[_Node]:
+    """Iterate over nodes in order of key"""
+    stack: list[_Node] = []
+    while stack or node is not None:
+        while node is not None:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        yield node
+        node = node.right
+
+
+class PersistentLotIndex(inventory.LotIndex):
+    """Index made of immutable nodes, which are shared with its forks
+
+    'fork' is O(1): a fork shares every node with this index, and each
+    copies only the O(log N) nodes on the path to a node it changes.
+    'AcquiredETH' in the index are never modified; if only part of one
+    is spent, it is replaced by the rest ('AcquiredETH.split_wei'). So
+    forks can diverge without copying (e.g. to process the rest of the
+    transactions with other tax modes) and can be used in other threads
+    """
+
+    def fork(self) -> "PersistentLotIndex":
+        """Index with the same 'AcquiredETH' that changes independently"""
+        return copy.copy(self)
+
+    @abc.abstractmethod
+    def replace(
+        self,
+        transaction: exchange_transactions.Spend,
+        acquired_eth: currency.AcquiredETH,
+    ) -> None:
+        """Replace most tax optimal 'AcquiredETH' for transaction with part of it"""
+
+    def remove_wei(
+        self, transaction: exchange_transactions.Spend
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        amount_wei = transaction.amount_wei
+        while amount_wei > 0:
+            acquired_eth = self.peek(transaction)
+            if acquired_eth.amount_wei > amount_wei:
+                if instrumentation.ENABLED:
+                    instrumentation.count("lot_splits")
+                acquired_eth, rest = acquired_eth.split_wei(amount_wei)
+                self.replace(transaction, rest)
+            else:
+                acquired_eth = self.pop(transaction)
+            amount_wei -= acquired_eth.amount_wei
+            yield acquired_eth
+
+
+class PersistentSelectionLotIndex(PersistentLotIndex):
+    """Like 'inventory.SelectionLotIndex', with a persistent treap by order added"""
+
+    def __init__(
+        self,
+        select: typing.Callable[
+            [list[currency.AcquiredETH], exchange_transactions.Spend],
+            typing.Iterator[currency.AcquiredETH],
+        ],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._select = select
+        items = list(enumerate(acquired_eths))
+        self._root = _build_tree(items)
+        self._count = len(items)
+        self._length = len(items)
+        self._transaction: typing.Optional[exchange_transactions.Spend] = None
+        # Key of each 'AcquiredETH' in selection, by 'id()'
+        self._keys: dict[int, int] = {}
+        self._selection: typing.Iterator[currency.AcquiredETH] = iter([])
+        self._selected: typing.Optional[currency.AcquiredETH] = None
+
+    def fork(self) -> "PersistentSelectionLotIndex":
+        lot_index = copy.copy(self)
+        # Selection is an iterator, which cannot be shared
+        lot_index._transaction = None  # pylint: disable=protected-access
+        return lot_index
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        for node in _iterate(self._root):
+            yield node.acquired_eth
+
+    def __len__(self) -> int:
+        return self._length
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        self._root = _insert(self._root, self._count, acquired_eth, random.random())
+        self._count += 1
+        self._length += 1
+        self._transaction = None
+
+    def _peek_node(
+        self, transaction: exchange_transactions.Spend
+    ) -> tuple[int, currency.AcquiredETH]:
+        if transaction is not self._transaction:
+            nodes = list(_iterate(self._root))
+            if instrumentation.ENABLED:
+                instrumentation.count("lot_selections")
+                instrumentation.count("lots_sorted", len(nodes))
+            self._keys = {id(node.acquired_eth): node.key for node in nodes}
+            self._selection = self._select(
+                [node.acquired_eth for node in nodes], transaction
+            )
+            self._selected = None
+            self._transaction = transaction
+        if self._selected is None:
+            try:
+                self._selected = next(self._selection)
+            except StopIteration:
+                raise IndexError("index is empty") from None
+        return self._keys[id(self._selected)], self._selected
+
+    def peek(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return self._peek_node(transaction)[1]
+
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        key, acquired_eth = self._peek_node(transaction)
+        self._selected = None
+        self._root = _delete(self._root, key)
+        self._length -= 1
+        return acquired_eth
+
+    def replace(
+        self,
+        transaction: exchange_transactions.Spend,
+        acquired_eth: currency.AcquiredETH,
+    ) -> None:
+        key, _ = self._peek_node(transaction)
+        self._root = _replace(self._root, key, acquired_eth)
+        self._transaction = None
+
+
+class PersistentPriorityLotIndex(PersistentLotIndex):
+    """Like 'inventory.PriorityLotIndex', with a persistent treap keyed by priority
+
+    Peek, add and pop are O(log N)
+    """
+
+    def __init__(
+        self,
+        priority: typing.Callable[[currency.AcquiredETH], typing.Any],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._priority = priority
+        # Negative count: last one added is most tax optimal for ties
+        items = sorted(
+            (
+                ((priority(acquired_eth), -count), acquired_eth)
+                for count, acquired_eth in enumerate(acquired_eths)
+            ),
+            key=lambda item: item[0],
+        )
+        self._root = _build_tree(items)
+        self._count = len(items)
+        self._length = len(items)
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        for node in sorted(_iterate(self._root), key=lambda node: -node.key[1]):
+            yield node.acquired_eth
+
+    def __len__(self) -> int:
+        return self._length
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        self._root = _insert(
+            self._root,
+            (self._priority(acquired_eth), -self._count),
+            acquired_eth,
+            random.random(),
+        )
+        self._count += 1
+        self._length += 1
+
+    def _first(self) -> _Node:
+        node = _first(self._root)
+        if node is None:
+            raise IndexError("index is empty")
+        return node
+
+    def peek(self, _: exchange_transactions.Spend) -> currency.AcquiredETH:
+        return self._first().acquired_eth
+
+    def pop(self, _: exchange_transactions.Spend) -> currency.AcquiredETH:
+        node = self._first()
+        self._root = _delete(self._root, node.key)
+        self._length -= 1
+        return node.acquired_eth
+
+    def replace(
+        self, _: exchange_transactions.Spend, acquired_eth: currency.AcquiredETH
+    ) -> None:
+        self._root = _replace(self._root, self._first().key, acquired_eth)
+
+
+class PersistentBracketLotIndex(PersistentLotIndex):
+    """Like 'inventory.BracketLotIndex', with persistent treaps
+
+    Short-term 'AcquiredETH' are keyed by time acquired, order for last
+    spend and sequence added, with the highest cost of each subtree, so
+    the latest non-gain or gain for a transaction is found in O(log N).
+    Long-term 'AcquiredETH' are keyed by 'long_term_priority' and rank.
+    Ties are in the same order as 'inventory.BracketLotIndex'.
+    'AcquiredETH' can be added in any order; if transactions are not in
+    chronological order, the index is rebuilt
+    """
+
+    def __init__(
+        self,
+        long_term_priority: typing.Callable[[currency.AcquiredETH], typing.Any],
+        acquired_eths: typing.Iterable[currency.AcquiredETH],
+    ):
+        self._long_term_priority = long_term_priority
+        self._build(acquired_eths)
+
+    def _build(self, acquired_eths: typing.Iterable[currency.AcquiredETH]) -> None:
+        items = sorted(
+            (
+                ((acquired_eth.time_acquired, sequence, sequence), acquired_eth)
+                for sequence, acquired_eth in enumerate(acquired_eths)
+            ),
+            key=lambda item: item[0],
+        )
+        if instrumentation.ENABLED:
+            instrumentation.count("lots_reindexed", len(items))
+        self._short_term = _build_tree(items)
+        # Lowest and highest cost of equal times not in order of cost, by
+        # time. Replaced, never modified, so it can be shared with forks
+        self._ties: dict[
+            datetime.datetime, tuple[decimal.Decimal, decimal.Decimal]
+        ] = {}
+        for time_acquired, group in itertools.groupby(
+            items, key=lambda item: item[0][0]
+        ):
+            costs = [
+                acquired_eth.cost_us_cents_per_eth_including_fees
+                for _, acquired_eth in group
+            ]
+            if costs != sorted(costs):
+                self._ties[time_acquired] = (min(costs), max(costs))
+        # Key is priority and rank; ranks of 'AcquiredETH' that become
+        # long-term are lower (more tax optimal) or higher than all others
+        self._long_term: typing.Optional[_Node] = None
+        self._lower_rank = 0
+        self._higher_rank = 0
+        # Number of 'AcquiredETH' added; sequence of next one added
+        self._count = len(items)
+        self._length = len(items)
+        self._transaction: typing.Optional[exchange_transactions.Spend] = None
+        # Proceeds of last spend and number of 'AcquiredETH' added before it
+        self._last_spend: typing.Optional[tuple[decimal.Decimal, int]] = None
+        self._peeked: typing.Optional[
+            tuple[exchange_transactions.Spend, typing.Optional[_Node]]
+        ] = None
+
+    def __iter__(self) -> typing.Iterator[currency.AcquiredETH]:
+        # If no last spend, no 'AcquiredETH' were held at it
+        proceeds, held = self._last_spend or (decimal.Decimal(0), 0)
+        gains = []
+        non_gains = []
+        added = []
+        for node in _iterate(self._short_term):
+            acquired_eth = node.acquired_eth
+            if node.key[2] >= held:
+                added.append((node.key[2], acquired_eth))
+            elif proceeds > acquired_eth.cost_us_cents_per_eth_including_fees:
+                gains.append(acquired_eth)
+            else:
+                non_gains.append(acquired_eth)
+        yield from gains
+        for node in reversed(list(_iterate(self._long_term))):
+            yield node.acquired_eth
+        yield from non_gains
+        for _, acquired_eth in sorted(added, key=lambda item: item[0]):
+            yield acquired_eth
+
+    def __len__(self) -> int:
+        return self._length
+
+    def add(self, acquired_eth: currency.AcquiredETH) -> None:
+        self._peeked = None
+        time_acquired = acquired_eth.time_acquired
+        cost = acquired_eth.cost_us_cents_per_eth_including_fees
+        # Equal times are in order of cost, unless in 'ties'
+        last = _last_before(self._short_term, (time_acquired, math.inf))
+        if last is not None and last.key[0] == time_acquired:
+            if time_acquired in self._ties:
+                lowest, highest = self._ties[time_acquired]
+                self._ties = {
+                    **self._ties,
+                    time_acquired: (min(lowest, cost), max(highest, cost)),
+                }
+            elif cost < last.acquired_eth.cost_us_cents_per_eth_including_fees:
+                _, run, _ = self._split_time(time_acquired)
+                costs = [cost] + [
+                    node.acquired_eth.cost_us_cents_per_eth_including_fees
+                    for node in _iterate(run)
+                ]
+                self._ties = {**self._ties, time_acquired: (min(costs), max(costs))}
+        # Order for last spend is after all others; if long-term at last
+        # transaction, moved at next transaction
+        self._short_term = _insert(
+            self._short_term,
+            (time_acquired, self._count, self._count),
+            acquired_eth,
+            random.random(),
+        )
+        self._count += 1
+        self._length += 1
+
+    def _split_time(
+        self, time_acquired: datetime.datetime
+    ) -> tuple[typing.Optional[_Node], typing.Optional[_Node], typing.Optional[_Node]]:
+        """Short-term trees of earlier times, of time and of later times"""
+        earlier, rest = _split(self._short_term, (time_acquired,))
+        run, later = _split(rest, (time_acquired, math.inf))
+        return earlier, run, later
+
+    def _start(self, transaction: exchange_transactions.Spend) -> None:
+        """Update ties for last spend and move 'AcquiredETH' to long-term"""
+        if self._transaction is not None and transaction.time < self._transaction.time:
+            self._build(list(self))
+        if self._last_spend is not None:
+            self._sort_ties(*self._last_spend)
+        self._move_to_long_term(transaction.time.toordinal())
+        self._transaction = transaction
+        self._last_spend = (
+            transaction.proceeds_us_cents_per_eth_excluding_fees,
+            self._count,
+        )
+
+    def _sort_ties(self, proceeds: decimal.Decimal, held: int) -> None:
+        """Move gains for spend before non-gains with equal times
+
+        Only 'AcquiredETH' held at spend ('sequence' lower than 'held')
+        """
+        ties = dict(self._ties)
+        for time_acquired, (lowest, highest) in self._ties.items():
+            # Order only changes if some costs are gains and some are not
+            if not lowest < proceeds <= highest:
+                continue
+            earlier, run, later = self._split_time(time_acquired)
+            nodes = list(_iterate(run))
+            # 'AcquiredETH' held at spend are before those added since
+            held_nodes = [node for node in nodes if node.key[2] < held]
+            sorted_nodes = [
+                node
+                for node in held_nodes
+                if proceeds > node.acquired_eth.cost_us_cents_per_eth_including_fees
+            ] + [
+                node
+                for node in held_nodes
+                if proceeds <= node.acquired_eth.cost_us_cents_per_eth_including_fees
+            ]
+            sorted_nodes += nodes[len(held_nodes) :]
+            if sorted_nodes != nodes:
+                # Orders of equal times are reassigned in new order
+                items = [
+                    ((time_acquired, node.key[1], sorted_node.key[2]), sorted_node)
+                    for node, sorted_node in zip(nodes, sorted_nodes)
+                ]
+                self._short_term = _merge(
+                    _merge(
+                        earlier,
+                        _build_tree([(key, node.acquired_eth) for key, node in items]),
+                    ),
+                    later,
+                )
+            costs = [
+                node.acquired_eth.cost_us_cents_per_eth_including_fees
+                for node in sorted_nodes
+            ]
+            # In order of cost, so no spend changes order (unless more added)
+            if costs == sorted(costs):
+                del ties[time_acquired]
+        if len(ties) != len(self._ties):
+            self._ties = ties
+
+    def _move_to_long_term(self, spent_ordinal: int) -> None:
+        """Move 'AcquiredETH' that are long-term at spend to long-term tree"""
+        # If no last spend, no 'AcquiredETH' were held at it
+        proceeds, held = self._last_spend or (decimal.Decimal(0), 0)
+        gains = []
+        non_gains = []
+        added = []
+        # Earliest short-term 'AcquiredETH' is the first to be long-term
+        node = _first(self._short_term)
+        while node is not None and spent_ordinal >= node.acquired_eth.long_term_ordinal:
+            self._short_term = _delete(self._short_term, node.key)
+            if node.key[2] >= held:
+                added.append((node.key[2], node.acquired_eth))
+            elif proceeds > node.acquired_eth.cost_us_cents_per_eth_including_fees:
+                gains.append(node.acquired_eth)
+            else:
+                non_gains.append(node.acquired_eth)
+            if node.key[0] in self._ties:
+                self._ties = {
+                    time_acquired: costs
+                    for time_acquired, costs in self._ties.items()
+                    if time_acquired != node.key[0]
+                }
+            node = _first(self._short_term)
+        # Same order as list sorted for last spend: gains, then long-term,
+        # then non-gains, then 'AcquiredETH' added since
+        for acquired_eth in reversed(gains):
+            self._insert_long_term(self._higher_rank, acquired_eth)
+            self._higher_rank += 1
+        added.sort(key=lambda item: item[0])
+        for acquired_eth in non_gains + [item[1] for item in added]:
+            self._lower_rank -= 1
+            self._insert_long_term(self._lower_rank, acquired_eth)
+
+    def _insert_long_term(self, rank: int, acquired_eth: currency.AcquiredETH) -> None:
+        self._long_term = _insert(
+            self._long_term,
+            (self._long_term_priority(acquired_eth), rank),
+            acquired_eth,
+            random.random(),
+        )
+
+    def _find(self, transaction: exchange_transactions.Spend) -> typing.Optional[_Node]:
+        """Node of most tax optimal short-term 'AcquiredETH'
+
+        'None' if most tax optimal is long-term
+        """
+        if self._peeked is not None and self._peeked[0] is transaction:
+            return self._peeked[1]
+        if transaction is not self._transaction:
+            self._start(transaction)
+        proceeds = transaction.proceeds_us_cents_per_eth_excluding_fees
+        node = _last_matching(self._short_term, lambda cost: cost >= proceeds)
+        if node is None and self._long_term is None:
+            node = _last_matching(self._short_term, lambda _: True)
+        if node is None and self._long_term is None:
+            raise IndexError("index is empty")
+        self._peeked = (transaction, node)
+        return node
+
+    def peek(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        node = self._find(transaction)
+        if node is None:
+            node = _first(self._long_term)
+            assert node is not None
+        return node.acquired_eth
+
+    def pop(self, transaction: exchange_transactions.Spend) -> currency.AcquiredETH:
+        node = self._find(transaction)
+        self._peeked = None
+        self._length -= 1
+        if node is None:
+            node = _first(self._long_term)
+            assert node is not None
+            self._long_term = _delete(self._long_term, node.key)
+        else:
+            self._short_term = _delete(self._short_term, node.key)
+        return node.acquired_eth
+
+    def replace(
+        self,
+        transaction: exchange_transactions.Spend,
+        acquired_eth: currency.AcquiredETH,
+    ) -> None:
+        node = self._find(transaction)
+        self._peeked = None
+        if node is None:
+            node = _first(self._long_term)
+            assert node is not None
+            self._long_term = _replace(self._long_term, node.key, acquired_eth)
+        else:
+            self._short_term = _replace(self._short_term, node.key, acquired_eth)
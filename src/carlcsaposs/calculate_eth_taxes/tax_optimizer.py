@@ -17,9 +17,14 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import abc
+import decimal
+import heapq
+import typing
 
 from . import currency
 from . import exchange_transactions
+from . import inventory
+from . import persistent_inventory
 from . import utils
 
 
@@ -38,30 +43,186 @@ class OptimizationMethod(abc.ABC):
         Least tax optimal is the first item
         """
 
+    @classmethod
+    def select(
+        cls,
+        acquired_eths: list[currency.AcquiredETH],
+        transaction: exchange_transactions.Spend,
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        """Yield 'AcquiredETH' in order of most to least tax optimal
 
-class FirstInFirstOut(OptimizationMethod):
-    """Spend ETH in the order it was purchased
+        Callers usually stop after the first few items, so methods
+        should avoid ordering more 'AcquiredETH' than are yielded.
+        """
+        yield from reversed(cls.sort(acquired_eths, transaction))
+
+    @classmethod
+    def create_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method"""
+        return inventory.SelectionLotIndex(cls.select, acquired_eths)
+
+    @classmethod
+    def create_columnar_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer as columns for this method
+
+        Methods without a columnar index use 'create_index'
+        """
+        return cls.create_index(acquired_eths)
 
-    Kept for backwards compatability and to support using other tax
-    calculation methods in other years
+    @classmethod
+    def create_persistent_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> persistent_inventory.PersistentLotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method; forks in O(1)
+
+        See 'persistent_inventory.PersistentLotIndex'
+        """
+        return persistent_inventory.PersistentSelectionLotIndex(
+            cls.select, acquired_eths
+        )
+
+
+def _select_lowest(
+    acquired_eths: list[currency.AcquiredETH],
+    priority: typing.Callable[[currency.AcquiredETH], typing.Any],
+) -> typing.Iterator[currency.AcquiredETH]:
+    """Yield 'AcquiredETH' from lowest to highest priority
+
+    For ties, the last item in the list is yielded first (same order as
+    reversed stable sort). O(N) until the first item, then O(log N) for
+    each item.
     """
+    heap = [
+        (priority(acquired_eth), -index, acquired_eth)
+        for index, acquired_eth in enumerate(acquired_eths)
+    ]
+    heapq.heapify(heap)
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+class PriorityOptimizationMethod(OptimizationMethod):
+    """Tax optimization method where order does not depend on transaction"""
 
     @staticmethod
+    @abc.abstractmethod
+    def column_priority(
+        time_acquired: int, cost_us_cents_per_eth_including_fees: decimal.Decimal
+    ) -> typing.Any:
+        """Sort key for 'AcquiredETH'; lowest is most tax optimal
+
+        'time_acquired' is in microseconds (see
+        'utils.convert_datetime_to_microseconds'), so that the key can be
+        computed from 'inventory.AcquiredETHColumns' without an
+        'AcquiredETH' instance
+        """
+
+    @classmethod
+    def priority(cls, acquired_eth: currency.AcquiredETH) -> typing.Any:
+        """Sort key for 'AcquiredETH'; lowest is most tax optimal"""
+        return cls.column_priority(
+            utils.convert_datetime_to_microseconds(acquired_eth.time_acquired),
+            acquired_eth.cost_us_cents_per_eth_including_fees,
+        )
+
+    @classmethod
     def sort(
-        acquired_eths: list[currency.AcquiredETH], _: exchange_transactions.Spend
+        cls, acquired_eths: list[currency.AcquiredETH], _: exchange_transactions.Spend
     ) -> list[currency.AcquiredETH]:
-        """Sort list of 'AcquiredETH' in reverse chronological order
+        """Sort list of 'AcquiredETH' in order of least to most tax optimal
 
-        First in is the last item
-        Last in is the first item
+        Most tax optimal is the last item
+        Least tax optimal is the first item
         """
-        return sorted(
-            acquired_eths,
-            key=lambda acquired_eth: acquired_eth.time_acquired,
-            reverse=True,
+        return sorted(acquired_eths, key=cls.priority, reverse=True)
+
+    @classmethod
+    def select(
+        cls, acquired_eths: list[currency.AcquiredETH], _: exchange_transactions.Spend
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        """Yield 'AcquiredETH' in order of most to least tax optimal"""
+        return _select_lowest(acquired_eths, cls.priority)
+
+    @classmethod
+    def create_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method"""
+        return inventory.PriorityLotIndex(cls.priority, acquired_eths)
+
+    @classmethod
+    def create_columnar_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer as columns for this method"""
+        return inventory.ColumnarLotIndex(cls.column_priority, acquired_eths)
+
+    @classmethod
+    def create_persistent_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> persistent_inventory.PersistentLotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method; forks in O(1)"""
+        return persistent_inventory.PersistentPriorityLotIndex(
+            cls.priority, acquired_eths
         )
 
 
+class FirstInFirstOut(PriorityOptimizationMethod):
+    """Spend ETH in the order it was purchased
+
+    Kept for backwards compatability and to support using other tax
+    calculation methods in other years
+    """
+
+    @staticmethod
+    def column_priority(time_acquired: int, _: decimal.Decimal) -> int:
+        """First in is most tax optimal"""
+        return time_acquired
+
+
+class LastInFirstOut(PriorityOptimizationMethod):
+    """Spend ETH in reverse of the order it was purchased"""
+
+    @staticmethod
+    def column_priority(time_acquired: int, _: decimal.Decimal) -> int:
+        """Last in is most tax optimal"""
+        return -time_acquired
+
+
+class HighestInFirstOut(PriorityOptimizationMethod):
+    """Spend most expensive ETH first
+
+    Realizes the lowest capital gain now, regardless of whether it is
+    short-term or long-term
+    """
+
+    @staticmethod
+    def column_priority(
+        _: int, cost_us_cents_per_eth_including_fees: decimal.Decimal
+    ) -> decimal.Decimal:
+        """Most expensive is most tax optimal"""
+        return -cost_us_cents_per_eth_including_fees
+
+
+class LowestInFirstOut(PriorityOptimizationMethod):
+    """Spend cheapest ETH first
+
+    Realizes the highest capital gain now, regardless of whether it is
+    short-term or long-term
+    """
+
+    @staticmethod
+    def column_priority(
+        _: int, cost_us_cents_per_eth_including_fees: decimal.Decimal
+    ) -> decimal.Decimal:
+        """Cheapest is most tax optimal"""
+        return cost_us_cents_per_eth_including_fees
+
+
 def _separate_acquired_eths(
     acquired_eths: list[currency.AcquiredETH], transaction: exchange_transactions.Spend
 ) -> tuple[
@@ -71,8 +232,9 @@ def _separate_acquired_eths(
     long_term = []
     short_term_gains = []
     short_term_non_gains = []  # loss or net zero
+    spent_ordinal = transaction.time.toordinal()
     for acquired_eth in acquired_eths:
-        if utils.is_long_term(acquired_eth.time_acquired, transaction.time):
+        if spent_ordinal >= acquired_eth.long_term_ordinal:
             long_term.append(acquired_eth)
         elif (
             transaction.proceeds_us_cents_per_eth_excluding_fees
@@ -84,6 +246,24 @@ def _separate_acquired_eths(
     return long_term, short_term_gains, short_term_non_gains
 
 
+def _select_for_bracket(
+    acquired_eths: list[currency.AcquiredETH],
+    transaction: exchange_transactions.Spend,
+    long_term_priority: typing.Callable[[currency.AcquiredETH], typing.Any],
+) -> typing.Iterator[currency.AcquiredETH]:
+    """Yield 'AcquiredETH' in order of most to least tax optimal
+
+    Short-term non-gains (latest first), then long-term (by
+    'long_term_priority'), then short-term gains (latest first)
+    """
+    long_term, short_term_gains, short_term_non_gains = _separate_acquired_eths(
+        acquired_eths, transaction
+    )
+    yield from _select_lowest(short_term_non_gains, LastInFirstOut.priority)
+    yield from _select_lowest(long_term, long_term_priority)
+    yield from _select_lowest(short_term_gains, LastInFirstOut.priority)
+
+
 class LowerTaxBracket(OptimizationMethod):
     """Optimize for long-term capital gains, then higher taxes for year
 
@@ -130,6 +310,52 @@ class LowerTaxBracket(OptimizationMethod):
         short_term_gains.sort(key=lambda acquired_eth: acquired_eth.time_acquired)
         return short_term_gains + long_term + short_term_non_gains
 
+    @classmethod
+    def select(
+        cls,
+        acquired_eths: list[currency.AcquiredETH],
+        transaction: exchange_transactions.Spend,
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        """Yield 'AcquiredETH' in order of most to least tax optimal"""
+        return _select_for_bracket(
+            acquired_eths,
+            transaction,
+            lambda acquired_eth: acquired_eth.cost_us_cents_per_eth_including_fees,
+        )
+
+    @classmethod
+    def create_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method
+
+        Same order as 'sort' without sorting for each transaction
+        """
+        return inventory.BracketLotIndex(
+            lambda acquired_eth: acquired_eth.cost_us_cents_per_eth_including_fees,
+            acquired_eths,
+        )
+
+    @classmethod
+    def create_columnar_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer as columns for this method"""
+        return inventory.ColumnarBracketLotIndex(
+            lambda acquired_eth: acquired_eth.cost_us_cents_per_eth_including_fees,
+            acquired_eths,
+        )
+
+    @classmethod
+    def create_persistent_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> persistent_inventory.PersistentLotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method; forks in O(1)"""
+        return persistent_inventory.PersistentBracketLotIndex(
+            lambda acquired_eth: acquired_eth.cost_us_cents_per_eth_including_fees,
+            acquired_eths,
+        )
+
 
 class HigherTaxBracket(OptimizationMethod):
     """Optimize for long-term capital gains, then lower taxes for year
@@ -175,3 +401,49 @@ class HigherTaxBracket(OptimizationMethod):
         )
         short_term_gains.sort(key=lambda acquired_eth: acquired_eth.time_acquired)
         return short_term_gains + long_term + short_term_non_gains
+
+    @classmethod
+    def select(
+        cls,
+        acquired_eths: list[currency.AcquiredETH],
+        transaction: exchange_transactions.Spend,
+    ) -> typing.Iterator[currency.AcquiredETH]:
+        """Yield 'AcquiredETH' in order of most to least tax optimal"""
+        return _select_for_bracket(
+            acquired_eths,
+            transaction,
+            lambda acquired_eth: -acquired_eth.cost_us_cents_per_eth_including_fees,
+        )
+
+    @classmethod
+    def create_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method
+
+        Same order as 'sort' without sorting for each transaction
+        """
+        return inventory.BracketLotIndex(
+            lambda acquired_eth: -acquired_eth.cost_us_cents_per_eth_including_fees,
+            acquired_eths,
+        )
+
+    @classmethod
+    def create_columnar_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> inventory.LotIndex:
+        """Index 'AcquiredETH' held by taxpayer as columns for this method"""
+        return inventory.ColumnarBracketLotIndex(
+            lambda acquired_eth: -acquired_eth.cost_us_cents_per_eth_including_fees,
+            acquired_eths,
+        )
+
+    @classmethod
+    def create_persistent_index(
+        cls, acquired_eths: typing.Iterable[currency.AcquiredETH]
+    ) -> persistent_inventory.PersistentLotIndex:
+        """Index 'AcquiredETH' held by taxpayer for this method; forks in O(1)"""
+        return persistent_inventory.PersistentBracketLotIndex(
+            lambda acquired_eth: -acquired_eth.cost_us_cents_per_eth_including_fees,
+            acquired_eths,
+        )
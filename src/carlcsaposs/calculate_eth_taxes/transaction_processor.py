@@ -16,10 +16,15 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import copy
 import dataclasses
+import typing
 
 from . import currency
 from . import exchange_transactions
+from . import instrumentation
+from . import inventory
+from . import persistent_inventory
 from . import tax_optimizer
 
 
@@ -27,65 +32,296 @@ from . import tax_optimizer
 class _TransactionProcessor:
     """Convert transactions to list of 'SpentETH'"""
 
-    transactions: list[exchange_transactions.CurrencyExchange]
-    tax_modes_by_year: dict[int, tax_optimizer.OptimizationMethod]
+    transactions: typing.Iterable[exchange_transactions.CurrencyExchange]
+    tax_modes_by_year: dict[int, type[tax_optimizer.OptimizationMethod]]
+    # Integer arithmetic instead of 'decimal'; see 'convert_to_spent_eth_exact'
+    exact_arithmetic: bool = False
+    # Hold 'AcquiredETH' as columns; see 'inventory.AcquiredETHColumns'
+    columnar: bool = False
+    # If 'transactions' are already in chronological order, they are not
+    # sorted (and can be any iterable)
+    in_chronological_order: bool = False
+    # Hold 'AcquiredETH' in an index that can be forked; see 'fork'
+    persistent: bool = False
 
-    def __post_init__(self):
-        self._acquired_eths: list[currency.AcquiredETH]
+    def __post_init__(self) -> None:
+        self._acquired_eths: inventory.LotIndex
+        self._tax_mode: typing.Optional[type[tax_optimizer.OptimizationMethod]]
         self._spent_eths: list[currency.SpentETH]
+        # Last spend and number of 'AcquiredETH' added since; see
+        # 'list_acquired_eths_for_new_tax_mode'
+        self._last_spend: typing.Optional[exchange_transactions.Spend]
+        self._acquired_since_last_spend: int
 
     def sort_transactions_in_chronologial_order(self):
         """Sort transactions from oldest to newest"""
+        if self.in_chronological_order:
+            return
         self.transactions.sort(key=lambda transaction: transaction.time)
 
-    def sort_acquired_eths(
+    def index_acquired_eths(
         self,
         transaction: exchange_transactions.Spend,
     ):
-        """Sort 'self._acquired_eths' from least to most tax optimal
+        """Index 'self._acquired_eths' for tax mode of transaction year
 
-        Most tax optimal is the last item
-        Least tax optimal is the first item
+        Index is only rebuilt if tax mode changed since last transaction
         """
         tax_mode = self.tax_modes_by_year[transaction.time.year]
-        self._acquired_eths = tax_mode.sort(self._acquired_eths, transaction)
-
-    def remove_wei(self, transaction: exchange_transactions.Spend):
-        """Remove ETH from end of list of 'self._acquired_eths'"""
-        amount_wei = transaction.amount_wei
-        while amount_wei > 0:
-            if self._acquired_eths[-1].amount_wei > amount_wei:
-                acquired_eth_to_convert = self._acquired_eths[-1].remove_wei(amount_wei)
+        if tax_mode is not self._tax_mode:
+            self._set_tax_mode(tax_mode)
+
+    def list_acquired_eths_for_new_tax_mode(self) -> list[currency.AcquiredETH]:
+        """'AcquiredETH' from least to most tax optimal for last spend
+
+        'AcquiredETH' added since the last spend are last, in order
+        added. Same order as the list that was sorted for every spend
+        before indexes were added; indexes iterate over ties in their
+        order for the last spend (see 'inventory.LotIndex'), and an
+        index created from this order spends 'AcquiredETH' with equal
+        sort keys in the same order as that list
+        """
+        acquired_eths = list(self._acquired_eths)
+        if self._tax_mode is None or self._last_spend is None:
+            return acquired_eths
+        held = len(acquired_eths) - self._acquired_since_last_spend
+        return (
+            self._tax_mode.sort(acquired_eths[:held], self._last_spend)
+            + acquired_eths[held:]
+        )
+
+    def _set_tax_mode(self, tax_mode: type[tax_optimizer.OptimizationMethod]):
+        with instrumentation.stage("create_index"):
+            acquired_eths = self.list_acquired_eths_for_new_tax_mode()
+            if self.persistent:
+                self._acquired_eths = tax_mode.create_persistent_index(acquired_eths)
+            elif self.columnar:
+                self._acquired_eths = tax_mode.create_columnar_index(acquired_eths)
+            else:
+                self._acquired_eths = tax_mode.create_index(acquired_eths)
+        self._tax_mode = tax_mode
+
+    def remove_wei(
+        self, transaction: exchange_transactions.Spend
+    ) -> typing.Iterator[currency.SpentETH]:
+        """Remove ETH from 'self._acquired_eths', most tax optimal first
+
+        Yields 'SpentETH' for ETH removed
+        """
+        for acquired_eth_to_convert in self._acquired_eths.remove_wei(transaction):
+            if self.exact_arithmetic:
+                yield acquired_eth_to_convert.convert_to_spent_eth_exact(
+                    transaction.time,
+                    transaction.proceeds_usd_per_wei_excluding_fees,
+                )
             else:
-                acquired_eth_to_convert = self._acquired_eths.pop()
-            self._spent_eths.append(
-                acquired_eth_to_convert.convert_to_spent_eth(
+                yield acquired_eth_to_convert.convert_to_spent_eth(
                     transaction.time,
                     transaction.proceeds_us_cents_per_eth_excluding_fees,
                 )
-            )
-            amount_wei -= acquired_eth_to_convert.amount_wei
+
+    def start(self) -> None:
+        """Start with no 'AcquiredETH'"""
+        # Any index can hold 'AcquiredETH' until the first spend
+        self._acquired_eths = inventory.SelectionLotIndex(
+            tax_optimizer.FirstInFirstOut.select, []
+        )
+        self._tax_mode = None
+        self._last_spend = None
+        self._acquired_since_last_spend = 0
+        self._set_tax_mode(tax_optimizer.FirstInFirstOut)
+
+    def process_transaction(
+        self, transaction: exchange_transactions.CurrencyExchange
+    ) -> typing.Optional[list[currency.SpentETH]]:
+        """Unvalidated 'SpentETH' of spend; 'None' for other transactions
+
+        Transactions must be processed in chronological order, after
+        'start'
+        """
+        if isinstance(transaction, exchange_transactions.Acquire):
+            self._acquired_eths.add(transaction.convert_to_acquired_eth())
+            self._acquired_since_last_spend += 1
+            return None
+        if isinstance(transaction, exchange_transactions.Spend):
+            self.index_acquired_eths(transaction)
+            self._last_spend = transaction
+            self._acquired_since_last_spend = 0
+            if instrumentation.ENABLED:
+                with instrumentation.stage("remove_wei"):
+                    batch = list(self.remove_wei(transaction))
+                instrumentation.count("spends")
+                instrumentation.count("spent_eths", len(batch))
+                return batch
+            return list(self.remove_wei(transaction))
+        raise ValueError()
+
+    def fork(
+        self, tax_modes_by_year: dict[int, type[tax_optimizer.OptimizationMethod]]
+    ) -> "_TransactionProcessor":
+        """Processor that continues from here with other tax modes
+
+        O(1): 'AcquiredETH' are shared until either processor changes
+        them (see 'persistent_inventory.PersistentLotIndex'). Requires 'persistent'
+        """
+        assert isinstance(self._acquired_eths, persistent_inventory.PersistentLotIndex)
+        processor = copy.copy(self)
+        processor.tax_modes_by_year = tax_modes_by_year
+        processor._acquired_eths = self._acquired_eths.fork()
+        return processor
+
+    def iterate_spent_eth_batches(
+        self,
+    ) -> typing.Iterator[list[currency.SpentETH]]:
+        """Yield unvalidated 'SpentETH' for each spend, as it is processed"""
+        self.sort_transactions_in_chronologial_order()
+        self.start()
+        for transaction in self.transactions:
+            batch = self.process_transaction(transaction)
+            if batch is not None:
+                yield batch
 
     @property
     def spent_eths(self) -> list[currency.SpentETH]:
         """Convert transactions to list of 'SpentETH'"""
-        self.sort_transactions_in_chronologial_order()
-        self._acquired_eths = []
         self._spent_eths = []
-        for transaction in self.transactions:
-            if isinstance(transaction, exchange_transactions.Acquire):
-                self._acquired_eths.append(transaction.convert_to_acquired_eth())
-            elif isinstance(transaction, exchange_transactions.Spend):
-                self.sort_acquired_eths(transaction)
-                self.remove_wei(transaction)
-            else:
-                raise ValueError()
+        for batch in self.iterate_spent_eth_batches():
+            self._spent_eths += batch
+        currency.validate_spent_eths(self._spent_eths)
         return self._spent_eths
 
 
 def convert_transactions_to_spent_eth(
     transactions: list[exchange_transactions.CurrencyExchange],
-    tax_modes_by_year: dict[int, tax_optimizer.OptimizationMethod],
+    tax_modes_by_year: dict[int, type[tax_optimizer.OptimizationMethod]],
+    exact_arithmetic: bool = False,
+    columnar: bool = False,
 ) -> list[currency.SpentETH]:
     """Convert transactions to list of 'SpentETH'"""
-    return _TransactionProcessor(transactions, tax_modes_by_year).spent_eths
+    return _TransactionProcessor(
+        transactions, tax_modes_by_year, exact_arithmetic, columnar
+    ).spent_eths
+
+
+def convert_transaction_streams_to_spent_eth(
+    streams: typing.Iterable[typing.Iterable[exchange_transactions.CurrencyExchange]],
+    tax_modes_by_year: dict[int, type[tax_optimizer.OptimizationMethod]],
+    exact_arithmetic: bool = False,
+    columnar: bool = False,
+) -> list[currency.SpentETH]:
+    """Convert streams of transactions to list of 'SpentETH'
+
+    Each stream must be in chronological order (e.g. from
+    'file_reader.read_files_by_source'). Streams are merged instead of
+    sorted; same as 'convert_transactions_to_spent_eth' for concatenated
+    streams
+    """
+    return _TransactionProcessor(
+        exchange_transactions.merge_in_chronological_order(streams),
+        tax_modes_by_year,
+        exact_arithmetic,
+        columnar,
+        in_chronological_order=True,
+    ).spent_eths
+
+
+def iterate_spent_eths(
+    transactions: typing.Iterable[exchange_transactions.CurrencyExchange],
+    tax_modes_by_year: dict[int, type[tax_optimizer.OptimizationMethod]],
+    exact_arithmetic: bool = False,
+    columnar: bool = False,
+    in_chronological_order: bool = False,
+) -> typing.Iterator[currency.SpentETH]:
+    """Yield 'SpentETH' as each spend is processed
+
+    Same 'SpentETH' as 'convert_transactions_to_spent_eth'; each batch
+    (the 'SpentETH' of one spend) is validated before it is yielded. If
+    'in_chronological_order', 'transactions' can be any iterable (e.g.
+    from 'exchange_transactions.merge_in_chronological_order') and are
+    consumed lazily
+    """
+    for batch in _TransactionProcessor(
+        transactions,
+        tax_modes_by_year,
+        exact_arithmetic,
+        columnar,
+        in_chronological_order,
+    ).iterate_spent_eth_batches():
+        currency.validate_spent_eths(batch)
+        yield from batch
+
+
+def _iterate_forked_batches(
+    processor: _TransactionProcessor,
+    transactions: typing.Sequence[exchange_transactions.CurrencyExchange],
+    start: int,
+    scenarios: list[int],
+    tax_modes_by_year_by_scenario: typing.Sequence[
+        dict[int, type[tax_optimizer.OptimizationMethod]]
+    ],
+    year: typing.Optional[int],
+) -> typing.Iterator[tuple[list[int], list[currency.SpentETH]]]:
+    for position in range(start, len(transactions)):
+        transaction = transactions[position]
+        if (
+            isinstance(transaction, exchange_transactions.Spend)
+            and transaction.time.year != year
+        ):
+            year = transaction.time.year
+            groups: dict[type[tax_optimizer.OptimizationMethod], list[int]] = {}
+            for scenario in scenarios:
+                groups.setdefault(
+                    tax_modes_by_year_by_scenario[scenario][year], []
+                ).append(scenario)
+            if len(groups) > 1:
+                for group in groups.values():
+                    yield from _iterate_forked_batches(
+                        processor.fork(tax_modes_by_year_by_scenario[group[0]]),
+                        transactions,
+                        position,
+                        group,
+                        tax_modes_by_year_by_scenario,
+                        year,
+                    )
+                return
+        batch = processor.process_transaction(transaction)
+        if batch is not None:
+            currency.validate_spent_eths(batch)
+            yield scenarios, batch
+
+
+def iterate_spent_eth_batches_by_scenario(
+    transactions: typing.Sequence[exchange_transactions.CurrencyExchange],
+    tax_modes_by_year_by_scenario: typing.Sequence[
+        dict[int, type[tax_optimizer.OptimizationMethod]]
+    ],
+    exact_arithmetic: bool = False,
+) -> typing.Iterator[tuple[list[int], list[currency.SpentETH]]]:
+    """Yield each batch of 'SpentETH' with the scenarios it belongs to
+
+    Scenarios are positions in 'tax_modes_by_year_by_scenario'; each
+    gets the same batches as 'iterate_spent_eths' with its tax modes.
+    'transactions' must be in chronological order. Scenarios share
+    transactions processed until their tax modes differ: at the first
+    spend of a year, the processor is forked (O(1); see
+    '_TransactionProcessor.fork') for each tax mode of that year.
+    Batches of the same scenarios are yielded with the same list
+    """
+    if not tax_modes_by_year_by_scenario:
+        return
+    processor = _TransactionProcessor(
+        [],
+        tax_modes_by_year_by_scenario[0],
+        exact_arithmetic,
+        in_chronological_order=True,
+        persistent=True,
+    )
+    processor.start()
+    yield from _iterate_forked_batches(
+        processor,
+        transactions,
+        0,
+        list(range(len(tax_modes_by_year_by_scenario))),
+        tax_modes_by_year_by_scenario,
+        None,
+    )
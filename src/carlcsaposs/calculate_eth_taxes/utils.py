@@ -16,13 +16,28 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import csv
 import datetime
 import decimal
 import enum
+import functools
+import io
+import os
+import typing
+
+# Validate instances created by this program when they are created
+# instead of once for each processing stage; useful for debugging
+EAGER_VALIDATION = os.environ.get("CALCULATE_ETH_TAXES_EAGER_VALIDATION", "") not in (
+    "",
+    "0",
+)
 
 
 class NumberDomain(enum.Enum):
-    """Valid domain for an integer"""
+    """Valid domain for an integer
+
+    Each domain is a lower bound
+    """
 
     POSITIVE = (lambda x: x > 0, "greater than zero")
     NON_NEGATIVE = (lambda x: x >= 0, "greater than or equal to zero")
@@ -32,27 +47,53 @@ class NumberDomain(enum.Enum):
         if not self.value[0](number):
             raise ValueError(f"expected '{key}' {self.value[1]}, got {number} instead")
 
+    def includes_numbers(self, numbers: typing.Iterable[int]) -> bool:
+        """Whether all numbers are within domain
 
-def is_long_term(
-    time_acquired: datetime.datetime, time_spent: datetime.datetime
-) -> bool:
-    """Long term is one calendar year or more*
+        Since each domain is a lower bound, only the minimum is checked
+        """
+        numbers = list(numbers)
+        return not numbers or self.value[0](min(numbers))
 
-    *Does not include date of acquistion
+
+def calculate_long_term_ordinal(time_acquired: datetime.date) -> int:
+    """First day (proleptic Gregorian ordinal) spending is long term
+
+    Also accepts datetime; time of day is ignored
     """
     # Including date of acquistion, long term is more than one calendar
     # year.
-    acquired: datetime.date = time_acquired.date()
-    spent: datetime.date = time_spent.date()
     try:
-        acquired = acquired.replace(year=acquired.year + 1)
+        anniversary = datetime.date(
+            time_acquired.year + 1, time_acquired.month, time_acquired.day
+        )
     except ValueError:
-        if acquired.day == 29 and acquired.month == 2:
+        if time_acquired.day == 29 and time_acquired.month == 2:
             # Leap day
-            acquired = acquired.replace(year=acquired.year + 1, day=28)
+            anniversary = datetime.date(time_acquired.year + 1, 2, 28)
         else:
             raise
-    return acquired < spent
+    return anniversary.toordinal() + 1
+
+
+def is_long_term(
+    time_acquired: datetime.datetime, time_spent: datetime.datetime
+) -> bool:
+    """Long term is one calendar year or more*
+
+    *Does not include date of acquistion
+    """
+    return time_spent.toordinal() >= calculate_long_term_ordinal(time_acquired)
+
+
+def convert_datetime_to_microseconds(time: datetime.datetime) -> int:
+    """Convert datetime to microseconds since 'datetime.datetime.min'"""
+    return (time - datetime.datetime.min) // datetime.timedelta(microseconds=1)
+
+
+def convert_microseconds_to_datetime(microseconds: int) -> datetime.datetime:
+    """Convert microseconds since 'datetime.datetime.min' to datetime"""
+    return datetime.datetime.min + datetime.timedelta(microseconds=microseconds)
 
 
 def round_decimal(number: decimal.Decimal, places: int) -> decimal.Decimal:
@@ -68,3 +109,117 @@ def round_decimal(number: decimal.Decimal, places: int) -> decimal.Decimal:
 def round_decimal_to_int(number: decimal.Decimal) -> int:
     """Round decimal to zero places, rounding half up"""
     return int(round_decimal(number, 0))
+
+
+def convert_wei_to_eth_string(amount_wei: int) -> str:
+    """Format wei as ETH with 18 decimal places
+
+    Same as 'str(round_decimal(amount_wei / decimal.Decimal(10**18), 18))'
+    """
+    # Outside of this range, 'str(decimal.Decimal)' uses scientific
+    # notation or the division is rounded by the decimal context
+    if 10**12 <= amount_wei < 10**28:
+        eth, wei = divmod(amount_wei, 10**18)
+        return f"{eth}.{wei:018d}"
+    return str(round_decimal(amount_wei / decimal.Decimal(10**18), 18))
+
+
+def convert_eth_string_to_wei(amount_eth: str) -> int:
+    """Convert ETH amount string to wei, rounding half up
+
+    Same as 'round_decimal_to_int(decimal.Decimal(amount_eth) * 10**18)'
+    """
+    digits = amount_eth
+    sign = 1
+    if digits[:1] == "-":
+        sign = -1
+        digits = digits[1:]
+    elif digits[:1] == "+":
+        digits = digits[1:]
+    integer, _, fraction = digits.partition(".")
+    all_digits = integer + fraction
+    # Fall back to decimal for other formats (e.g. exponents) and for
+    # more significant digits than the decimal context precision, where
+    # 'decimal.Decimal' multiplication is rounded
+    if (
+        not all_digits.isascii()
+        or not all_digits.isdecimal()
+        or len(all_digits.strip("0")) > 28
+    ):
+        return round_decimal_to_int(decimal.Decimal(amount_eth) * 10**18)
+    if len(fraction) <= 18:
+        return sign * int(all_digits + "0" * (18 - len(fraction)))
+    amount_wei = int(integer + fraction[:18])
+    # Round half up (away from zero)
+    if fraction[18] >= "5":
+        amount_wei += 1
+    return sign * amount_wei
+
+
+@functools.lru_cache(maxsize=2**16)
+def convert_usd_per_eth_string_to_us_cents_per_eth(
+    usd_per_eth: str,
+) -> decimal.Decimal:
+    """Convert USD per ETH price string to US cents per ETH
+
+    Cached; each distinct price (e.g. a daily price repeated for each
+    transaction that day) is only parsed once
+    """
+    return decimal.Decimal(usd_per_eth) * 100
+
+
+def round_fraction_to_int(numerator: int, denominator: int) -> int:
+    """Round fraction to zero places, rounding half up
+
+    Exact integer equivalent of 'round_decimal_to_int'
+    """
+    if denominator <= 0:
+        raise ValueError
+    if numerator < 0:
+        return -round_fraction_to_int(-numerator, denominator)
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def convert_us_cents_per_eth_to_usd_per_wei(
+    us_cents_per_eth: decimal.Decimal,
+) -> tuple[int, int]:
+    """Convert price to exact USD per wei as (numerator, denominator)"""
+    numerator, denominator = us_cents_per_eth.as_integer_ratio()
+    # 100 is cents to dollars, 10**18 is Wei to ETH
+    return numerator, denominator * 100 * 10**18
+
+
+def split_csv_file(
+    file_path: str,
+    chunk_bytes: int,
+    can_split_after: typing.Optional[typing.Callable[[dict[str, str]], bool]] = None,
+) -> tuple[list[str], list[int]]:
+    """Header and byte offset of each chunk of CSV rows
+
+    Offsets are at the start of a line, from the first row to the end of
+    the file; only lines around each offset are read. If
+    'can_split_after', chunks only end after rows it returns True for.
+    Fields must not contain newlines
+    """
+    with open(file_path, "rb") as file:
+        header = next(csv.reader([file.readline().decode("utf-8")]), [])
+        offsets = [file.tell()]
+        size = os.fstat(file.fileno()).st_size
+        while offsets[-1] < size:
+            file.seek(offsets[-1] + chunk_bytes - 1)
+            # Rest of line at minimum chunk size
+            file.readline()
+            if can_split_after is not None:
+                for line in iter(file.readline, b""):
+                    row = next(csv.reader([line.decode("utf-8")]))
+                    if can_split_after(dict(zip(header, row))):
+                        break
+            offsets.append(min(file.tell(), size))
+    return (header, offsets)
+
+
+def read_csv_chunk(file_path: str, start: int, stop: int) -> io.StringIO:
+    """Lines of file from byte offset 'start' to 'stop'"""
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        return io.StringIO(file.read(stop - start).decode("utf-8"))
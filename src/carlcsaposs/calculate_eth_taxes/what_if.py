@@ -0,0 +1,245 @@
+"""
+what_if: Compare realized gains of tax modes for each year
+
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import concurrent.futures
+import csv
+import dataclasses
+import itertools
+import os
+import typing
+
+from . import currency
+from . import exchange_transactions
+from . import file_writer
+from . import tax_optimizer
+from . import transaction_processor
+
+# Raise instead of evaluating more scenarios than this
+MAX_SCENARIOS = 10000
+# Ranking of scenarios; lowest key is first
+RANK_KEYS: dict[str, typing.Callable[["ScenarioResult"], tuple]] = {
+    # Short-term gains are taxed at a higher rate than long-term gains
+    "short-term": lambda result: (result.short_term_gain_usd, result.gain_usd),
+    "total": lambda result: (result.gain_usd, result.short_term_gain_usd),
+}
+
+
+@dataclasses.dataclass
+class ScenarioResult:
+    """Realized gains of one combination of tax modes"""
+
+    # Names of 'tax_optimizer.OptimizationMethod' subclasses
+    tax_modes_by_year: dict[int, str]
+    totals: dict[tuple[int, bool], file_writer.SummaryTotals]
+
+    def get_gain_usd(self, tax_year: int, is_long_term: bool) -> int:
+        """Capital gain for tax year and term (0 if nothing was spent)"""
+        totals = self.totals.get((tax_year, is_long_term))
+        return 0 if totals is None else totals.gain_usd
+
+    @property
+    def short_term_gain_usd(self) -> int:
+        """Short-term capital gain of all years"""
+        return sum(
+            totals.gain_usd
+            for (_, is_long_term), totals in self.totals.items()
+            if not is_long_term
+        )
+
+    @property
+    def gain_usd(self) -> int:
+        """Capital gain of all years"""
+        return sum(totals.gain_usd for totals in self.totals.values())
+
+
+def get_spend_years(
+    transactions: typing.Iterable[exchange_transactions.CurrencyExchange],
+) -> list[int]:
+    """Years in which ETH was spent (years that need a tax mode)"""
+    return sorted(
+        {
+            transaction.time.year
+            for transaction in transactions
+            if isinstance(transaction, exchange_transactions.Spend)
+        }
+    )
+
+
+def enumerate_scenarios(
+    base_tax_modes_by_year: dict[int, str],
+    years: typing.Iterable[int],
+    tax_modes: typing.Sequence[str],
+) -> list[dict[int, str]]:
+    """Every combination of 'tax_modes' for 'years'
+
+    Other years keep their mode in 'base_tax_modes_by_year'
+    """
+    years = sorted(years)
+    scenario_count = len(tax_modes) ** len(years)
+    if scenario_count > MAX_SCENARIOS:
+        raise ValueError(
+            f"expected at most {MAX_SCENARIOS} scenarios, got {scenario_count} "
+            f"({len(tax_modes)} tax modes for {len(years)} years) instead"
+        )
+    return [
+        {**base_tax_modes_by_year, **dict(zip(years, combination))}
+        for combination in itertools.product(tax_modes, repeat=len(years))
+    ]
+
+
+# Transactions shared by scenarios evaluated in this process; set once
+# per worker process instead of sent with each scenario
+_transactions: list[exchange_transactions.CurrencyExchange] = []
+_exact_arithmetic = False  # pylint: disable=invalid-name
+
+
+def _initialize(
+    transactions: list[exchange_transactions.CurrencyExchange],
+    exact_arithmetic: bool,
+) -> None:
+    global _transactions, _exact_arithmetic  # pylint: disable=global-statement
+    _transactions = transactions
+    _exact_arithmetic = exact_arithmetic
+
+
+def _evaluate(scenarios: list[dict[int, str]]) -> list[ScenarioResult]:
+    # Totals of each branch of the scenario tree; batches of a branch are
+    # yielded with the same list of scenarios
+    branches: dict[int, tuple[list[int], file_writer.Summary]] = {}
+    batches = transaction_processor.iterate_spent_eth_batches_by_scenario(
+        _transactions,
+        [
+            {
+                year: getattr(tax_optimizer, tax_mode)
+                for year, tax_mode in tax_modes_by_year.items()
+            }
+            for tax_modes_by_year in scenarios
+        ],
+        _exact_arithmetic,
+    )
+    for positions, batch in batches:
+        branch = branches.get(id(positions))
+        if branch is None:
+            branch = branches[id(positions)] = (positions, file_writer.Summary())
+        branch[1].add_rows(currency.convert_spent_eths_to_form_8949_rows(batch))
+    summaries = [file_writer.Summary() for _ in scenarios]
+    for positions, summary in branches.values():
+        for position in positions:
+            summaries[position].update(summary)
+    return [
+        ScenarioResult(tax_modes_by_year, summary.totals)
+        for tax_modes_by_year, summary in zip(scenarios, summaries)
+    ]
+
+
+def evaluate_scenarios(
+    transactions: list[exchange_transactions.CurrencyExchange],
+    scenarios: typing.Iterable[dict[int, str]],
+    exact_arithmetic: bool = False,
+    max_workers: typing.Optional[int] = None,
+) -> list[ScenarioResult]:
+    """Realized gains of each scenario (tax mode names by year)
+
+    'transactions' are read once and shared: sent to each worker process
+    once, not with each scenario. Scenarios are evaluated as a tree:
+    transactions are processed once for scenarios with the same tax
+    modes until then (see
+    'transaction_processor.iterate_spent_eth_batches_by_scenario'). If
+    'max_workers', consecutive scenarios are split between that many
+    processes (0 for number of CPUs); result is the same
+    """
+    transactions = sorted(transactions, key=lambda transaction: transaction.time)
+    scenarios = list(scenarios)
+    if max_workers is None:
+        _initialize(transactions, exact_arithmetic)
+        try:
+            return _evaluate(scenarios)
+        finally:
+            _initialize([], False)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(scenarios) or 1)
+    # Consecutive scenarios (see 'enumerate_scenarios') share the most
+    bounds = [len(scenarios) * index // max_workers for index in range(max_workers)]
+    chunks = [
+        scenarios[start:stop]
+        for start, stop in zip(bounds, bounds[1:] + [len(scenarios)])
+    ]
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers,
+        initializer=_initialize,
+        initargs=(transactions, exact_arithmetic),
+    ) as executor:
+        return [
+            result for results in executor.map(_evaluate, chunks) for result in results
+        ]
+
+
+def rank_results(
+    results: typing.Iterable[ScenarioResult], rank_by: str = "short-term"
+) -> list[ScenarioResult]:
+    """Sort results by key in 'RANK_KEYS', lowest gain first
+
+    Ties keep order of scenarios
+    """
+    return sorted(results, key=RANK_KEYS[rank_by])
+
+
+def format_table(results: list[ScenarioResult], years: list[int]) -> str:
+    """Table of tax modes and gains (USD) for each year, in order of results"""
+    lines = [
+        f"{'rank':>4}  "
+        + "".join(f"{year:<40}" for year in years)
+        + f"{'short-term':>12}{'total':>12}",
+        "      " + f"{'tax mode':<18}{'short-term':>11}{'long-term':>11}" * len(years),
+    ]
+    for rank, result in enumerate(results, 1):
+        lines.append(
+            f"{rank:>4}  "
+            + "".join(
+                f"{result.tax_modes_by_year[year]:<18}"
+                f"{result.get_gain_usd(year, False):>11}"
+                f"{result.get_gain_usd(year, True):>11}"
+                for year in years
+            )
+            + f"{result.short_term_gain_usd:>12}{result.gain_usd:>12}"
+        )
+    return "\n".join(lines)
+
+
+def write_results_to_file(
+    results: list[ScenarioResult], years: list[int], file_path: os.PathLike
+) -> None:
+    """Save ranked results as CSV"""
+    with open(file_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        header = ["rank"]
+        for year in years:
+            header += [
+                f"{year} tax mode",
+                f"{year} short-term gain usd",
+                f"{year} long-term gain usd",
+            ]
+        writer.writerow(header + ["short-term gain usd", "gain usd"])
+        for rank, result in enumerate(results, 1):
+            row: list[typing.Any] = [rank]
+            for year in years:
+                row += [
+                    result.tax_modes_by_year[year],
+                    result.get_gain_usd(year, False),
+                    result.get_gain_usd(year, True),
+                ]
+            writer.writerow(row + [result.short_term_gain_usd, result.gain_usd])
@@ -0,0 +1,57 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import itertools
+
+import pytest
+
+from carlcsaposs.calculate_eth_taxes import assignment
+
+
+@pytest.mark.parametrize(
+    "costs",
+    [
+        [[4]],
+        [[4, 1, 3], [2, 0, 5], [3, 2, 2]],
+        [[7, 3, 9, 1], [2, 8, 4, 6]],
+        [[1, 1, 1], [1, 1, 1], [1, 1, 1]],
+        [[90, 75, 75, 80], [35, 85, 55, 65], [125, 95, 90, 105], [45, 110, 95, 115]],
+    ],
+)
+def test_calculate_minimum_cost_assignment(costs: list[list[int]]):
+    columns = assignment.calculate_minimum_cost_assignment(costs)
+    assert len(set(columns)) == len(costs)
+    assert sum(row[column] for row, column in zip(costs, columns)) == min(
+        sum(row[column] for row, column in zip(costs, permutation))
+        for permutation in itertools.permutations(range(len(costs[0])), len(costs))
+    )
+
+
+@pytest.mark.parametrize(
+    ["match_indexes", "time_differences", "expected"],
+    [
+        ([[], [0]], [[], [5]], [None, 0]),
+        # Fewer matches with smaller time difference not preferred
+        ([[0, 1], [0]], [[1, 9], [5]], [1, 0]),
+        ([[0], [0]], [[3], [1]], [None, 0]),
+        ([[0], [1]], [[3], [1]], [0, 1]),
+    ],
+)
+def test_assign_optimally(
+    match_indexes: list[list[int]], time_differences: list[list[int]], expected
+):
+    assert assignment.assign_optimally(match_indexes, time_differences) == expected
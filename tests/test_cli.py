@@ -0,0 +1,183 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import csv
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.cli as cli
+import carlcsaposs.calculate_eth_taxes.file_reader as file_reader
+
+from . import test_file_reader
+
+
+def write_config(directory: pathlib.Path, **options) -> pathlib.Path:
+    etherscan_csvs = test_file_reader.write_input_files(directory, 3)
+    lines = [
+        f"input_directory = {json.dumps(str(directory))}",
+        f"etherscan_transaction_csvs = {json.dumps(etherscan_csvs)}",
+        'coinbase_csv = "coinbase.csv"',
+        'coinbase_pro_account_csv = "coinbase-pro.csv"',
+    ]
+    lines += [f"{key} = {json.dumps(value)}" for key, value in options.items()]
+    lines += ["[tax_modes_by_year]", '2021 = "LowerTaxBracket"']
+    file_path = directory / "config.toml"
+    file_path.write_text("\n".join(lines), encoding="utf-8")
+    return file_path
+
+
+def test_help_does_not_import_engine():
+    code = (
+        "import sys\n"
+        "import carlcsaposs.calculate_eth_taxes.cli as cli\n"
+        "try:\n"
+        "    cli.main(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(name for name in sys.modules if 'calculate_eth_taxes' in name))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        encoding="utf-8",
+        env={"PYTHONPATH": str(pathlib.Path(cli.__file__).parents[2])},
+    )
+    assert "check-config" in result.stdout
+    assert result.stdout.splitlines()[-1] == str(
+        [
+            "carlcsaposs.calculate_eth_taxes",
+            "carlcsaposs.calculate_eth_taxes.cli",
+            "carlcsaposs.calculate_eth_taxes.config",
+        ]
+    )
+
+
+def test_check_config(capsys: pytest.CaptureFixture, tmp_path: pathlib.Path):
+    assert cli.main(["check-config", str(write_config(tmp_path))]) == 0
+    assert capsys.readouterr().out == "2021: LowerTaxBracket\n"
+
+
+def test_invalid_config(capsys: pytest.CaptureFixture, tmp_path: pathlib.Path):
+    file_path = write_config(tmp_path, streaming="yes")
+    with pytest.raises(SystemExit) as exception_info:
+        cli.main(["check-config", str(file_path)])
+    assert exception_info.value.code == 2
+    assert (
+        "expected 'streaming' of type boolean, got 'yes' instead"
+        in capsys.readouterr().err
+    )
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("event_log", [False, True])
+def test_run(
+    capsys: pytest.CaptureFixture,
+    tmp_path: pathlib.Path,
+    streaming: bool,
+    event_log: bool,
+):
+    input_directory = file_reader.INPUT_DIRECTORY
+    options = {}
+    if event_log:
+        options["event_log_directory"] = str(tmp_path / "log")
+    file_path = write_config(
+        tmp_path,
+        output_csv=str(tmp_path / "output.csv"),
+        summary_csv=str(tmp_path / "summary.csv"),
+        streaming=streaming,
+        **options,
+    )
+    assert cli.main(["run", str(file_path)]) == 0
+    assert file_reader.INPUT_DIRECTORY == input_directory
+    if event_log:
+        assert len(list((tmp_path / "log").iterdir())) == 1
+        output = (tmp_path / "output.csv").read_text(encoding="utf-8")
+        # Replayed from event log
+        assert cli.main(["run", str(file_path)]) == 0
+        assert (tmp_path / "output.csv").read_text(encoding="utf-8") == output
+    assert capsys.readouterr().out.startswith("2021 short-term: ")
+    assert (
+        (tmp_path / "output.csv")
+        .read_text(encoding="utf-8")
+        .startswith("tax_year,is_long_term,")
+    )
+    assert (
+        (tmp_path / "summary.csv")
+        .read_text(encoding="utf-8")
+        .startswith("tax_year,term,row_count,")
+    )
+
+
+def test_run_profile(capsys: pytest.CaptureFixture, tmp_path: pathlib.Path):
+    file_path = write_config(tmp_path, output_csv=str(tmp_path / "output.csv"))
+    assert (
+        cli.main(
+            [
+                "run",
+                str(file_path),
+                "--profile",
+                "--profile-json",
+                str(tmp_path / "profile.json"),
+            ]
+        )
+        == 0
+    )
+    assert capsys.readouterr().err.startswith("stage ")
+    with open(tmp_path / "profile.json", encoding="utf-8") as file:
+        profile = json.load(file)
+    assert list(profile["stages"])[:2] == ["read_files", "process"]
+    assert profile["counters"]["correlation_candidates"] > 0
+    assert profile["counters"]["spent_eths"] > 0
+
+
+def test_what_if(capsys: pytest.CaptureFixture, tmp_path: pathlib.Path):
+    file_path = write_config(tmp_path)
+    assert (
+        cli.main(
+            [
+                "what-if",
+                str(file_path),
+                "--tax-modes",
+                "FirstInFirstOut",
+                "HigherTaxBracket",
+                "--max-workers",
+                "2",
+                "--output-csv",
+                str(tmp_path / "what-if.csv"),
+            ]
+        )
+        == 0
+    )
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ["rank", "2021", "short-term", "total"]
+    assert sorted(line.split()[1] for line in lines[2:]) == [
+        "FirstInFirstOut",
+        "HigherTaxBracket",
+    ]
+    with open(tmp_path / "what-if.csv", encoding="utf-8", newline="") as file:
+        assert len(list(csv.reader(file))) == 3
+    file_path.write_text(
+        file_path.read_text(encoding="utf-8").replace("2021 =", "2020 ="),
+        encoding="utf-8",
+    )
+    assert cli.main(["what-if", str(file_path), "--years", "2022"]) == 2
+    assert "error: no tax mode for 2021" in capsys.readouterr().err
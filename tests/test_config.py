@@ -0,0 +1,112 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import pathlib
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.config as config
+import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
+
+CONFIG_TOML = """
+etherscan_transaction_csvs = ["export-0x061f7937b7b2bc7596539959804f86538b6368dc.csv"]
+coinbase_csv = "coinbase.csv"
+coinbase_pro_account_csv = "coinbase-pro.csv"
+streaming = true
+max_workers = 0
+
+[tax_modes_by_year]
+2020 = "FirstInFirstOut"
+2021 = "HigherTaxBracket"
+"""
+
+
+def test_tax_mode_names():
+    for tax_mode in config.TAX_MODE_NAMES:
+        assert issubclass(
+            getattr(tax_optimizer, tax_mode), tax_optimizer.OptimizationMethod
+        )
+
+
+def test_read_config(tmp_path: pathlib.Path):
+    file_path = tmp_path / "config.toml"
+    file_path.write_text(CONFIG_TOML, encoding="utf-8")
+    assert config.read_config(file_path) == config.Config(
+        ["export-0x061f7937b7b2bc7596539959804f86538b6368dc.csv"],
+        "coinbase.csv",
+        "coinbase-pro.csv",
+        {2020: "FirstInFirstOut", 2021: "HigherTaxBracket"},
+        streaming=True,
+        max_workers=0,
+    )
+
+
+def create_config_dict(**overrides) -> dict:
+    return {
+        "etherscan_transaction_csvs": [],
+        "coinbase_csv": "coinbase.csv",
+        "coinbase_pro_account_csv": "coinbase-pro.csv",
+        "tax_modes_by_year": {"2021": "LowerTaxBracket"},
+        **overrides,
+    }
+
+
+@pytest.mark.parametrize(
+    ["overrides", "message"],
+    [
+        ({"streaming": 1}, "expected 'streaming' of type boolean, got 1 instead"),
+        ({"max_workers": True}, "expected 'max_workers' of type integer, got True "),
+        (
+            {"max_workers": -1},
+            "expected 'max_workers' greater than or equal to zero, got -1 instead",
+        ),
+        (
+            {"etherscan_transaction_csvs": "a.csv"},
+            "expected 'etherscan_transaction_csvs' of type array of strings",
+        ),
+        ({"output": "a.csv"}, "unknown configuration keys: output"),
+        (
+            {"tax_modes_by_year": {"x": "FirstInFirstOut"}},
+            "expected years as keys of 'tax_modes_by_year', got ['x'] instead",
+        ),
+        (
+            {"tax_modes_by_year": {"2022": "FIFO"}},
+            "expected tax mode for 2022 in ",
+        ),
+    ],
+)
+def test_invalid_config(overrides: dict, message: str):
+    with pytest.raises(ValueError) as exception_info:
+        config.convert_dict_to_config(create_config_dict(**overrides))
+    assert str(exception_info.value).startswith(message)
+
+
+def test_read_invalid_toml(tmp_path: pathlib.Path):
+    file_path = tmp_path / "config.toml"
+    file_path.write_text("streaming = \n", encoding="utf-8")
+    with pytest.raises(ValueError) as exception_info:
+        config.read_config(file_path)
+    assert str(exception_info.value).startswith(f"invalid TOML in {file_path}: ")
+
+
+def test_missing_keys():
+    with pytest.raises(ValueError) as exception_info:
+        config.convert_dict_to_config({"coinbase_csv": "coinbase.csv"})
+    assert str(exception_info.value) == (
+        "missing configuration keys: coinbase_pro_account_csv, "
+        "etherscan_transaction_csvs, tax_modes_by_year"
+    )
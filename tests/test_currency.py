@@ -17,11 +17,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # pylint: disable=missing-docstring
 import datetime
 import decimal
+import random
 
 import pytest
 
 import carlcsaposs.calculate_eth_taxes.currency as currency
 import carlcsaposs.calculate_eth_taxes.file_writer as file_writer
+import carlcsaposs.calculate_eth_taxes.utils as utils
 
 
 @pytest.mark.parametrize(
@@ -68,6 +70,107 @@ def test_spent_eth_spent_before_acquired():
     assert str(exception_info.value) == "'time_spent' must be after 'time_acquired'"
 
 
+@pytest.mark.parametrize(
+    ["override_key", "override_value", "message"],
+    [
+        (
+            "cost_usd_including_fees",
+            -3,
+            "expected 'cost_usd_including_fees' greater than or equal to zero, got -3 instead",
+        ),
+        (
+            "proceeds_usd_excluding_fees",
+            -1,
+            "expected 'proceeds_usd_excluding_fees' greater than or equal to zero, got -1 instead",
+        ),
+        ("amount_wei", 0, "expected 'amount_wei' greater than zero, got 0 instead"),
+        (
+            "time_spent",
+            datetime.datetime(1940, 4, 3),
+            "'time_spent' must be after 'time_acquired'",
+        ),
+    ],
+)
+def test_validate_spent_eths(
+    monkeypatch: pytest.MonkeyPatch, override_key: str, override_value, message: str
+):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    row_dict = {
+        "time_acquired": datetime.datetime(1940, 4, 3),
+        "time_spent": datetime.datetime(1941, 9, 29),
+        "amount_wei": 300000000000000000,
+        "cost_usd_including_fees": 0,
+        "proceeds_usd_excluding_fees": 0,
+    }
+    valid_spent_eth = currency.SpentETH(**row_dict)
+    row_dict[override_key] = override_value
+    spent_eths = [
+        valid_spent_eth,
+        currency.SpentETH.create_trusted(**row_dict, long_term_ordinal=0),
+    ]
+    with pytest.raises(ValueError) as exception_info:
+        currency.validate_spent_eths(spent_eths)
+    assert str(exception_info.value) == message
+    assert currency.validate_spent_eths([valid_spent_eth]) is None
+
+
+def test_validate_spent_eths_first_invalid(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    spent_eths = [
+        currency.SpentETH.create_trusted(
+            datetime.datetime(1940, 4, 3),
+            datetime.datetime(1941, 9, 29),
+            300000000000000000,
+            cost_usd_including_fees,
+            0,
+            0,
+        )
+        for cost_usd_including_fees in [4, -1, 2, -5]
+    ]
+    with pytest.raises(ValueError) as exception_info:
+        currency.validate_spent_eths(spent_eths)
+    assert (
+        str(exception_info.value)
+        == "expected 'cost_usd_including_fees' greater than or equal to zero, got -1"
+        " instead"
+    )
+
+
+def test_validate_spent_eths_first_invalid_spent_eth(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    spent_eths = [
+        currency.SpentETH.create_trusted(
+            datetime.datetime(1940, 4, 3),
+            datetime.datetime(1941, 9, 29),
+            amount_wei,
+            cost_usd_including_fees,
+            0,
+            0,
+        )
+        for amount_wei, cost_usd_including_fees in [(1, 0), (0, 0), (1, -1)]
+    ]
+    # First check that fails for first invalid 'SpentETH', even though
+    # 'cost_usd_including_fees' is checked before 'amount_wei'
+    with pytest.raises(ValueError) as exception_info:
+        currency.validate_spent_eths(spent_eths)
+    assert (
+        str(exception_info.value)
+        == "expected 'amount_wei' greater than zero, got 0 instead"
+    )
+
+
+def test_spent_eth_create_trusted_eager(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", True)
+    with pytest.raises(ValueError) as exception_info:
+        currency.SpentETH.create_trusted(
+            datetime.datetime(1940, 4, 3), datetime.datetime(1941, 9, 29), 0, 5, 3, 0
+        )
+    assert (
+        str(exception_info.value)
+        == "expected 'amount_wei' greater than zero, got 0 instead"
+    )
+
+
 @pytest.mark.parametrize(
     ["spent_eth", "form_row"],
     [
@@ -119,6 +222,34 @@ def test_convert_spent_eth_to_form_8949_row(
     spent_eth: currency.SpentETH, form_row: file_writer.Form8949Row
 ):
     assert spent_eth.convert_to_form_8949_row() == form_row
+    assert list(currency.convert_spent_eths_to_form_8949_rows([spent_eth])) == [
+        form_row
+    ]
+
+
+def test_convert_spent_eths_to_form_8949_rows():
+    random_ = random.Random(8949)
+    spent_eths = []
+    for _ in range(2000):
+        time_acquired = datetime.datetime(2019, 12, 25) + datetime.timedelta(
+            days=random_.randrange(800), seconds=random_.randrange(86400)
+        )
+        spent_eths.append(
+            currency.SpentETH(
+                time_acquired,
+                time_acquired
+                + datetime.timedelta(
+                    days=random_.choice([0, 364, 365, 366, 367]),
+                    seconds=random_.randrange(1, 86400),
+                ),
+                random_.choice([1, 10**11, 10**12]) * random_.randrange(1, 10**7),
+                random_.randrange(10**6),
+                random_.randrange(10**6),
+            )
+        )
+    assert list(currency.convert_spent_eths_to_form_8949_rows(spent_eths)) == [
+        spent_eth.convert_to_form_8949_row() for spent_eth in spent_eths
+    ]
 
 
 @pytest.mark.parametrize(
@@ -159,6 +290,10 @@ def test_convert_acquired_eth_to_spent_eth():
         ),
     )
     assert acquired_eth.convert_to_spent_eth(time_spent, 256832) == spent_eth
+    assert (
+        acquired_eth.convert_to_spent_eth_exact(time_spent, (256832, 100 * 10**18))
+        == spent_eth
+    )
 
 
 def test_acquired_eth_remove():
@@ -176,6 +311,29 @@ def test_acquired_eth_remove():
     assert original_instance.amount_wei == 48290000000000 - 2390000000000
 
 
+def test_acquired_eth_split():
+    acquired_eth = currency.AcquiredETH(
+        datetime.datetime(1970, 1, 1),
+        48290000000000,
+        decimal.Decimal("392342141232423"),
+    )
+    removed, rest = acquired_eth.split_wei(2390000000000)
+    assert removed == currency.AcquiredETH(
+        datetime.datetime(1970, 1, 1),
+        2390000000000,
+        decimal.Decimal("392342141232423"),
+    )
+    assert rest == currency.AcquiredETH(
+        datetime.datetime(1970, 1, 1),
+        48290000000000 - 2390000000000,
+        decimal.Decimal("392342141232423"),
+    )
+    # Not modified
+    assert acquired_eth.amount_wei == 48290000000000
+    with pytest.raises(ValueError):
+        acquired_eth.split_wei(48290000000000)
+
+
 @pytest.mark.parametrize("amount", [0, 5030000000000000001])
 def test_acquired_eth_remove_invalid_amount(amount: int):
     acquired_eth = currency.AcquiredETH(
@@ -187,3 +345,47 @@ def test_acquired_eth_remove_invalid_amount(amount: int):
         str(exception_info.value)
         == f"expected value between 0 and 5030000000000000000, got {amount} instead"
     )
+
+
+def test_convert_acquired_eth_to_spent_eth_exact_below_half():
+    # 16071.42857142857142857142857 * 0.7 / 100 is 112.4999...; decimal
+    # context rounds the product to 112.5000... before rounding half up
+    acquired_eth = currency.AcquiredETH(
+        datetime.datetime(2020, 1, 22),
+        700000000000000000,
+        decimal.Decimal(112500) / 7,
+    )
+    time_spent = datetime.datetime(2020, 2, 18)
+    assert (
+        acquired_eth.convert_to_spent_eth(
+            time_spent, decimal.Decimal(0)
+        ).cost_usd_including_fees
+        == 113
+    )
+    assert (
+        acquired_eth.convert_to_spent_eth_exact(
+            time_spent, (0, 1)
+        ).cost_usd_including_fees
+        == 112
+    )
+
+
+def test_acquired_eth_long_term_ordinal():
+    acquired_eth = currency.AcquiredETH(
+        datetime.datetime(2004, 2, 29, 13, 5), 5030000000000000000, decimal.Decimal("1")
+    )
+    long_term_ordinal = datetime.date(2005, 3, 1).toordinal()
+    assert acquired_eth.long_term_ordinal == long_term_ordinal
+    assert acquired_eth.remove_wei(30000000000000000).long_term_ordinal == (
+        long_term_ordinal
+    )
+    for time_spent, is_long_term in [
+        (datetime.datetime(2005, 2, 28, 23, 59, 59), False),
+        (datetime.datetime(2005, 3, 1), True),
+    ]:
+        spent_eth = acquired_eth.convert_to_spent_eth(time_spent, decimal.Decimal(1))
+        assert spent_eth.long_term_ordinal == long_term_ordinal
+        assert spent_eth.is_long_term is is_long_term
+        assert spent_eth.is_long_term is utils.is_long_term(
+            acquired_eth.time_acquired, time_spent
+        )
@@ -0,0 +1,110 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import datetime
+import decimal
+import pathlib
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.event_log as event_log
+import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
+import carlcsaposs.calculate_eth_taxes.file_reader as file_reader
+import carlcsaposs.calculate_eth_taxes.utils as utils
+
+TRANSACTIONS = [
+    exchange_transactions.Acquire(
+        datetime.datetime(2021, 1, 1, 10, 0, 0, 1),
+        2 * 10**26,
+        decimal.Decimal("73000.123456789012345678901234567"),
+    ),
+    exchange_transactions.Spend(
+        datetime.datetime(2021, 1, 2), 1000000000000000, decimal.Decimal(0)
+    ),
+    exchange_transactions.Spend(
+        datetime.datetime(2021, 1, 3), 1, decimal.Decimal("1.50E+5")
+    ),
+]
+
+
+def test_event_log_round_trip(tmp_path: pathlib.Path):
+    file_path = tmp_path / "events"
+    key = bytes(range(32))
+    event_log.write_event_log(file_path, key, TRANSACTIONS)
+    transactions = event_log.read_event_log(file_path, key)
+    assert transactions == TRANSACTIONS
+    assert [str(transaction.time) for transaction in transactions] == [
+        str(transaction.time) for transaction in TRANSACTIONS
+    ]
+    assert str(transactions[2].proceeds_us_cents_per_eth_excluding_fees) == "1.50E+5"
+    assert event_log.read_event_log(file_path, bytes(32)) is None
+    assert event_log.read_event_log(tmp_path / "missing", key) is None
+
+
+def test_calculate_input_key(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path):
+    file_path = tmp_path / "input.csv"
+    file_path.write_text("a,b\n", encoding="utf-8")
+    (tmp_path / "renamed.csv").write_text("a,b\n", encoding="utf-8")
+    key = event_log.calculate_input_key(tmp_path, ["input.csv"], ["transfer"])
+    assert len(key) == 32
+    assert event_log.calculate_input_key(tmp_path, ["input.csv"], ["transfer"]) == key
+    assert event_log.calculate_input_key(tmp_path, ["input.csv"], ["transfer2"]) != key
+    assert (
+        event_log.calculate_input_key(tmp_path, ["input.csv"], ["transfer"], True)
+        != key
+    )
+    assert event_log.calculate_input_key(tmp_path, ["renamed.csv"], ["transfer"]) != key
+    # Source code of parsing module changed
+    module_path = tmp_path / "utils.py"
+    module_path.write_text("", encoding="utf-8")
+    monkeypatch.setattr(utils, "__file__", str(module_path))
+    assert event_log.calculate_input_key(tmp_path, ["input.csv"], ["transfer"]) != key
+    file_path.write_text("a,c\n", encoding="utf-8")
+    assert event_log.calculate_input_key(tmp_path, ["input.csv"], ["transfer"]) != key
+
+
+def test_write_event_log_replaces_file(tmp_path: pathlib.Path):
+    file_path = tmp_path / "events"
+    file_path.write_bytes(b"old")
+    event_log.write_event_log(file_path, bytes(32), TRANSACTIONS)
+    assert event_log.read_event_log(file_path, bytes(32)) == TRANSACTIONS
+    # No temporary files left behind
+    assert list(tmp_path.iterdir()) == [file_path]
+
+
+def test_read_files(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(file_reader, "INPUT_DIRECTORY", str(tmp_path))
+    file_names = ["export-0x061f7937b7b2bc7596539959804f86538b6368dc.csv"]
+    file_names += ["coinbase.csv", "coinbase-pro.csv"]
+    for file_name in file_names:
+        (tmp_path / file_name).write_text("", encoding="utf-8")
+    calls = []
+
+    def read_files(*args):
+        calls.append(args)
+        return TRANSACTIONS
+
+    monkeypatch.setattr(file_reader, "read_files", read_files)
+    arguments = (tmp_path / "log", [file_names[0]], file_names[1], file_names[2], [])
+    assert event_log.read_files(*arguments) == TRANSACTIONS
+    assert len(calls) == 1
+    # Replayed from event log
+    assert event_log.read_files(*arguments) == TRANSACTIONS
+    assert len(calls) == 1
+    (tmp_path / "coinbase.csv").write_text("changed", encoding="utf-8")
+    assert event_log.read_files(*arguments) == TRANSACTIONS
+    assert len(calls) == 2
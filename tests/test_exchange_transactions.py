@@ -28,3 +28,24 @@ def test_convert_acquire_transaction_to_acquired_eth():
     ).convert_to_acquired_eth() == currency.AcquiredETH(
         datetime.datetime(2021, 3, 17), 500, decimal.Decimal("10340")
     )
+
+
+def test_merge_in_chronological_order():
+    streams = [
+        [
+            exchange_transactions.Acquire(datetime.datetime(2020, 1, day), 1, price)
+            for day, price in [(1, decimal.Decimal(1)), (3, decimal.Decimal(2))]
+        ],
+        [
+            exchange_transactions.Spend(datetime.datetime(2020, 1, day), 2, price)
+            for day, price in [(1, decimal.Decimal(3)), (2, decimal.Decimal(4))]
+        ],
+        [
+            exchange_transactions.Acquire(datetime.datetime(2020, 1, 1), 3, price)
+            for price in [decimal.Decimal(5), decimal.Decimal(6)]
+        ],
+    ]
+    concatenated = [transaction for stream in streams for transaction in stream]
+    assert list(exchange_transactions.merge_in_chronological_order(streams)) == sorted(
+        concatenated, key=lambda transaction: transaction.time
+    )
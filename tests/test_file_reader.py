@@ -17,9 +17,16 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # pylint: disable=missing-docstring
 import datetime
 import decimal
+import io
+import pathlib
+import random
+import typing
+
+import pytest
 
 import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
 import carlcsaposs.calculate_eth_taxes.file_reader as file_reader
+import carlcsaposs.calculate_eth_taxes.utils as utils
 
 
 def test_convert_fee_to_spend_transaction():
@@ -66,3 +73,468 @@ def test_convert_coinbase_pro_timestamp_to_datetime():
     assert file_reader.convert_coinbase_pro_timestamp_to_datetime(
         "2022-07-05T23:16:51.802Z"
     ) == datetime.datetime(2022, 7, 5, 23, 16, 51, 802000)
+
+
+@pytest.mark.parametrize(
+    "timestamp",
+    [
+        "2022-07-05T23:16:51Z",
+        "1970-01-01T00:00:00Z",
+        "2024-02-29T12:00:59Z",
+        # Non-ASCII digit; not parsed by fast path
+        "2022-07-05T23:16:5\u0661Z",
+    ],
+)
+def test_parse_coinbase_timestamp(timestamp: str):
+    assert file_reader.parse_coinbase_timestamp(
+        timestamp
+    ) == file_reader.convert_coinbase_timestamp_to_datetime(timestamp)
+
+
+@pytest.mark.parametrize(
+    "timestamp",
+    [
+        "2022-07-05T23:16:51.802Z",
+        "2022-07-05T23:16:51.8Z",
+        "2022-07-05T23:16:51.000001Z",
+        "2024-02-29T12:00:59.999999Z",
+    ],
+)
+def test_parse_coinbase_pro_timestamp(timestamp: str):
+    assert file_reader.parse_coinbase_pro_timestamp(
+        timestamp
+    ) == file_reader.convert_coinbase_pro_timestamp_to_datetime(timestamp)
+
+
+@pytest.mark.parametrize(
+    ["parse", "timestamp"],
+    [
+        (file_reader.parse_coinbase_timestamp, "2022-07-05 23:16:51Z"),
+        (file_reader.parse_coinbase_timestamp, "2023-02-29T23:16:51Z"),
+        (file_reader.parse_coinbase_timestamp, "2022-07-05T23:16:51.802Z"),
+        (file_reader.parse_coinbase_pro_timestamp, "2022-07-05T23:16:51Z"),
+        (file_reader.parse_coinbase_pro_timestamp, "2022-07-05T23:16:51.Z"),
+        (file_reader.parse_coinbase_pro_timestamp, "2022-07-05T23:16:51.8021234Z"),
+        (file_reader.parse_coinbase_pro_timestamp, "2022-07-05T24:16:51.802Z"),
+    ],
+)
+def test_parse_timestamp_malformed(
+    parse: typing.Callable[[str], datetime.datetime], timestamp: str
+):
+    with pytest.raises(ValueError):
+        parse(timestamp)
+
+
+def create_wallet_transaction(
+    time: datetime.datetime, amount_wei: int, fee_wei: int = 0
+) -> file_reader.WalletTransaction:
+    return file_reader.WalletTransaction(
+        time,
+        "0x061f7937b7b2bc7596539959804f86538b6368dc",
+        "0x8fa9b96f3d08165f26256931b39d973a237b29f3",
+        amount_wei,
+        fee_wei,
+        decimal.Decimal("10258"),
+    )
+
+
+def correlate_coinbase_transfers_by_scan(
+    coinbase_transfer_transactions: file_reader.CoinbaseTransferTransactions,
+    wallet_transactions_by_wallet: dict[str, list[file_reader.WalletTransaction]],
+) -> file_reader.CoinbaseTransferTransactions:
+    """Reference: scan every wallet transaction for each transfer"""
+    unmatched_transactions = []
+    for coinbase_transaction in sorted(
+        coinbase_transfer_transactions, key=lambda transaction: transaction.time
+    ):
+        from_coinbase = (
+            coinbase_transaction.type_
+            == file_reader.CoinbaseTransferTransaction.TransactionType.FROM_COINBASE
+        )
+        for transactions in wallet_transactions_by_wallet.values():
+            for transaction in transactions:
+                amount_wei = transaction.amount_wei
+                if from_coinbase:
+                    amount_wei += transaction.fee_wei
+                if abs(
+                    amount_wei - coinbase_transaction.amount_wei
+                ) < 1000000000000000 and abs(
+                    transaction.time - coinbase_transaction.time
+                ) < datetime.timedelta(
+                    minutes=15
+                ):
+                    if from_coinbase:
+                        transaction.wallet_from = "coinbase"
+                    else:
+                        transaction.wallet_to = "coinbase"
+                    break
+            else:
+                continue
+            break
+        else:
+            unmatched_transactions.append(coinbase_transaction)
+    return unmatched_transactions
+
+
+def create_transfers(
+    seed: int,
+) -> tuple[
+    file_reader.CoinbaseTransferTransactions,
+    dict[str, list[file_reader.WalletTransaction]],
+]:
+    random_ = random.Random(seed)
+    start = datetime.datetime(2021, 1, 1)
+    wallet_transactions_by_wallet = {
+        f"wallet{wallet_number}": [
+            create_wallet_transaction(
+                start + datetime.timedelta(minutes=random_.randrange(600)),
+                random_.randrange(10) * 500000000000000,
+                random_.choice([0, 600000000000000]),
+            )
+            for _ in range(40)
+        ]
+        for wallet_number in range(3)
+    }
+    coinbase_transfer_transactions = [
+        file_reader.CoinbaseTransferTransaction(
+            start + datetime.timedelta(minutes=random_.randrange(600)),
+            random_.randrange(10) * 500000000000000,
+            random_.choice(
+                list(file_reader.CoinbaseTransferTransaction.TransactionType)
+            ),
+        )
+        for _ in range(60)
+    ]
+    return (coinbase_transfer_transactions, wallet_transactions_by_wallet)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_correlate_coinbase_transfers_matches_scan(seed: int):
+    coinbase_transfer_transactions, wallet_transactions_by_wallet = create_transfers(
+        seed
+    )
+    unmatched_transactions = file_reader.correlate_coinbase_transfers(
+        coinbase_transfer_transactions, wallet_transactions_by_wallet
+    )
+    (
+        reference_coinbase_transfer_transactions,
+        reference_wallet_transactions_by_wallet,
+    ) = create_transfers(seed)
+    assert unmatched_transactions == correlate_coinbase_transfers_by_scan(
+        reference_coinbase_transfer_transactions,
+        reference_wallet_transactions_by_wallet,
+    )
+    assert wallet_transactions_by_wallet == reference_wallet_transactions_by_wallet
+
+
+def test_correlate_coinbase_transfers_tolerances():
+    time = datetime.datetime(2021, 1, 1, 12)
+    wallet_transactions = [
+        create_wallet_transaction(time - datetime.timedelta(minutes=15), 10**18),
+        create_wallet_transaction(time + datetime.timedelta(minutes=15), 10**18),
+        create_wallet_transaction(time, 10**18 + 1000000000000000),
+        create_wallet_transaction(time, 10**18 - 400000000000000, 400000000000000),
+    ]
+    from_coinbase = file_reader.CoinbaseTransferTransaction(
+        time,
+        10**18,
+        file_reader.CoinbaseTransferTransaction.TransactionType.FROM_COINBASE,
+    )
+    assert (
+        file_reader.correlate_coinbase_transfers(
+            [from_coinbase], {"wallet": wallet_transactions}
+        )
+        == []
+    )
+    assert [transaction.wallet_from for transaction in wallet_transactions] == [
+        "0x061f7937b7b2bc7596539959804f86538b6368dc"
+    ] * 3 + ["coinbase"]
+    to_coinbase = file_reader.CoinbaseTransferTransaction(
+        time,
+        10**18 + 1000000000000000,
+        file_reader.CoinbaseTransferTransaction.TransactionType.TO_COINBASE,
+    )
+    assert file_reader.correlate_coinbase_transfers(
+        [to_coinbase], {"wallet": wallet_transactions[:2]}
+    ) == [to_coinbase]
+
+
+@pytest.mark.parametrize(
+    ["optimal_assignment", "wallet_to"],
+    [
+        (False, ["coinbase", "0x8fa9b96f3d08165f26256931b39d973a237b29f3"]),
+        (True, ["coinbase", "coinbase"]),
+    ],
+)
+def test_correlate_coinbase_transfers_optimal_assignment(
+    optimal_assignment: bool, wallet_to: list[str]
+):
+    time = datetime.datetime(2021, 1, 1, 12)
+    # First match uses first wallet transaction for both transfers
+    wallet_transactions_by_wallet = {
+        "wallet0": [create_wallet_transaction(time, 10**18)],
+        "wallet1": [create_wallet_transaction(time, 10**18)],
+    }
+    coinbase_transfer_transactions = [
+        file_reader.CoinbaseTransferTransaction(
+            time + datetime.timedelta(minutes=minutes),
+            10**18,
+            file_reader.CoinbaseTransferTransaction.TransactionType.TO_COINBASE,
+        )
+        for minutes in [1, 2]
+    ]
+    unmatched_transactions = file_reader.correlate_coinbase_transfers(
+        coinbase_transfer_transactions,
+        wallet_transactions_by_wallet,
+        optimal_assignment,
+    )
+    assert unmatched_transactions == []
+    assert [
+        transactions[0].wallet_to
+        for transactions in wallet_transactions_by_wallet.values()
+    ] == wallet_to
+
+
+def test_correlate_coinbase_transfers_optimal_assignment_maximizes_matches():
+    time = datetime.datetime(2021, 1, 1, 12)
+    # Closest match for first transfer is only match for second transfer
+    wallet_transactions = [
+        create_wallet_transaction(time + datetime.timedelta(minutes=10), 10**18),
+        create_wallet_transaction(time, 10**18),
+    ]
+    coinbase_transfer_transactions = [
+        file_reader.CoinbaseTransferTransaction(
+            time + datetime.timedelta(minutes=minutes),
+            10**18,
+            file_reader.CoinbaseTransferTransaction.TransactionType.TO_COINBASE,
+        )
+        for minutes in [1, -10]
+    ]
+    unmatched_transactions = file_reader.correlate_coinbase_transfers(
+        coinbase_transfer_transactions, {"wallet": wallet_transactions}, True
+    )
+    assert unmatched_transactions == []
+    assert [transaction.wallet_to for transaction in wallet_transactions] == [
+        "coinbase",
+        "coinbase",
+    ]
+
+
+ETHERSCAN_CSV = """\
+"Txhash","Blockno","UnixTimestamp","DateTime","From","To","ContractAddress","Value_IN(ETH)","Value_OUT(ETH)","CurrentValue @ $1000/Eth","TxnFee(ETH)","TxnFee(USD)","Historical $Price/Eth","Status","ErrCode","Method"
+"0x1","1","1609617425","2021-01-02 19:57:05","0xC2B6A6FCD2E1F17D5B1DB5C9BCB7D1B4A2C6A7E1","0x061f7937b7b2bc7596539959804f86538b6368dc","","1.5","0","1500","0.001","1","730.5","","","Transfer"
+"0x2","2","1609703825","2021-01-03 19:57:05","0x061f7937b7b2bc7596539959804f86538b6368dc","0x8fa9b96f3d08165f26256931b39d973a237b29f3","","0","0.25","250","0.002","2","975.25","","","Transfer"
+"0x3","3","1609790225","2021-01-04 19:57:05","0x061f7937b7b2bc7596539959804f86538b6368dc","0x8fa9b96f3d08165f26256931b39d973a237b29f3","","0","0.5","500","0.003","3","1040","Error(0)","Out of gas","Transfer"
+"""
+
+
+def test_iterate_etherscan_csv():
+    transactions = file_reader.iterate_etherscan_csv(io.StringIO(ETHERSCAN_CSV))
+    assert list(transactions) == [
+        file_reader.WalletTransaction(
+            datetime.datetime.fromtimestamp(1609617425),
+            "0xc2b6a6fcd2e1f17d5b1db5c9bcb7d1b4a2c6a7e1",
+            "0x061f7937b7b2bc7596539959804f86538b6368dc",
+            1500000000000000000,
+            1000000000000000,
+            decimal.Decimal("73050.0"),
+        ),
+        file_reader.WalletTransaction(
+            datetime.datetime.fromtimestamp(1609703825),
+            "0x061f7937b7b2bc7596539959804f86538b6368dc",
+            "0x8fa9b96f3d08165f26256931b39d973a237b29f3",
+            250000000000000000,
+            2000000000000000,
+            decimal.Decimal("97525"),
+        ),
+        file_reader.WalletTransaction(
+            datetime.datetime.fromtimestamp(1609790225),
+            "0x061f7937b7b2bc7596539959804f86538b6368dc",
+            "0x8fa9b96f3d08165f26256931b39d973a237b29f3",
+            0,
+            3000000000000000,
+            decimal.Decimal("104000"),
+        ),
+    ]
+    assert list(file_reader.iterate_etherscan_csv(io.StringIO(""))) == []
+
+
+@pytest.mark.parametrize("optimal_assignment", [False, True])
+def test_read_files(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, optimal_assignment: bool
+):
+    monkeypatch.setattr(file_reader, "INPUT_DIRECTORY", str(tmp_path))
+    wallet_csv = "export-0x061f7937b7b2bc7596539959804f86538b6368dc.csv"
+    (tmp_path / wallet_csv).write_text(ETHERSCAN_CSV, encoding="utf-8")
+    send_time = datetime.datetime.fromtimestamp(1609617425) - datetime.timedelta(
+        minutes=3
+    )
+    (tmp_path / "coinbase.csv").write_text(
+        "Timestamp,Transaction Type,Asset,Quantity Transacted,"
+        "Total (inclusive of fees)\n"
+        "2021-01-01T10:00:00Z,Buy,ETH,2,1460\n"
+        f"{send_time.strftime('%Y-%m-%dT%H:%M:%SZ')},Send,ETH,1.5005,\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "coinbase-pro.csv").write_text(
+        "portfolio,type,time,amount,balance,amount/balance unit,transfer id,"
+        "trade id,order id\n",
+        encoding="utf-8",
+    )
+    assert file_reader.read_files(
+        [wallet_csv],
+        "coinbase.csv",
+        "coinbase-pro.csv",
+        [],
+        optimal_assignment,
+    ) == [
+        exchange_transactions.Acquire(
+            datetime.datetime(2021, 1, 1, 10),
+            2000000000000000000,
+            decimal.Decimal(73000),
+        ),
+        exchange_transactions.Spend(
+            datetime.datetime.fromtimestamp(1609617425),
+            1000000000000000,
+            decimal.Decimal(0),
+        ),
+        exchange_transactions.Spend(
+            datetime.datetime.fromtimestamp(1609703825),
+            250000000000000000,
+            decimal.Decimal("97525"),
+        ),
+        exchange_transactions.Spend(
+            datetime.datetime.fromtimestamp(1609703825),
+            2000000000000000,
+            decimal.Decimal(0),
+        ),
+        exchange_transactions.Spend(
+            datetime.datetime.fromtimestamp(1609790225),
+            3000000000000000,
+            decimal.Decimal(0),
+        ),
+    ]
+
+
+def write_input_files(directory: pathlib.Path, seed: int) -> list[str]:
+    """Write Etherscan CSVs, 'coinbase.csv' and 'coinbase-pro.csv'
+
+    Returns Etherscan CSV file names
+    """
+    random_ = random.Random(seed)
+    start = datetime.datetime(2021, 1, 1)
+    coinbase_pro_lines = [
+        "portfolio,type,time,amount,balance,amount/balance unit,transfer id,"
+        "trade id,order id"
+    ]
+    for order_number in range(12):
+        time_ = (start + datetime.timedelta(hours=order_number)).strftime(
+            "%Y-%m-%dT%H:%M:%S.%f"
+        )[:-3] + "Z"
+        coinbase_pro_lines.append(
+            f"default,deposit,{time_},100,100,USD,transfer{order_number},,"
+        )
+        ids = f"{order_number},order{order_number}"
+        coinbase_pro_lines += [
+            f"default,match,{time_},-100,0,USD,,{ids}",
+            f"default,match,{time_},0.1{order_number},0.1,ETH,,{ids}",
+            f"default,fee,{time_},-0.5,0,USD,,{ids}",
+        ]
+    withdrawals = []
+    for withdrawal_number in range(2):
+        time_ = start + datetime.timedelta(days=1, hours=withdrawal_number)
+        withdrawals.append(time_)
+        coinbase_pro_lines.append(
+            f"default,withdrawal,{time_.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]}Z,"
+            f"-0.5,0,ETH,withdrawal{withdrawal_number},,"
+        )
+    (directory / "coinbase-pro.csv").write_text(
+        "\n".join(coinbase_pro_lines) + "\n", encoding="utf-8"
+    )
+    (directory / "coinbase.csv").write_text(
+        "Timestamp,Transaction Type,Asset,Quantity Transacted,"
+        "Total (inclusive of fees)\n"
+        "2021-01-01T10:00:00Z,Buy,ETH,2,1460\n",
+        encoding="utf-8",
+    )
+    header = ETHERSCAN_CSV.split("\n", 1)[0]
+    etherscan_csvs = []
+    wallets = [
+        "0x061f7937b7b2bc7596539959804f86538b6368dc",
+        "0xc2b6a6fcd2e1f17d5b1db5c9bcb7d1b4a2c6a7e1",
+    ]
+    for wallet, withdrawal_time in zip(wallets, withdrawals):
+        time_ = withdrawal_time + datetime.timedelta(minutes=2)
+        lines = [
+            header,
+            f'"0x0","0","{int(time_.timestamp())}","","0x0","{wallet}","","0.5","0",'
+            '"","0","","730","","",""',
+        ]
+        for _ in range(random_.randrange(20, 40)):
+            time_ += datetime.timedelta(minutes=random_.randrange(1, 600))
+            lines.append(
+                f'"0x0","0","{int(time_.timestamp())}","","{wallet}",'
+                '"0x8fa9b96f3d08165f26256931b39d973a237b29f3","","0",'
+                f'"0.00{random_.randrange(1, 999)}","","0.0001{random_.randrange(99)}",'
+                f'"","{random_.randrange(700, 900)}.{random_.randrange(100)}","","",""'
+            )
+        etherscan_csvs.append(f"export-{wallet}.csv")
+        (directory / etherscan_csvs[-1]).write_text(
+            "\n".join(lines) + "\n", encoding="utf-8"
+        )
+    return etherscan_csvs
+
+
+@pytest.mark.parametrize("optimal_assignment", [False, True])
+def test_read_files_in_parallel(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path, optimal_assignment: bool
+):
+    monkeypatch.setattr(file_reader, "INPUT_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(file_reader, "PARALLEL_CHUNK_BYTES", 300)
+    etherscan_csvs = write_input_files(tmp_path, 13)
+    arguments = (
+        etherscan_csvs,
+        "coinbase.csv",
+        "coinbase-pro.csv",
+        ["transfer3"],
+        optimal_assignment,
+    )
+    serial_transactions = file_reader.read_files(*arguments)
+    assert len(serial_transactions) > 50
+    assert file_reader.read_files(*arguments, max_workers=2) == serial_transactions
+
+
+def test_read_files_by_source(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(file_reader, "INPUT_DIRECTORY", str(tmp_path))
+    etherscan_csvs = write_input_files(tmp_path, 13)
+    arguments = (etherscan_csvs, "coinbase.csv", "coinbase-pro.csv", [])
+    transactions = file_reader.read_files(*arguments)
+    sources = file_reader.read_files_by_source(*arguments)
+    assert len(sources) > 1
+    assert list(exchange_transactions.merge_in_chronological_order(sources)) == sorted(
+        transactions, key=lambda transaction: transaction.time
+    )
+
+
+@pytest.mark.parametrize(
+    ["chunk_bytes", "offsets"],
+    [
+        (1, [14, 45, 67, 79]),
+        (40, [14, 67, 79]),
+        (70, [14, 79]),
+    ],
+)
+def test_split_csv_file(tmp_path: pathlib.Path, chunk_bytes: int, offsets: list[int]):
+    # pylint: disable=protected-access
+    file_path = tmp_path / "coinbase-pro.csv"
+    file_path.write_text(
+        "type,order id\n"
+        "deposit,\n"
+        "match,a\nmatch,a\nfee,a\n"
+        "match,b\nmatch,b\nfee,b\n"
+        "withdrawal,\n",
+        encoding="utf-8",
+    )
+    assert utils.split_csv_file(
+        str(file_path), chunk_bytes, file_reader._can_split_coinbase_pro_rows_after
+    ) == (["type", "order id"], offsets)
@@ -18,12 +18,15 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import collections
 import csv
 import dataclasses
+import gzip
+import lzma
 import pathlib
 import typing
 
 import pytest
 
 import carlcsaposs.calculate_eth_taxes.file_writer as file_writer
+import carlcsaposs.calculate_eth_taxes.utils as utils
 
 
 @pytest.mark.parametrize(
@@ -48,6 +51,38 @@ def test_form_8949_row_negative_integer(override_key: str, override_value: int):
     )
 
 
+@pytest.mark.parametrize(
+    ["override_key", "override_value"], [("proceeds_usd", -3), ("cost_usd", -1)]
+)
+def test_write_form_8949_trusted_invalid_row(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    override_key: str,
+    override_value: int,
+):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    row_dict = {
+        "tax_year": 103,
+        "is_long_term": False,
+        "description": "3.3 ETH",
+        "date_acquired": "12/12/103",
+        "date_sold": "12/21/103",
+        "proceeds_usd": 0,
+        "cost_usd": 0,
+    }
+    rows = [file_writer.Form8949Row(**row_dict)]
+    row_dict[override_key] = override_value
+    rows.append(file_writer.Form8949Row.create_trusted(**row_dict))
+    file_path = tmp_path / "form-8949.csv"
+    with pytest.raises(ValueError) as exception_info:
+        file_writer.Form8949File(rows).write_to_file(file_path)
+    assert (
+        str(exception_info.value)
+        == f"expected '{override_key}' greater than or equal to zero, got {override_value} instead"
+    )
+    assert not file_path.exists()
+
+
 def test_write_form_8949_zero_rows(tmp_path: pathlib.Path):
     file_path = tmp_path / "form-8949.csv"
     file_writer.Form8949File([]).write_to_file(file_path)
@@ -88,3 +123,226 @@ def test_write_form_8949_multiple_rows(tmp_path):
                 row[field.name] = cast_string(row[field.name], field.type)
             assert file_writer.Form8949Row(**row) == rows.popleft()
     assert len(rows) == 0
+
+
+def test_write_rows_to_file(tmp_path: pathlib.Path):
+    rows = [
+        file_writer.Form8949Row(
+            1971, index % 2 == 0, f"{index}.1 ETH", "01/01/1970", "01/02/1971", index, 2
+        )
+        for index in range(25)
+    ]
+    file_path = tmp_path / "form-8949.csv"
+    assert file_writer.Form8949File.write_rows_to_file(iter(rows), file_path, 10) == 25
+    expected_file_path = tmp_path / "expected.csv"
+    file_writer.Form8949File(rows).write_to_file(expected_file_path)
+    assert file_path.read_text(encoding="utf-8") == expected_file_path.read_text(
+        encoding="utf-8"
+    )
+
+
+def test_write_rows_to_file_invalid_row(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    rows = [
+        file_writer.Form8949Row.create_trusted(
+            1971, False, "1 ETH", "01/01/1970", "01/02/1971", 10 - index, 2
+        )
+        for index in range(25)
+    ]
+    file_path = tmp_path / "form-8949.csv"
+    with pytest.raises(ValueError) as exception_info:
+        file_writer.Form8949File.write_rows_to_file(iter(rows), file_path, 10)
+    assert (
+        str(exception_info.value)
+        == "expected 'proceeds_usd' greater than or equal to zero, got -1 instead"
+    )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_validate_form_8949_rows_first_invalid_row(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    rows = [
+        file_writer.Form8949Row.create_trusted(
+            1971, False, "1 ETH", "01/01/1970", "01/02/1971", proceeds_usd, cost_usd
+        )
+        for proceeds_usd, cost_usd in [(1, 2), (1, -2), (-1, 2)]
+    ]
+    # First check that fails for first invalid row, even though
+    # 'proceeds_usd' is checked before 'cost_usd'
+    with pytest.raises(ValueError) as exception_info:
+        file_writer.validate_form_8949_rows(rows)
+    assert (
+        str(exception_info.value)
+        == "expected 'cost_usd' greater than or equal to zero, got -2 instead"
+    )
+
+
+@pytest.mark.parametrize(
+    ["file_name", "compression", "open_"],
+    [
+        ("form-8949.csv.gz", None, gzip.open),
+        ("form-8949.csv.xz", None, lzma.open),
+        ("form-8949.csv", "gzip", gzip.open),
+    ],
+)
+def test_write_rows_to_compressed_file(
+    tmp_path: pathlib.Path,
+    file_name: str,
+    compression: typing.Optional[str],
+    open_: typing.Callable,
+):
+    rows = [
+        file_writer.Form8949Row(
+            1971, True, "0.00439 ETH", "01/01/1970", "01/02/1971", 0, 2
+        ),
+        file_writer.Form8949Row(
+            1971, False, "1.00439 ETH", "12/31/1970", "01/02/1971", 43, 0
+        ),
+    ]
+    expected_file_path = tmp_path / "expected.csv"
+    file_writer.Form8949File(rows).write_to_file(expected_file_path)
+    expected = expected_file_path.read_bytes()
+    file_path = tmp_path / file_name
+    file_writer.Form8949File.write_rows_to_file(
+        iter(rows), file_path, compression=compression
+    )
+    with open_(file_path, "rb") as file:
+        assert file.read() == expected
+    file_path.unlink()
+    file_writer.Form8949File(rows).write_to_file(file_path, compression)
+    with open_(file_path, "rb") as file:
+        assert file.read() == expected
+
+
+def create_rows(count: int) -> list[file_writer.Form8949Row]:
+    return [
+        file_writer.Form8949Row(
+            2020 + index % 3,
+            index % 5 == 0,
+            f"{index}.5 ETH",
+            "01/01/2019",
+            "01/02/2021",
+            index,
+            2,
+        )
+        for index in range(count)
+    ]
+
+
+def test_write_rows_to_shards(tmp_path: pathlib.Path):
+    rows = create_rows(100)
+    file_paths = file_writer.write_rows_to_shards(
+        iter(rows), tmp_path / "output", batch_size=4, max_queued_batches=1
+    )
+    assert list(file_paths) == [
+        (tax_year, is_long_term)
+        for tax_year in [2020, 2021, 2022]
+        for is_long_term in [False, True]
+    ]
+    assert file_paths[(2021, True)] == tmp_path / "output/form-8949-2021-long-term.csv"
+    for (tax_year, is_long_term), file_path in file_paths.items():
+        expected_file_path = tmp_path / "expected.csv"
+        file_writer.Form8949File(
+            [
+                row
+                for row in rows
+                if row.tax_year == tax_year and row.is_long_term == is_long_term
+            ]
+        ).write_to_file(expected_file_path)
+        assert file_path.read_bytes() == expected_file_path.read_bytes()
+
+
+def test_write_rows_to_shards_invalid_row(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+):
+    monkeypatch.setattr(utils, "EAGER_VALIDATION", False)
+    rows = create_rows(100)
+    rows.append(
+        file_writer.Form8949Row.create_trusted(
+            2020, False, "1 ETH", "01/01/2019", "01/02/2020", -1, 2
+        )
+    )
+    rows += create_rows(100)
+    with pytest.raises(ValueError) as exception_info:
+        file_writer.write_rows_to_shards(iter(rows), tmp_path, batch_size=4)
+    assert (
+        str(exception_info.value)
+        == "expected 'proceeds_usd' greater than or equal to zero, got -1 instead"
+    )
+    assert not (tmp_path / "form-8949-2020-short-term.csv").exists()
+    assert (tmp_path / "form-8949-2020-long-term.csv").exists()
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_sharded_sink_exception(tmp_path: pathlib.Path):
+    with pytest.raises(KeyError):
+        with file_writer.ShardedForm8949Sink(tmp_path, batch_size=4) as sink:
+            sink.write_rows(create_rows(50))
+            raise KeyError
+    assert list(tmp_path.iterdir()) == []
+
+
+def calculate_totals_by_scan(
+    rows: list[file_writer.Form8949Row],
+) -> dict[tuple[int, bool], file_writer.SummaryTotals]:
+    totals = collections.defaultdict(file_writer.SummaryTotals)
+    for row in rows:
+        totals_ = totals[(row.tax_year, row.is_long_term)]
+        totals_.row_count += 1
+        totals_.proceeds_usd += row.proceeds_usd
+        totals_.cost_usd += row.cost_usd
+    return dict(totals)
+
+
+def test_summary_write_rows_to_file(tmp_path: pathlib.Path):
+    rows = create_rows(100)
+    summary = file_writer.Summary()
+    file_writer.Form8949File.write_rows_to_file(
+        iter(rows), tmp_path / "output.csv", batch_size=7, summary=summary
+    )
+    assert summary.totals == calculate_totals_by_scan(rows)
+    summary = file_writer.Summary()
+    file_writer.Form8949File(rows).write_to_file(
+        tmp_path / "output.csv", summary=summary
+    )
+    assert summary.totals == calculate_totals_by_scan(rows)
+
+
+def test_summary_write_rows_to_shards(tmp_path: pathlib.Path):
+    rows = create_rows(100)
+    summary = file_writer.Summary()
+    file_writer.write_rows_to_shards(iter(rows), tmp_path, summary=summary)
+    assert summary.totals == calculate_totals_by_scan(rows)
+
+
+def test_summary_update():
+    rows = create_rows(100)
+    summary = file_writer.Summary()
+    summary.add_rows(rows[:40])
+    other = file_writer.Summary()
+    other.add_rows(rows[40:])
+    summary.update(other)
+    assert summary.totals == calculate_totals_by_scan(rows)
+
+
+def test_summary_write_to_file(tmp_path: pathlib.Path):
+    summary = file_writer.Summary()
+    summary.add_rows(
+        [
+            file_writer.Form8949Row(*row)
+            for row in [
+                (2021, True, "1 ETH", "01/01/2019", "01/02/2021", 5, 7),
+                (2020, False, "1 ETH", "01/01/2020", "02/01/2020", 3, 1),
+                (2021, True, "2 ETH", "01/01/2019", "01/03/2021", 9, 2),
+            ]
+        ]
+    )
+    summary.write_to_file(tmp_path / "summary.csv")
+    with open(tmp_path / "summary.csv", encoding="utf-8", newline="") as file:
+        assert list(csv.reader(file)) == [
+            file_writer.Summary.FIELDNAMES,
+            ["2020", "short-term", "1", "3", "1", "2"],
+            ["2021", "long-term", "2", "14", "9", "5"],
+        ]
@@ -0,0 +1,115 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import datetime
+import decimal
+import json
+import pathlib
+import typing
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
+import carlcsaposs.calculate_eth_taxes.instrumentation as instrumentation
+import carlcsaposs.calculate_eth_taxes.inventory as inventory
+import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
+import carlcsaposs.calculate_eth_taxes.transaction_processor as transaction_processor
+
+
+@pytest.fixture(name="profile")
+def fixture_profile() -> typing.Iterator[instrumentation.Profile]:
+    yield instrumentation.enable()
+    instrumentation.disable()
+
+
+def test_disabled():
+    profile = instrumentation.enable()
+    instrumentation.disable()
+    with instrumentation.stage("a"):
+        pass
+    assert profile.convert_to_dict() == {"stages": {}, "counters": {}}
+
+
+def test_stage(profile: instrumentation.Profile):
+    for _ in range(2):
+        with instrumentation.stage("a"):
+            with instrumentation.stage("b"):
+                pass
+    with pytest.raises(KeyError):
+        with instrumentation.stage("c"):
+            raise KeyError
+    assert list(profile.stage_seconds) == ["a", "b", "c"]
+    assert profile.stage_calls == {"a": 2, "b": 2, "c": 1}
+    assert profile.stage_seconds["a"] >= profile.stage_seconds["b"] >= 0
+
+
+class SelectedFirstInFirstOut(tax_optimizer.FirstInFirstOut):
+    @classmethod
+    def create_index(cls, acquired_eths):
+        return inventory.SelectionLotIndex(cls.select, acquired_eths)
+
+
+@pytest.mark.parametrize(
+    ["tax_mode", "lots_sorted", "lots_reindexed"],
+    [
+        (tax_optimizer.FirstInFirstOut, 0, 0),
+        (SelectedFirstInFirstOut, 5, 0),
+        (tax_optimizer.LowerTaxBracket, 0, 3),
+    ],
+)
+def test_processor_counters(
+    profile: instrumentation.Profile,
+    tax_mode: tax_optimizer.OptimizationMethod,
+    lots_sorted: int,
+    lots_reindexed: int,
+):
+    start = datetime.datetime(2021, 1, 1)
+    transactions: list[exchange_transactions.CurrencyExchange] = [
+        exchange_transactions.Acquire(
+            start + datetime.timedelta(days=day), 10, decimal.Decimal(100 * (day + 1))
+        )
+        for day in range(3)
+    ]
+    transactions += [
+        exchange_transactions.Spend(
+            start + datetime.timedelta(days=3), 15, decimal.Decimal(150)
+        ),
+        exchange_transactions.Spend(
+            start + datetime.timedelta(days=4), 10, decimal.Decimal(150)
+        ),
+    ]
+    spent_eths = transaction_processor.convert_transactions_to_spent_eth(
+        transactions, {2021: tax_mode}
+    )
+    assert profile.counters["spends"] == 2
+    assert profile.counters["spent_eths"] == len(spent_eths) == 4
+    assert profile.counters["lot_splits"] == 2
+    assert profile.counters["lots_sorted"] == lots_sorted
+    assert profile.counters["lots_reindexed"] == lots_reindexed
+    assert profile.stage_calls["remove_wei"] == 2
+
+
+def test_write_to_file(profile: instrumentation.Profile, tmp_path: pathlib.Path):
+    with instrumentation.stage("a"):
+        instrumentation.count("b", 3)
+    profile.write_to_file(tmp_path / "profile.json")
+    with open(tmp_path / "profile.json", encoding="utf-8") as file:
+        assert json.load(file) == {
+            "stages": {"a": {"seconds": profile.stage_seconds["a"], "calls": 1}},
+            "counters": {"b": 3},
+        }
+    assert profile.format_report().splitlines()[-1].split() == ["b", "3"]
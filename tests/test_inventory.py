@@ -0,0 +1,263 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import datetime
+import decimal
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.currency as currency
+import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
+import carlcsaposs.calculate_eth_taxes.inventory as inventory
+import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
+
+
+def create_acquired_eths() -> list[currency.AcquiredETH]:
+    return [
+        currency.AcquiredETH(
+            datetime.datetime(2021, 3, 14), 78900000000000, decimal.Decimal("57076")
+        ),
+        currency.AcquiredETH(
+            datetime.datetime(2021, 3, 13), 78900000000000, decimal.Decimal("57075")
+        ),
+        currency.AcquiredETH(
+            datetime.datetime(2021, 3, 12), 78900000000000, decimal.Decimal("57075")
+        ),
+        currency.AcquiredETH(
+            datetime.datetime(2021, 3, 13), 78900000000000, decimal.Decimal("1")
+        ),
+        currency.AcquiredETH(
+            datetime.datetime(2021, 3, 11), 78900000000000, decimal.Decimal("657075")
+        ),
+    ]
+
+
+SPEND = exchange_transactions.Spend(
+    datetime.datetime(2022, 3, 13), 0, decimal.Decimal("57075")
+)
+
+
+class SortedLotIndex(inventory.LotIndex):
+    """List sorted for every spend, like before indexes"""
+
+    def __init__(self, method, acquired_eths):
+        self._method = method
+        self._acquired_eths = list(acquired_eths)
+        self._transaction = None
+
+    def __iter__(self):
+        return iter(self._acquired_eths)
+
+    def __len__(self):
+        return len(self._acquired_eths)
+
+    def add(self, acquired_eth):
+        self._acquired_eths.append(acquired_eth)
+
+    def peek(self, transaction):
+        if transaction is not self._transaction:
+            self._acquired_eths = self._method.sort(self._acquired_eths, transaction)
+            self._transaction = transaction
+        if not self._acquired_eths:
+            raise IndexError("index is empty")
+        return self._acquired_eths[-1]
+
+    def pop(self, transaction):
+        self.peek(transaction)
+        return self._acquired_eths.pop()
+
+
+def drain(lot_index: inventory.LotIndex) -> list[currency.AcquiredETH]:
+    acquired_eths = []
+    while len(lot_index) > 0:
+        acquired_eth = lot_index.peek(SPEND)
+        assert lot_index.pop(SPEND) == acquired_eth
+        acquired_eths.append(acquired_eth)
+    return acquired_eths
+
+
+@pytest.mark.parametrize(
+    "method",
+    [
+        tax_optimizer.FirstInFirstOut,
+        tax_optimizer.LastInFirstOut,
+        tax_optimizer.HighestInFirstOut,
+        tax_optimizer.LowestInFirstOut,
+    ],
+)
+def test_priority_lot_index_matches_sort(method):
+    acquired_eths = create_acquired_eths()
+    lot_index = inventory.PriorityLotIndex(method.priority, acquired_eths)
+    assert drain(lot_index) == list(reversed(method.sort(acquired_eths, SPEND)))
+
+
+@pytest.mark.parametrize(
+    "method", [tax_optimizer.LowerTaxBracket, tax_optimizer.HigherTaxBracket]
+)
+def test_selection_lot_index_matches_sort(method):
+    acquired_eths = create_acquired_eths()
+    lot_index = inventory.SelectionLotIndex(method.select, acquired_eths)
+    assert drain(lot_index) == list(reversed(method.sort(acquired_eths, SPEND)))
+
+
+def test_priority_lot_index_ties_last_added_first():
+    acquired_eths = create_acquired_eths()
+    lot_index = inventory.PriorityLotIndex(
+        tax_optimizer.FirstInFirstOut.priority, acquired_eths
+    )
+    assert lot_index.pop(SPEND) is acquired_eths[4]
+    assert lot_index.pop(SPEND) is acquired_eths[2]
+    assert lot_index.pop(SPEND) is acquired_eths[3]
+    assert lot_index.pop(SPEND) is acquired_eths[1]
+
+
+@pytest.mark.parametrize(
+    "lot_index_type",
+    [
+        lambda acquired_eths: inventory.PriorityLotIndex(
+            tax_optimizer.HighestInFirstOut.priority, acquired_eths
+        ),
+        lambda acquired_eths: inventory.SelectionLotIndex(
+            tax_optimizer.HighestInFirstOut.select, acquired_eths
+        ),
+    ],
+)
+def test_lot_index_iterates_in_order_added(lot_index_type):
+    acquired_eths = create_acquired_eths()
+    lot_index = lot_index_type(acquired_eths[:3])
+    for acquired_eth in acquired_eths[3:]:
+        lot_index.add(acquired_eth)
+    assert lot_index.pop(SPEND) is acquired_eths[4]
+    assert list(lot_index) == acquired_eths[:4]
+    assert len(lot_index) == 4
+
+
+@pytest.mark.parametrize(
+    "method", [tax_optimizer.LowerTaxBracket, tax_optimizer.HigherTaxBracket]
+)
+def test_bracket_lot_index_matches_sort(method):
+    acquired_eths = create_acquired_eths()
+    lot_index = method.create_index(acquired_eths[:2])
+    # Not in chronological order
+    for acquired_eth in acquired_eths[2:]:
+        lot_index.add(acquired_eth)
+    assert isinstance(lot_index, inventory.BracketLotIndex)
+    assert list(lot_index) == acquired_eths
+    assert drain(lot_index) == list(reversed(method.sort(acquired_eths, SPEND)))
+
+
+@pytest.mark.parametrize(
+    "method", [tax_optimizer.LowerTaxBracket, tax_optimizer.HigherTaxBracket]
+)
+def test_bracket_lot_index_moves_to_long_term(method):
+    acquired_eths = [
+        currency.AcquiredETH(
+            datetime.datetime(2021, 1, day), 78900000000000, decimal.Decimal(cost)
+        )
+        for day, cost in [(1, "3"), (2, "1"), (3, "2"), (4, "3"), (5, "1")]
+    ]
+    lot_index = method.create_index(acquired_eths)
+    sorted_lot_index = SortedLotIndex(method, acquired_eths)
+    for day in range(1, 6):
+        spend = exchange_transactions.Spend(
+            datetime.datetime(2022, 1, day + 1), 0, decimal.Decimal("2")
+        )
+        assert lot_index.peek(spend) is sorted_lot_index.peek(spend)
+        assert lot_index.pop(spend) is sorted_lot_index.pop(spend)
+        assert list(lot_index) == list(sorted_lot_index)
+    assert len(lot_index) == 0
+
+
+def test_acquired_eth_columns():
+    acquired_eths = create_acquired_eths()
+    columns = inventory.AcquiredETHColumns(acquired_eths)
+    assert len(columns) == len(acquired_eths)
+    assert list(columns) == acquired_eths
+    assert columns[1:3] == acquired_eths[1:3]
+    # Tax optimization methods can sort and select from columns
+    assert tax_optimizer.LowerTaxBracket.sort(
+        columns, SPEND
+    ) == tax_optimizer.LowerTaxBracket.sort(acquired_eths, SPEND)
+    assert list(tax_optimizer.HigherTaxBracket.select(columns, SPEND)) == list(
+        tax_optimizer.HigherTaxBracket.select(acquired_eths, SPEND)
+    )
+    columns.remove(2)
+    with pytest.raises(IndexError):
+        columns[2]  # pylint: disable=pointless-statement
+
+
+@pytest.mark.parametrize(
+    "method",
+    [
+        tax_optimizer.FirstInFirstOut,
+        tax_optimizer.LastInFirstOut,
+        tax_optimizer.HighestInFirstOut,
+        tax_optimizer.LowestInFirstOut,
+    ],
+)
+def test_columnar_lot_index_matches_priority_lot_index(method):
+    acquired_eths = create_acquired_eths()
+    lot_index = method.create_columnar_index(acquired_eths[:2])
+    for acquired_eth in acquired_eths[2:]:
+        lot_index.add(acquired_eth)
+    assert isinstance(lot_index, inventory.ColumnarLotIndex)
+    assert list(lot_index) == acquired_eths
+    priority_lot_index = inventory.PriorityLotIndex(method.priority, acquired_eths)
+    spend = exchange_transactions.Spend(
+        datetime.datetime(2022, 3, 13), 100000000000000, decimal.Decimal("57075")
+    )
+    assert list(lot_index.remove_wei(spend)) == list(
+        priority_lot_index.remove_wei(spend)
+    )
+    assert list(lot_index) == list(priority_lot_index)
+    assert drain(lot_index) == drain(priority_lot_index)
+
+
+@pytest.mark.parametrize(
+    "method, lot_index_type",
+    [
+        (tax_optimizer.FirstInFirstOut, inventory.ColumnarLotIndex),
+        (tax_optimizer.LastInFirstOut, inventory.ColumnarLotIndex),
+        (tax_optimizer.HighestInFirstOut, inventory.ColumnarLotIndex),
+        (tax_optimizer.LowestInFirstOut, inventory.ColumnarLotIndex),
+        (tax_optimizer.LowerTaxBracket, inventory.ColumnarBracketLotIndex),
+        (tax_optimizer.HigherTaxBracket, inventory.ColumnarBracketLotIndex),
+    ],
+)
+def test_columnar_index_for_each_method(method, lot_index_type):
+    assert isinstance(method.create_columnar_index([]), lot_index_type)
+
+
+@pytest.mark.parametrize(
+    "method", [tax_optimizer.LowerTaxBracket, tax_optimizer.HigherTaxBracket]
+)
+def test_columnar_bracket_lot_index_matches_bracket_lot_index(method):
+    acquired_eths = create_acquired_eths()
+    lot_index = method.create_columnar_index(acquired_eths[:2])
+    bracket_lot_index = method.create_index(acquired_eths[:2])
+    for acquired_eth in acquired_eths[2:]:
+        lot_index.add(acquired_eth)
+        bracket_lot_index.add(acquired_eth)
+    assert list(lot_index) == acquired_eths
+    spend = exchange_transactions.Spend(
+        datetime.datetime(2022, 3, 13), 100000000000000, decimal.Decimal("57075")
+    )
+    assert list(lot_index.remove_wei(spend)) == list(
+        bracket_lot_index.remove_wei(spend)
+    )
+    assert list(lot_index) == list(bracket_lot_index)
+    assert drain(lot_index) == drain(bracket_lot_index)
@@ -0,0 +1,133 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import concurrent.futures
+import datetime
+import decimal
+import random
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.currency as currency
+import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
+import carlcsaposs.calculate_eth_taxes.inventory as inventory
+import carlcsaposs.calculate_eth_taxes.persistent_inventory as persistent_inventory
+import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
+
+from . import test_inventory
+
+
+ALL_METHODS = [
+    tax_optimizer.FirstInFirstOut,
+    tax_optimizer.LastInFirstOut,
+    tax_optimizer.HighestInFirstOut,
+    tax_optimizer.LowestInFirstOut,
+    tax_optimizer.LowerTaxBracket,
+    tax_optimizer.HigherTaxBracket,
+]
+
+
+def create_transactions(seed: int) -> list[exchange_transactions.CurrencyExchange]:
+    random_ = random.Random(seed)
+    transactions: list[exchange_transactions.CurrencyExchange] = []
+    time = datetime.datetime(2020, 1, 1)
+    holdings_wei = 0
+    for _ in range(300):
+        time += datetime.timedelta(hours=random_.randrange(1, 100))
+        us_cents_per_eth = decimal.Decimal(random_.randrange(100, 120))
+        if holdings_wei < 10**18 or random_.random() < 0.6:
+            amount_wei = random_.randrange(10**17, 10**18)
+            transactions.append(
+                exchange_transactions.Acquire(time, amount_wei, us_cents_per_eth)
+            )
+            holdings_wei += amount_wei
+        else:
+            amount_wei = random_.randrange(10**16, holdings_wei // 2)
+            transactions.append(
+                exchange_transactions.Spend(time, amount_wei, us_cents_per_eth)
+            )
+            holdings_wei -= amount_wei
+    return transactions
+
+
+def process(
+    lot_index: inventory.LotIndex,
+    transactions: list[exchange_transactions.CurrencyExchange],
+) -> list[list[currency.AcquiredETH]]:
+    removed = []
+    for transaction in transactions:
+        if isinstance(transaction, exchange_transactions.Acquire):
+            lot_index.add(transaction.convert_to_acquired_eth())
+        else:
+            removed.append(list(lot_index.remove_wei(transaction)))
+    return removed
+
+
+@pytest.mark.parametrize("method", ALL_METHODS)
+def test_persistent_lot_index_matches_lot_index(method):
+    transactions = create_transactions(1)
+    lot_index = method.create_persistent_index([])
+    assert isinstance(lot_index, persistent_inventory.PersistentLotIndex)
+    assert process(lot_index, transactions) == process(
+        method.create_index([]), transactions
+    )
+    # Also for any tax optimization method
+    selection_lot_index = persistent_inventory.PersistentSelectionLotIndex(
+        method.select, []
+    )
+    assert process(selection_lot_index, transactions) == process(
+        method.create_index([]), transactions
+    )
+    assert list(lot_index) == list(selection_lot_index)
+
+
+@pytest.mark.parametrize("method", ALL_METHODS)
+def test_persistent_lot_index_built_from_acquired_eths(method):
+    acquired_eths = test_inventory.create_acquired_eths()
+    lot_index = method.create_persistent_index(acquired_eths[:2])
+    for acquired_eth in acquired_eths[2:]:
+        lot_index.add(acquired_eth)
+    assert list(lot_index) == acquired_eths
+    assert test_inventory.drain(lot_index) == list(
+        reversed(method.sort(acquired_eths, test_inventory.SPEND))
+    )
+
+
+@pytest.mark.parametrize("method", ALL_METHODS)
+def test_persistent_lot_index_fork(method):
+    transactions = create_transactions(2)
+    middle = len(transactions) // 2
+    lot_index = method.create_persistent_index([])
+    process(lot_index, transactions[:middle])
+    acquired_eths = list(lot_index)
+    amounts_wei = [acquired_eth.amount_wei for acquired_eth in acquired_eths]
+    forks = [lot_index.fork() for _ in range(2)]
+    # Each fork processes the rest with another tax mode
+    fork_methods = [method, tax_optimizer.LastInFirstOut]
+    forks[1] = tax_optimizer.LastInFirstOut.create_persistent_index(forks[1])
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        results = list(
+            executor.map(process, forks, [transactions[middle:]] * len(forks))
+        )
+    for fork_method, result in zip(fork_methods, results):
+        expected_lot_index = method.create_index([])
+        process(expected_lot_index, transactions[:middle])
+        expected_lot_index = fork_method.create_index(expected_lot_index)
+        assert result == process(expected_lot_index, transactions[middle:])
+    # Not changed by forks
+    assert list(lot_index) == acquired_eths
+    assert [acquired_eth.amount_wei for acquired_eth in acquired_eths] == amounts_wei
@@ -469,3 +469,72 @@ def test_higher_tax_bracket(
         tax_optimizer.HigherTaxBracket.sort(acquired_eths, transaction)
         == sorted_acquired_eths
     )
+
+
+ACQUIRED_ETHS = [
+    currency.AcquiredETH(
+        datetime.datetime(2021, 3, 14), 78900000000000, decimal.Decimal("57076")
+    ),
+    currency.AcquiredETH(
+        datetime.datetime(2021, 3, 12), 78900000000000, decimal.Decimal("1")
+    ),
+    currency.AcquiredETH(
+        datetime.datetime(2021, 3, 13), 78900000000000, decimal.Decimal("657075")
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    ["method", "order"],
+    [
+        (tax_optimizer.FirstInFirstOut, [0, 2, 1]),
+        (tax_optimizer.LastInFirstOut, [1, 2, 0]),
+        (tax_optimizer.HighestInFirstOut, [1, 0, 2]),
+        (tax_optimizer.LowestInFirstOut, [2, 0, 1]),
+    ],
+)
+def test_priority_optimization_method(
+    method: tax_optimizer.PriorityOptimizationMethod, order: list[int]
+):
+    assert method.sort(ACQUIRED_ETHS, None) == [ACQUIRED_ETHS[index] for index in order]
+
+
+@pytest.mark.parametrize(
+    "method",
+    [
+        tax_optimizer.FirstInFirstOut,
+        tax_optimizer.LastInFirstOut,
+        tax_optimizer.HighestInFirstOut,
+        tax_optimizer.LowestInFirstOut,
+        tax_optimizer.LowerTaxBracket,
+        tax_optimizer.HigherTaxBracket,
+    ],
+)
+def test_select_matches_sort(method: tax_optimizer.OptimizationMethod):
+    acquired_eths = [
+        currency.AcquiredETH(
+            datetime.datetime(2021, 3, day), 78900000000000, decimal.Decimal(cost)
+        )
+        for day, cost in [(14, 5), (12, 1), (13, 9), (11, 5), (16, 1), (12, 5)]
+    ]
+    transaction = exchange_transactions.Spend(
+        datetime.datetime(2022, 3, 13), 0, decimal.Decimal("5")
+    )
+    assert list(method.select(acquired_eths, transaction)) == list(
+        reversed(method.sort(acquired_eths, transaction))
+    )
+
+
+def test_select_is_lazy():
+    class SortedOnce(tax_optimizer.OptimizationMethod):
+        calls = 0
+
+        @staticmethod
+        def sort(acquired_eths, _):
+            SortedOnce.calls += 1
+            return list(acquired_eths)
+
+    selection = SortedOnce.select(ACQUIRED_ETHS, None)
+    assert SortedOnce.calls == 0
+    assert next(selection) is ACQUIRED_ETHS[-1]
+    assert SortedOnce.calls == 1
@@ -17,12 +17,17 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # pylint: disable=missing-docstring
 import datetime
 import decimal
+import random
+
+import pytest
 
 import carlcsaposs.calculate_eth_taxes.currency as currency
 import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
 import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
 import carlcsaposs.calculate_eth_taxes.transaction_processor as transaction_processor
 
+from . import test_inventory
+
 
 def test_sort_transactions():
     transactions = [
@@ -159,3 +164,488 @@ def test_convert_transactions_first_in_first_out_multiple_outputs():
             ).to_integral_value(rounding=decimal.ROUND_HALF_UP),
         ),
     ]
+
+
+def create_transactions() -> list[exchange_transactions.CurrencyExchange]:
+    """Transactions with many equal times and prices"""
+    random_ = random.Random(8949)
+    transactions: list[exchange_transactions.CurrencyExchange] = []
+    time = datetime.datetime(2020, 1, 1)
+    while time.year < 2023:
+        time += datetime.timedelta(days=random_.choice([0, 0, 1, 2, 5]))
+        price = decimal.Decimal(random_.randrange(100000, 120000, 2500)) / 8
+        if random_.random() < 0.6:
+            transactions.append(
+                exchange_transactions.Acquire(
+                    time, random_.randrange(1, 200) * 10**16, price
+                )
+            )
+        else:
+            time += datetime.timedelta(hours=1)
+            transactions.append(
+                exchange_transactions.Spend(
+                    time, random_.randrange(1, 100) * 10**16, price
+                )
+            )
+    return transactions
+
+
+def convert_transactions_like_baseline(
+    transactions: list[exchange_transactions.CurrencyExchange],
+    tax_modes_by_year: dict[int, type[tax_optimizer.OptimizationMethod]],
+) -> list[currency.SpentETH]:
+    """Sort one list of 'AcquiredETH' for every spend, like before indexes"""
+    acquired_eths: list[currency.AcquiredETH] = []
+    spent_eths = []
+    for transaction in sorted(transactions, key=lambda transaction: transaction.time):
+        if isinstance(transaction, exchange_transactions.Acquire):
+            acquired_eths.append(transaction.convert_to_acquired_eth())
+            continue
+        assert isinstance(transaction, exchange_transactions.Spend)
+        acquired_eths = tax_modes_by_year[transaction.time.year].sort(
+            acquired_eths, transaction
+        )
+        amount_wei = transaction.amount_wei
+        while amount_wei > 0:
+            if acquired_eths[-1].amount_wei > amount_wei:
+                acquired_eth = acquired_eths[-1].remove_wei(amount_wei)
+            else:
+                acquired_eth = acquired_eths.pop()
+            spent_eths.append(
+                acquired_eth.convert_to_spent_eth(
+                    transaction.time,
+                    transaction.proceeds_us_cents_per_eth_excluding_fees,
+                )
+            )
+            amount_wei -= acquired_eth.amount_wei
+    return spent_eths
+
+
+class SortedFirstInFirstOut(tax_optimizer.FirstInFirstOut):
+    @classmethod
+    def create_index(cls, acquired_eths):
+        return test_inventory.SortedLotIndex(cls, acquired_eths)
+
+
+class SortedLastInFirstOut(tax_optimizer.LastInFirstOut):
+    @classmethod
+    def create_index(cls, acquired_eths):
+        return test_inventory.SortedLotIndex(cls, acquired_eths)
+
+
+class SortedHighestInFirstOut(tax_optimizer.HighestInFirstOut):
+    @classmethod
+    def create_index(cls, acquired_eths):
+        return test_inventory.SortedLotIndex(cls, acquired_eths)
+
+
+class SortedLowerTaxBracket(tax_optimizer.LowerTaxBracket):
+    @classmethod
+    def create_index(cls, acquired_eths):
+        return test_inventory.SortedLotIndex(cls, acquired_eths)
+
+
+class SortedHigherTaxBracket(tax_optimizer.HigherTaxBracket):
+    @classmethod
+    def create_index(cls, acquired_eths):
+        return test_inventory.SortedLotIndex(cls, acquired_eths)
+
+
+@pytest.mark.parametrize(
+    ["tax_modes_by_year", "sorted_tax_modes_by_year"],
+    [
+        (
+            {year: tax_optimizer.FirstInFirstOut for year in [2020, 2021, 2022]},
+            {year: SortedFirstInFirstOut for year in [2020, 2021, 2022]},
+        ),
+        (
+            {
+                2020: tax_optimizer.LastInFirstOut,
+                2021: tax_optimizer.HighestInFirstOut,
+                2022: tax_optimizer.FirstInFirstOut,
+            },
+            {
+                2020: SortedLastInFirstOut,
+                2021: SortedHighestInFirstOut,
+                2022: SortedFirstInFirstOut,
+            },
+        ),
+        (
+            {
+                2020: tax_optimizer.HighestInFirstOut,
+                2021: tax_optimizer.LowerTaxBracket,
+                2022: tax_optimizer.LastInFirstOut,
+            },
+            {
+                2020: SortedHighestInFirstOut,
+                2021: SortedLowerTaxBracket,
+                2022: SortedLastInFirstOut,
+            },
+        ),
+        (
+            {year: tax_optimizer.LowerTaxBracket for year in [2020, 2021, 2022]},
+            {year: SortedLowerTaxBracket for year in [2020, 2021, 2022]},
+        ),
+        (
+            {year: tax_optimizer.HigherTaxBracket for year in [2020, 2021, 2022]},
+            {year: SortedHigherTaxBracket for year in [2020, 2021, 2022]},
+        ),
+        (
+            {
+                2020: tax_optimizer.HigherTaxBracket,
+                2021: tax_optimizer.FirstInFirstOut,
+                2022: tax_optimizer.LowerTaxBracket,
+            },
+            {
+                2020: SortedHigherTaxBracket,
+                2021: SortedFirstInFirstOut,
+                2022: SortedLowerTaxBracket,
+            },
+        ),
+    ],
+)
+def test_convert_transactions_index_matches_sort(
+    tax_modes_by_year, sorted_tax_modes_by_year
+):
+    assert (
+        len(
+            transaction_processor.convert_transactions_to_spent_eth(
+                create_transactions(), tax_modes_by_year
+            )
+        )
+        > len(create_transactions()) / 2
+    )
+    assert transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), tax_modes_by_year
+    ) == transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), sorted_tax_modes_by_year
+    )
+
+
+@pytest.mark.parametrize(
+    "method",
+    [
+        tax_optimizer.FirstInFirstOut,
+        tax_optimizer.HighestInFirstOut,
+        tax_optimizer.LowerTaxBracket,
+    ],
+)
+def test_convert_transactions_exact_arithmetic(method):
+    tax_modes_by_year = {year: method for year in [2020, 2021, 2022]}
+    assert transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), tax_modes_by_year, exact_arithmetic=True
+    ) == transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), tax_modes_by_year
+    )
+
+
+@pytest.mark.parametrize(
+    "tax_modes_by_year",
+    [
+        {year: tax_optimizer.FirstInFirstOut for year in [2020, 2021, 2022]},
+        {
+            2020: tax_optimizer.LowestInFirstOut,
+            2021: tax_optimizer.HigherTaxBracket,
+            2022: tax_optimizer.LastInFirstOut,
+        },
+    ],
+)
+def test_convert_transactions_columnar(tax_modes_by_year):
+    assert transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), tax_modes_by_year, columnar=True
+    ) == transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), tax_modes_by_year
+    )
+
+
+@pytest.mark.parametrize(
+    "tax_modes_by_year",
+    [
+        {year: tax_optimizer.FirstInFirstOut for year in [2020, 2021, 2022]},
+        {
+            2020: tax_optimizer.LastInFirstOut,
+            2021: tax_optimizer.LowerTaxBracket,
+            2022: tax_optimizer.HighestInFirstOut,
+        },
+    ],
+)
+def test_convert_transaction_streams(tax_modes_by_year):
+    random_ = random.Random(3)
+    streams: list[list[exchange_transactions.CurrencyExchange]] = [[], [], []]
+    transactions = create_transactions()
+    # Spending ETH acquired at the same time is invalid; keep acquisitions
+    # at the time of a spend after it
+    streams_by_spend_time = {
+        transaction.time: random_.choice(streams)
+        for transaction in transactions
+        if isinstance(transaction, exchange_transactions.Spend)
+    }
+    for transaction in transactions:
+        stream = streams_by_spend_time.get(transaction.time)
+        if stream is None:
+            stream = random_.choice(streams)
+        stream.append(transaction)
+    assert transaction_processor.convert_transaction_streams_to_spent_eth(
+        streams, tax_modes_by_year
+    ) == transaction_processor.convert_transactions_to_spent_eth(
+        [transaction for stream in streams for transaction in stream],
+        tax_modes_by_year,
+    )
+
+
+def test_iterate_spent_eths():
+    tax_modes_by_year = {
+        2020: tax_optimizer.HighestInFirstOut,
+        2021: tax_optimizer.LowerTaxBracket,
+        2022: tax_optimizer.FirstInFirstOut,
+    }
+    consumed = []
+
+    def iterate_transactions():
+        for transaction in create_transactions():
+            consumed.append(transaction)
+            yield transaction
+
+    spent_eths = transaction_processor.iterate_spent_eths(
+        iterate_transactions(), tax_modes_by_year, in_chronological_order=True
+    )
+    first_spent_eth = next(spent_eths)
+    # Only transactions up to first spend are consumed
+    assert isinstance(consumed[-1], exchange_transactions.Spend)
+    assert (
+        sum(
+            isinstance(transaction, exchange_transactions.Spend)
+            for transaction in consumed
+        )
+        == 1
+    )
+    assert [
+        first_spent_eth,
+        *spent_eths,
+    ] == transaction_processor.convert_transactions_to_spent_eth(
+        create_transactions(), tax_modes_by_year
+    )
+
+
+def test_iterate_spent_eth_batches_by_scenario():
+    transactions = create_transactions()
+    transactions.sort(key=lambda transaction: transaction.time)
+    tax_modes = [
+        tax_optimizer.FirstInFirstOut,
+        tax_optimizer.HighestInFirstOut,
+        tax_optimizer.LowerTaxBracket,
+        tax_optimizer.HigherTaxBracket,
+    ]
+    scenarios = [
+        {2020: tax_optimizer.LastInFirstOut, 2021: tax_mode_2021, 2022: tax_mode_2022}
+        for tax_mode_2021 in tax_modes
+        for tax_mode_2022 in tax_modes
+    ]
+    spent_eths_by_scenario: list[list[currency.SpentETH]] = [[] for _ in scenarios]
+    for positions, batch in transaction_processor.iterate_spent_eth_batches_by_scenario(
+        transactions, scenarios
+    ):
+        for position in positions:
+            spent_eths_by_scenario[position] += batch
+    for tax_modes_by_year, spent_eths in zip(scenarios, spent_eths_by_scenario):
+        assert spent_eths == transaction_processor.convert_transactions_to_spent_eth(
+            create_transactions(), tax_modes_by_year
+        )
+
+
+@pytest.mark.parametrize(
+    "tax_modes_by_year",
+    [
+        {year: tax_optimizer.LowestInFirstOut for year in [2020, 2021, 2022]},
+        # Switch back to previous tax mode
+        {
+            2020: tax_optimizer.HighestInFirstOut,
+            2021: tax_optimizer.LastInFirstOut,
+            2022: tax_optimizer.HighestInFirstOut,
+        },
+        {
+            2020: tax_optimizer.LowestInFirstOut,
+            2021: tax_optimizer.FirstInFirstOut,
+            2022: tax_optimizer.LowestInFirstOut,
+        },
+    ],
+)
+def test_tax_mode_switches_match_baseline(tax_modes_by_year):
+    # Many 'AcquiredETH' have equal times or prices; ties are spent in
+    # the same order as the list sorted for every spend
+    expected = convert_transactions_like_baseline(
+        create_transactions(), tax_modes_by_year
+    )
+    for columnar in [False, True]:
+        assert (
+            transaction_processor.convert_transactions_to_spent_eth(
+                create_transactions(), tax_modes_by_year, columnar=columnar
+            )
+            == expected
+        )
+    spent_eths: list[currency.SpentETH] = []
+    for _, batch in transaction_processor.iterate_spent_eth_batches_by_scenario(
+        sorted(create_transactions(), key=lambda transaction: transaction.time),
+        [tax_modes_by_year],
+    ):
+        spent_eths += batch
+    assert spent_eths == expected
+
+
+def create_fills() -> list[exchange_transactions.CurrencyExchange]:
+    """Acquisitions split into fills with equal times and prices"""
+    random_ = random.Random(6781)
+    transactions: list[exchange_transactions.CurrencyExchange] = []
+    time = datetime.datetime(2020, 1, 1)
+    held_wei = 0
+    while time < datetime.datetime(2022, 12, 29):
+        time += datetime.timedelta(hours=random_.randrange(1, 48))
+        price = decimal.Decimal(random_.randrange(100000, 120000))
+        if random_.random() < 0.6:
+            for _ in range(random_.choice([1, 1, 2, 3])):
+                amount_wei = random_.randrange(1, 200) * 10**16
+                transactions.append(
+                    exchange_transactions.Acquire(time, amount_wei, price)
+                )
+                held_wei += amount_wei
+        elif held_wei > 10**16:
+            amount_wei = random_.randrange(1, min(100, held_wei // 10**16) + 1)
+            transactions.append(
+                exchange_transactions.Spend(time, amount_wei * 10**16, price)
+            )
+            held_wei -= amount_wei * 10**16
+    return transactions
+
+
+@pytest.mark.parametrize(
+    "tax_modes_by_year",
+    [
+        {year: tax_optimizer.LowerTaxBracket for year in [2020, 2021, 2022]},
+        {
+            2020: tax_optimizer.HigherTaxBracket,
+            2021: tax_optimizer.HighestInFirstOut,
+            2022: tax_optimizer.LowerTaxBracket,
+        },
+    ],
+)
+def test_ties_of_equal_acquired_eths_match_baseline(tax_modes_by_year):
+    # Fills of one order have equal times and prices; their order does
+    # not depend on earlier spends
+    assert transaction_processor.convert_transactions_to_spent_eth(
+        create_fills(), tax_modes_by_year
+    ) == convert_transactions_like_baseline(create_fills(), tax_modes_by_year)
+
+
+def create_ties() -> list[exchange_transactions.CurrencyExchange]:
+    """Acquisitions with equal times and different prices, and few prices"""
+    random_ = random.Random(2417)
+    transactions: list[exchange_transactions.CurrencyExchange] = []
+    time = datetime.datetime(2020, 1, 1)
+    held_wei = 0
+    while time < datetime.datetime(2022, 12, 1):
+        time += datetime.timedelta(days=random_.choice([0, 1, 3, 20]))
+        if random_.random() < 0.6 or held_wei < 10**17:
+            for _ in range(random_.choice([1, 2, 3])):
+                amount_wei = random_.randrange(1, 100) * 10**16
+                price = decimal.Decimal(random_.choice([100, 200, 300]))
+                transactions.append(
+                    exchange_transactions.Acquire(time, amount_wei, price)
+                )
+                held_wei += amount_wei
+        else:
+            amount_wei = max(random_.randrange(held_wei // 2), 10**16)
+            price = decimal.Decimal(random_.choice([50, 150, 200, 250, 350]))
+            transactions.append(
+                exchange_transactions.Spend(
+                    time + datetime.timedelta(hours=1), amount_wei, price
+                )
+            )
+            held_wei -= amount_wei
+    return transactions
+
+
+@pytest.mark.parametrize(
+    "tax_modes_by_year",
+    [
+        {year: tax_optimizer.LowerTaxBracket for year in [2020, 2021, 2022]},
+        {year: tax_optimizer.HigherTaxBracket for year in [2020, 2021, 2022]},
+        {
+            2020: tax_optimizer.HigherTaxBracket,
+            2021: tax_optimizer.LowerTaxBracket,
+            2022: tax_optimizer.HigherTaxBracket,
+        },
+        {
+            2020: tax_optimizer.LowerTaxBracket,
+            2021: tax_optimizer.FirstInFirstOut,
+            2022: tax_optimizer.HigherTaxBracket,
+        },
+        {
+            2020: tax_optimizer.HighestInFirstOut,
+            2021: tax_optimizer.HigherTaxBracket,
+            2022: tax_optimizer.LowestInFirstOut,
+        },
+    ],
+)
+def test_bracket_ties_match_baseline(tax_modes_by_year):
+    # Order of ties depends on earlier spends: equal times with different
+    # costs, and equal costs with different times
+    for columnar in [False, True]:
+        assert transaction_processor.convert_transactions_to_spent_eth(
+            create_ties(), tax_modes_by_year, columnar=columnar
+        ) == convert_transactions_like_baseline(create_ties(), tax_modes_by_year)
+
+
+def test_bracket_ties_by_scenario_match_convert_transactions():
+    # Forks of persistent indexes keep order of ties for last spend
+    transactions = create_ties()
+    transactions.sort(key=lambda transaction: transaction.time)
+    tax_modes = [
+        tax_optimizer.LowestInFirstOut,
+        tax_optimizer.LowerTaxBracket,
+        tax_optimizer.HigherTaxBracket,
+    ]
+    scenarios = [
+        {2020: tax_optimizer.LowerTaxBracket, 2021: tax_mode_2021, 2022: tax_mode_2022}
+        for tax_mode_2021 in tax_modes
+        for tax_mode_2022 in tax_modes
+    ]
+    spent_eths_by_scenario: list[list[currency.SpentETH]] = [[] for _ in scenarios]
+    for positions, batch in transaction_processor.iterate_spent_eth_batches_by_scenario(
+        transactions, scenarios
+    ):
+        for position in positions:
+            spent_eths_by_scenario[position] += batch
+    for tax_modes_by_year, spent_eths in zip(scenarios, spent_eths_by_scenario):
+        assert spent_eths == transaction_processor.convert_transactions_to_spent_eth(
+            create_ties(), tax_modes_by_year
+        )
+        assert spent_eths == convert_transactions_like_baseline(
+            create_ties(), tax_modes_by_year
+        )
+
+
+def test_bracket_ties_in_order_of_last_spend():
+    time_acquired = datetime.datetime(2020, 1, 1)
+    transactions: list[exchange_transactions.CurrencyExchange] = [
+        exchange_transactions.Acquire(time_acquired, 10**18, decimal.Decimal(30000)),
+        exchange_transactions.Acquire(time_acquired, 10**18, decimal.Decimal(10000)),
+        # Spends part of $300 'AcquiredETH', the only short-term non-gain
+        exchange_transactions.Spend(
+            datetime.datetime(2020, 2, 1), 10**17, decimal.Decimal(20000)
+        ),
+        # Both are short-term non-gains with equal times; $300 'AcquiredETH'
+        # was more tax optimal for the last spend
+        exchange_transactions.Spend(
+            datetime.datetime(2020, 3, 1), 5 * 10**17, decimal.Decimal(5000)
+        ),
+    ]
+    tax_modes_by_year = {2020: tax_optimizer.LowerTaxBracket}
+    assert [
+        spent_eth.cost_usd_including_fees
+        for spent_eth in transaction_processor.convert_transactions_to_spent_eth(
+            list(transactions), tax_modes_by_year
+        )
+    ] == [30, 150]
+    assert transaction_processor.convert_transactions_to_spent_eth(
+        list(transactions), tax_modes_by_year
+    ) == convert_transactions_like_baseline(list(transactions), tax_modes_by_year)
@@ -17,6 +17,8 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 # pylint: disable=missing-docstring
 import datetime
 import decimal
+import pathlib
+import random
 import pytest
 
 import carlcsaposs.calculate_eth_taxes.utils as utils
@@ -38,6 +40,13 @@ def test_number_domain_validate_number():
     assert utils.NumberDomain.NON_NEGATIVE.validate_number("key", 0) is None
 
 
+def test_number_domain_includes_numbers():
+    assert not utils.NumberDomain.POSITIVE.includes_numbers([3, 0, 1, -1])
+    assert utils.NumberDomain.POSITIVE.includes_numbers([3, 1])
+    assert utils.NumberDomain.POSITIVE.includes_numbers([])
+    assert utils.NumberDomain.NON_NEGATIVE.includes_numbers([3, 0])
+
+
 @pytest.mark.parametrize(
     ["time_acquired", "time_spent", "result"],
     [
@@ -87,3 +96,116 @@ def test_round_decimal_to_int():
         )
         == 2
     )
+
+
+@pytest.mark.parametrize(
+    ["numerator", "denominator", "result"],
+    [(5, 2, 3), (7, 3, 2), (-5, 2, -3), (-7, 3, -2), (0, 9, 0), (249, 100, 2)],
+)
+def test_round_fraction_to_int(numerator: int, denominator: int, result: int):
+    assert utils.round_fraction_to_int(numerator, denominator) == result
+    assert result == utils.round_decimal_to_int(
+        decimal.Decimal(numerator) / decimal.Decimal(denominator)
+    )
+
+
+def test_round_fraction_to_int_invalid():
+    with pytest.raises(ValueError):
+        utils.round_fraction_to_int(3, 0)
+
+
+def test_convert_us_cents_per_eth_to_usd_per_wei():
+    assert utils.convert_us_cents_per_eth_to_usd_per_wei(
+        decimal.Decimal("2570.75")
+    ) == (10283, 4 * 100 * 10**18)
+
+
+@pytest.mark.parametrize(
+    ["time_acquired", "long_term_date"],
+    [
+        (datetime.datetime(1967, 2, 28, 23, 59, 59), datetime.date(1968, 2, 29)),
+        (datetime.date(2004, 2, 29), datetime.date(2005, 3, 1)),
+        (datetime.date(2004, 12, 31), datetime.date(2006, 1, 1)),
+    ],
+)
+def test_calculate_long_term_ordinal(time_acquired, long_term_date: datetime.date):
+    assert (
+        utils.calculate_long_term_ordinal(time_acquired) == long_term_date.toordinal()
+    )
+
+
+@pytest.mark.parametrize(
+    "amount_wei",
+    [1, 10**11, 10**12 - 1, 10**12, 400000000000000, 34 * 10**18, 10**28 - 1],
+)
+def test_convert_wei_to_eth_string(amount_wei: int):
+    assert utils.convert_wei_to_eth_string(amount_wei) == str(
+        utils.round_decimal(amount_wei / decimal.Decimal(10**18), 18)
+    )
+
+
+def convert_eth_string_to_wei_with_decimal(amount_eth: str) -> int:
+    return utils.round_decimal_to_int(decimal.Decimal(amount_eth) * 10**18)
+
+
+@pytest.mark.parametrize(
+    "amount_eth",
+    [
+        "0",
+        "-0",
+        "1",
+        "1.",
+        ".5",
+        "+2.25",
+        "0.000000000000000001",
+        "0.0000000000000000005",
+        "0.0000000000000000004999",
+        "-0.0000000000000000005",
+        "1234567890.1234567890123456785",
+        "1E-3",
+        " 1.5 ",
+        "1_000.5",
+    ],
+)
+def test_convert_eth_string_to_wei(amount_eth: str):
+    assert utils.convert_eth_string_to_wei(
+        amount_eth
+    ) == convert_eth_string_to_wei_with_decimal(amount_eth)
+
+
+@pytest.mark.parametrize("amount_eth", ["", ".", "-", "1.2.3", "ETH"])
+def test_convert_eth_string_to_wei_invalid(amount_eth: str):
+    with pytest.raises(decimal.InvalidOperation):
+        utils.convert_eth_string_to_wei(amount_eth)
+
+
+def test_convert_eth_string_to_wei_random():
+    random_ = random.Random(18)
+    for _ in range(10000):
+        integer = "".join(random_.choices("0123456789", k=random_.randrange(11)))
+        fraction = "".join(random_.choices("0509", k=random_.randrange(24)))
+        amount_eth = random_.choice(["", "-", "+"]) + integer
+        if fraction or random_.random() < 0.5 or not integer:
+            amount_eth += "." + fraction
+        if amount_eth.strip("+-.") == "":
+            continue
+        assert utils.convert_eth_string_to_wei(
+            amount_eth
+        ) == convert_eth_string_to_wei_with_decimal(amount_eth), amount_eth
+
+
+def test_convert_usd_per_eth_string_to_us_cents_per_eth():
+    us_cents_per_eth = utils.convert_usd_per_eth_string_to_us_cents_per_eth("1040.5")
+    assert us_cents_per_eth == decimal.Decimal("104050")
+    assert (
+        utils.convert_usd_per_eth_string_to_us_cents_per_eth("1040.5")
+        is us_cents_per_eth
+    )
+
+
+def test_split_csv_file_without_rows(tmp_path: pathlib.Path):
+    file_path = tmp_path / "export.csv"
+    file_path.write_text("a,b\n", encoding="utf-8")
+    assert utils.split_csv_file(str(file_path), 1) == (["a", "b"], [4])
+    file_path.write_text("a,b\nc,d\ne,f", encoding="utf-8")
+    assert utils.split_csv_file(str(file_path), 1) == (["a", "b"], [4, 8, 11])
@@ -0,0 +1,115 @@
+"""
+Copyright (C) 2022 Carl Csaposs
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# pylint: disable=missing-docstring
+import datetime
+import decimal
+import random
+
+import pytest
+
+import carlcsaposs.calculate_eth_taxes.exchange_transactions as exchange_transactions
+import carlcsaposs.calculate_eth_taxes.file_writer as file_writer
+import carlcsaposs.calculate_eth_taxes.tax_optimizer as tax_optimizer
+import carlcsaposs.calculate_eth_taxes.transaction_processor as transaction_processor
+import carlcsaposs.calculate_eth_taxes.what_if as what_if
+
+TAX_MODES = ["FirstInFirstOut", "LowerTaxBracket", "HigherTaxBracket"]
+
+
+def create_transactions(seed: int) -> list[exchange_transactions.CurrencyExchange]:
+    random_ = random.Random(seed)
+    transactions: list[exchange_transactions.CurrencyExchange] = []
+    time = datetime.datetime(2020, 1, 1)
+    holdings_wei = 0
+    for _ in range(200):
+        time += datetime.timedelta(hours=random_.randrange(1, 200))
+        us_cents_per_eth = decimal.Decimal(random_.randrange(100000, 400000))
+        if holdings_wei < 10**18 or random_.random() < 0.5:
+            amount_wei = random_.randrange(10**17, 10**18)
+            transactions.append(
+                exchange_transactions.Acquire(time, amount_wei, us_cents_per_eth)
+            )
+            holdings_wei += amount_wei
+        else:
+            amount_wei = random_.randrange(10**16, holdings_wei // 2)
+            transactions.append(
+                exchange_transactions.Spend(time, amount_wei, us_cents_per_eth)
+            )
+            holdings_wei -= amount_wei
+    # Unsorted
+    random_.shuffle(transactions)
+    return transactions
+
+
+def test_enumerate_scenarios(monkeypatch: pytest.MonkeyPatch):
+    scenarios = what_if.enumerate_scenarios(
+        {2020: "FirstInFirstOut", 2021: "FirstInFirstOut"},
+        [2022, 2021],
+        ["LowerTaxBracket", "HigherTaxBracket"],
+    )
+    assert scenarios == [
+        {2020: "FirstInFirstOut", 2021: "LowerTaxBracket", 2022: "LowerTaxBracket"},
+        {2020: "FirstInFirstOut", 2021: "LowerTaxBracket", 2022: "HigherTaxBracket"},
+        {2020: "FirstInFirstOut", 2021: "HigherTaxBracket", 2022: "LowerTaxBracket"},
+        {2020: "FirstInFirstOut", 2021: "HigherTaxBracket", 2022: "HigherTaxBracket"},
+    ]
+    monkeypatch.setattr(what_if, "MAX_SCENARIOS", 8)
+    with pytest.raises(ValueError) as exception_info:
+        what_if.enumerate_scenarios({}, [2020, 2021], TAX_MODES)
+    assert str(exception_info.value) == (
+        "expected at most 8 scenarios, got 9 (3 tax modes for 2 years) instead"
+    )
+
+
+def test_evaluate_scenarios():
+    transactions = create_transactions(5)
+    years = what_if.get_spend_years(transactions)
+    assert len(years) > 1
+    scenarios = what_if.enumerate_scenarios({}, years, TAX_MODES)
+    results = what_if.evaluate_scenarios(transactions, scenarios)
+    assert [result.tax_modes_by_year for result in results] == scenarios
+    for result in results:
+        summary = file_writer.Summary()
+        summary.add_rows(
+            spent_eth.convert_to_form_8949_row()
+            for spent_eth in transaction_processor.convert_transactions_to_spent_eth(
+                list(transactions),
+                {
+                    year: getattr(tax_optimizer, tax_mode)
+                    for year, tax_mode in result.tax_modes_by_year.items()
+                },
+            )
+        )
+        assert result.totals == summary.totals
+    # Tax modes make a difference
+    assert len({result.gain_usd for result in results}) > 1
+    assert what_if.evaluate_scenarios(transactions, scenarios, max_workers=2) == results
+
+
+@pytest.mark.parametrize("rank_by", ["short-term", "total"])
+def test_rank_results(rank_by: str):
+    transactions = create_transactions(7)
+    results = what_if.evaluate_scenarios(
+        transactions,
+        what_if.enumerate_scenarios(
+            {}, what_if.get_spend_years(transactions), TAX_MODES
+        ),
+    )
+    ranked_results = what_if.rank_results(results, rank_by)
+    assert sorted(map(id, ranked_results)) == sorted(map(id, results))
+    keys = [what_if.RANK_KEYS[rank_by](result) for result in ranked_results]
+    assert keys == sorted(keys)